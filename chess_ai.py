@@ -0,0 +1,463 @@
+"""
+Computer player built on top of GameState
+negamax alpha-beta search with iterative deepening, a transposition table and move ordering
+positions are scored by chess_eval, endgames with few enough pieces are looked up in chess_tablebase tables
+"""
+import threading
+import time
+from array import array
+
+import chess_eval
+import chess_tablebase
+from chess_bitboard import popcount
+from chess_engine import FIFTY_MOVE_PLIES
+
+pieceValues = {'K': 0, 'Q': 900, 'R': 500, 'B': 330, 'N': 320, 'P': 100}
+CHECKMATE = 100000
+STALEMATE = 0
+DRAW = 0  # repetitions and the fifty-move rule inside the search
+MAX_PLY = 64
+INFINITY = CHECKMATE + 1
+# scores beyond this are mates, they are stored in the transposition table relative to the node
+MATE_BOUND = CHECKMATE - MAX_PLY
+# nodes between looks at the clock, reading it costs far less than searching a node so a movetime is overrun by
+# a few milliseconds at most
+CHECK_INTERVAL = 32
+
+
+class SearchStopped(Exception):
+    pass
+
+
+"""
+Limits for a search, any combination of a depth, a node count and a time in seconds
+the search stops as soon as any of the limits is reached
+a ponder search thinks on the opponent's time and ignores movetime until Searcher.ponderhit is called
+"""
+
+
+class SearchLimit:
+    def __init__(self, depth=None, nodes=None, movetime=None, ponder=False):
+        self.depth = depth
+        self.nodes = nodes
+        self.movetime = movetime
+        self.ponder = ponder
+
+
+class SearchResult:
+    def __init__(self):
+        self.bestMove = None
+        self.pv = []  # principal variation, the line of best play the search expects
+        self.score = 0  # centipawns from the view of the player to move
+        self.depth = 0  # last fully searched depth
+        self.nodes = 0
+        self.time = 0.0
+        self.nps = 0  # nodes per second
+
+
+"""
+Fixed size hash table of search results keyed by the zobrist key of the position
+entries are packed into two arrays of 64 bit ints so the memory used is fixed up front
+"""
+
+
+class TranspositionTable:
+    EXACT = 0
+    LOWER = 1  # the score is a lower bound (the search failed high)
+    UPPER = 2  # the score is an upper bound (the search failed low)
+
+    def __init__(self, sizeMb=16):
+        # each entry is a key and a packed data word (8 bytes each), rounded down to a power of two
+        entries = 1
+        while entries * 2 * 16 <= sizeMb * 1024 * 1024:
+            entries *= 2
+        self.mask = entries - 1
+        self.keys = array('Q', [0]) * entries
+        self.data = array('Q', [0]) * entries
+        self.age = 0
+
+    """
+    Starts a new search, entries from older searches are replaced first
+    """
+
+    def new_search(self):
+        self.age = (self.age + 1) & 255
+
+    def clear(self):
+        # slice assignment writes in place, so it also clears tables whose arrays are views of shared memory
+        empty = array('Q', [0]) * len(self.keys)
+        self.keys[:] = empty
+        self.data[:] = empty
+        self.age = 0
+
+    """
+    Returns (packed move, score, depth, flag) for the position or None if it is not stored
+    """
+
+    def probe(self, key):
+        index = key & self.mask
+        if self.keys[index] != key:
+            return None
+        data = self.data[index]
+        return data & 0xFFFF, (data >> 16 & 0xFFFFF) - 0x80000, data >> 36 & 0x7F, data >> 43 & 3
+
+    """
+    Stores a search result, an entry for another position is only replaced if it is from an older search
+    or was searched less deeply
+    """
+
+    def store(self, key, move, score, depth, flag):
+        index = key & self.mask
+        oldKey = self.keys[index]
+        if oldKey and oldKey != key:
+            oldData = self.data[index]
+            if oldData >> 45 == self.age and oldData >> 36 & 0x7F > depth:
+                return
+        elif oldKey == key and move == 0:
+            move = self.data[index] & 0xFFFF  # keep the best move of an earlier search of this position
+        self.keys[index] = key
+        self.data[index] = move | (score + 0x80000) << 16 | min(depth, 0x7F) << 36 | flag << 43 | self.age << 45
+
+
+class Searcher:
+    def __init__(self, ttSizeMb=16, tablebases=None):
+        self.tt = TranspositionTable(ttSizeMb)
+        self.tablebases = tablebases  # a chess_tablebase.Tablebases or None
+        self.pawnTable = chess_eval.PawnTable()
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]  # two quiet moves per ply that caused a cutoff
+        self.history = [0] * 4096  # cutoff counts for quiet moves indexed by start square * 64 + end square
+        self.moveBuffers = [[] for _ in range(MAX_PLY)]  # move lists reused at every ply
+        self.pvTable = [[None] * MAX_PLY for _ in range(MAX_PLY)]
+        self.pvLength = [0] * MAX_PLY
+        self.nodes = 0
+        self.stopped = False
+        self.stopCount = 0  # calls to stop so far, the token a search is started with
+        self.deadline = None
+        self.nodeLimit = None
+        self.nextCheck = 0
+        # a ponder search has no deadline until ponderhit
+        self.pondering = False
+        self.moveTime = None
+        self.startTime = 0.0
+        self.ponderLock = threading.Lock()
+
+    """
+    Asks a running search to stop, safe to call from another thread
+    a search that was asked for before this call but has not started yet stops too if it is given the stopCount
+    from when it was asked for
+    """
+
+    def stop(self):
+        self.stopCount += 1
+        self.stopped = True
+
+    """
+    Tells a running ponder search that the opponent played the expected move, it goes on as a normal search
+    the time spent pondering counts towards the movetime of its limit, so after a long ponder the search stops with
+    the depths it already finished; safe to call from another thread
+    to also cover a search that has not started yet, set the ponder flag of its limit to False before calling this
+    """
+
+    def ponderhit(self):
+        with self.ponderLock:
+            if not self.pondering:
+                return
+            self.pondering = False
+            self.deadline = self.startTime + self.moveTime if self.moveTime is not None else None
+
+    """
+    Forgets everything learned in earlier searches: the transposition table, killer moves and history
+    the searcher keeps them from one move to the next otherwise, also across undone moves
+    """
+
+    def clear(self):
+        self.tt.clear()
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        self.history = [0] * 4096
+
+    """
+    Searches the position with iterative deepening until the limit is reached
+    the game state is left exactly as it was passed in, startDepth lets a helper of a parallel search skip ahead
+    info is called with the SearchResult so far after every finished depth (e.g. to print UCI info lines)
+    stopCount is the searcher's stopCount when the search was asked for, a stop since then makes it return at once;
+    without it stops from before the search are forgotten
+    """
+
+    def search(self, gs, limit, startDepth=1, info=None, stopCount=None):
+        startTime = time.time()
+        self.nodes = 0
+        self.stopped = False
+        if stopCount is not None and stopCount != self.stopCount:  # cleared first so a stop right now is not lost
+            self.stopped = True
+        with self.ponderLock:
+            self.pondering = limit.ponder
+            self.moveTime = limit.movetime
+            self.startTime = startTime
+            self.deadline = startTime + limit.movetime if limit.movetime is not None and not limit.ponder else None
+        self.nodeLimit = limit.nodes
+        self.nextCheck = 0
+        self.tt.new_search()
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        rootLength = len(gs.moveLog)
+        checkMate, staleMate = gs.checkMate, gs.staleMate
+        result = SearchResult()
+        probed = self.tablebases.best_move(gs) if self.tablebases is not None else None
+        if probed is not None and probed[0] is not None:  # the tables already know the best move, no need to search
+            move, tbResult, plies = probed
+            result.bestMove = move
+            result.pv = [move]
+            result.score = tablebase_score(tbResult, plies, 0)
+            result.depth = 0
+            rootMoves = []
+        else:
+            rootMoves = gs.get_valid_moves()
+        if len(rootMoves) > 0:
+            result.bestMove = rootMoves[0]
+            maxDepth = min(limit.depth, MAX_PLY - 1) if limit.depth is not None else MAX_PLY - 1
+            try:
+                for depth in range(min(startDepth, maxDepth), maxDepth + 1):
+                    score = self.negamax(gs, depth, -INFINITY, INFINITY, 0)
+                    pv = self.pvTable[0][:self.pvLength[0]]
+                    # the root move is looked up in the root move list so it can be played on gs directly
+                    for move in rootMoves:
+                        if len(pv) > 0 and move == pv[0]:
+                            result.bestMove = move
+                            pv[0] = move
+                    result.pv = pv
+                    result.score = score
+                    result.depth = depth
+                    if info is not None:
+                        result.nodes = self.nodes
+                        result.time = time.time() - startTime
+                        result.nps = int(self.nodes / result.time) if result.time > 0 else 0
+                        info(result)
+                    if abs(score) > MATE_BOUND:  # a forced mate was found, deeper searches can not improve it
+                        break
+                    # the next iteration takes several times longer so do not start one that can not finish
+                    deadline = self.deadline  # read once, a ponderhit can set it at any time
+                    if deadline is not None and time.time() - startTime > (deadline - startTime) / 2:
+                        break
+            except SearchStopped:
+                while len(gs.moveLog) > rootLength:
+                    gs.undo_move()
+        with self.ponderLock:
+            self.pondering = False
+        gs.checkMate, gs.staleMate = checkMate, staleMate
+        result.nodes = self.nodes
+        result.time = time.time() - startTime
+        result.nps = int(self.nodes / result.time) if result.time > 0 else 0
+        return result
+
+    def check_limits(self):
+        # limits are checked every CHECK_INTERVAL nodes, or exactly at the node limit
+        self.nextCheck = self.nodes + CHECK_INTERVAL
+        if self.nodeLimit is not None:
+            self.nextCheck = min(self.nextCheck, self.nodeLimit)
+        if self.stopped or (self.deadline is not None and time.time() >= self.deadline) or \
+                (self.nodeLimit is not None and self.nodes >= self.nodeLimit):
+            self.stopped = True
+            raise SearchStopped()
+
+    def negamax(self, gs, depth, alpha, beta, ply):
+        self.pvLength[ply] = ply
+        self.nodes += 1
+        if self.nodes >= self.nextCheck or self.stopped:
+            self.check_limits()
+        # a position that was on the board before is scored a draw, either side can repeat it again to claim one;
+        # a mate on the last move before the fifty-move rule still counts
+        if ply > 0 and (gs.repetitions() > 0 or gs.halfmoveClock >= FIFTY_MOVE_PLIES and
+                        (not gs.in_check() or len(gs.get_valid_moves(self.moveBuffers[ply])) > 0)):
+            return DRAW
+        if ply > 0 and self.tablebases is not None and popcount(gs.bitboards.occupied) <= self.tablebases.maxPieces:
+            probed = self.tablebases.probe(gs)
+            if probed is not None:
+                return tablebase_score(probed[0], probed[1], ply)
+        key = gs.zobristKey
+        ttMove = 0
+        entry = self.tt.probe(key)
+        if entry is not None:
+            ttMove, ttScore, ttDepth, ttFlag = entry
+            if ply > 0 and ttDepth >= depth:
+                if ttScore > MATE_BOUND:
+                    ttScore -= ply
+                elif ttScore < -MATE_BOUND:
+                    ttScore += ply
+                if ttFlag == TranspositionTable.EXACT or \
+                        (ttFlag == TranspositionTable.LOWER and ttScore >= beta) or \
+                        (ttFlag == TranspositionTable.UPPER and ttScore <= alpha):
+                    return ttScore
+        inCheck = gs.in_check()
+        if inCheck:
+            depth += 1  # look one move further when in check so forced lines are not cut short
+        if depth <= 0 or ply >= MAX_PLY - 1:
+            return self.quiescence(gs, alpha, beta, ply)
+        alphaStart = alpha
+        bestScore = -INFINITY
+        bestMove = None
+        # moves are generated a stage at a time, so a cutoff by an early move saves generating the rest
+        for move in self.staged_moves(gs, ttMove, ply):
+            gs.make_move(move)
+            score = -self.negamax(gs, depth - 1, -beta, -alpha, ply + 1)
+            gs.undo_move()
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+                if score > alpha:
+                    alpha = score
+                    # the principal variation is this move followed by the one found below it
+                    self.pvTable[ply][ply] = move
+                    for i in range(ply + 1, self.pvLength[ply + 1]):
+                        self.pvTable[ply][i] = self.pvTable[ply + 1][i]
+                    self.pvLength[ply] = max(self.pvLength[ply + 1], ply + 1)
+                    if alpha >= beta:
+                        if move.pieceCapt == '--' and not move.isPawnPromotion:
+                            self.update_quiet_stats(move, depth, ply)
+                        break
+        if bestMove is None:  # no legal moves
+            return -(CHECKMATE - ply) if inCheck else STALEMATE
+        if bestScore >= beta:
+            flag = TranspositionTable.LOWER
+        elif bestScore > alphaStart:
+            flag = TranspositionTable.EXACT
+        else:
+            flag = TranspositionTable.UPPER
+        storedScore = bestScore
+        if storedScore > MATE_BOUND:
+            storedScore += ply
+        elif storedScore < -MATE_BOUND:
+            storedScore -= ply
+        self.tt.store(key, bestMove.encode(), storedScore, depth, flag)
+        return bestScore
+
+    """
+    Only searches captures and promotions so the evaluation is not taken in the middle of an exchange
+    in check there is no standing pat, every evasion is searched and no evasion means checkmate
+    """
+
+    def quiescence(self, gs, alpha, beta, ply):
+        self.pvLength[ply] = ply
+        self.nodes += 1
+        if self.nodes >= self.nextCheck or self.stopped:
+            self.check_limits()
+        if ply >= MAX_PLY - 1:
+            return chess_eval.evaluate(gs, self.pawnTable)
+        if gs.in_check():
+            moves = gs.get_valid_moves(self.moveBuffers[ply])
+            if len(moves) == 0:
+                return -(CHECKMATE - ply)
+        else:
+            standPat = chess_eval.evaluate(gs, self.pawnTable)
+            if standPat >= beta:
+                return standPat
+            if standPat > alpha:
+                alpha = standPat
+            # under promotions are left out, they are only better than a queen when they avoid stalemate or give mate
+            moves = [move for move in gs.get_capture_moves(self.moveBuffers[ply])
+                     if move.pieceCapt != '--' or move.promotionPiece == 'Q']
+        moves.sort(key=mvv_lva, reverse=True)
+        for move in moves:
+            gs.make_move(move)
+            score = -self.quiescence(gs, -beta, -alpha, ply + 1)
+            gs.undo_move()
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return alpha
+
+    """
+    Yields the legal moves best first in stages: the transposition table move, captures and promotions by MVV-LVA,
+    the killer moves, then the other quiet moves by history; a stage is only generated once the moves of the one
+    before it have all been searched, the moves of a stage that were already yielded are skipped
+    the hash and killer moves come from other positions, so they are looked up among the moves to their end square
+    """
+
+    def staged_moves(self, gs, ttMove, ply):
+        buffer = self.moveBuffers[ply]
+        if ttMove:
+            for move in gs.get_valid_moves(buffer, 1 << (ttMove >> 6 & 63)):
+                if move.encode() == ttMove:
+                    yield move
+                    break
+        captures = [move for move in gs.get_capture_moves(buffer) if move.encode() != ttMove]
+        captures.sort(key=mvv_lva, reverse=True)
+        for move in captures:
+            yield move
+        killers = self.killers[ply][:]  # copied, the search below can change them
+        for killer in killers:
+            if killer == 0 or killer == ttMove:
+                continue
+            for move in gs.get_valid_moves(buffer, 1 << (killer >> 6 & 63)):
+                if move.encode() == killer and move.pieceCapt == '--' and not move.isPawnPromotion:
+                    yield move
+                    break
+        history = self.history
+        skip = killers + [ttMove]
+        quiets = [move for move in gs.get_quiet_moves(buffer) if move.encode() not in skip]
+        quiets.sort(key=lambda move: history[move.encode() & 4095], reverse=True)
+        for move in quiets:
+            yield move
+
+    """
+    Remembers a quiet move that caused a beta cutoff for the killer and history heuristics
+    """
+
+    def update_quiet_stats(self, move, depth, ply):
+        packed = move.encode()
+        killers = self.killers[ply]
+        if killers[0] != packed:
+            killers[1] = killers[0]
+            killers[0] = packed
+        index = packed & 4095
+        self.history[index] += depth * depth
+        if self.history[index] >= 1000000:  # halved so old cutoffs fade and the scores stay small
+            for i in range(4096):
+                self.history[i] //= 2
+
+
+"""
+Turns a tablebase result for the player to move into a search score, wins and losses are scored like mates
+"""
+
+
+def tablebase_score(result, plies, ply):
+    if result == chess_tablebase.WIN:
+        return CHECKMATE - ply - plies
+    if result == chess_tablebase.LOSS:
+        return -(CHECKMATE - ply - plies)
+    return STALEMATE
+
+
+"""
+Most valuable victim, least valuable attacker: orders captures of big pieces by small pieces first
+"""
+
+
+def mvv_lva(move):
+    victim = pieceValues['P'] if move.isEnPassant else pieceValues[move.pieceCapt[1]] if move.pieceCapt != '--' else 0
+    if move.isPawnPromotion:
+        victim += pieceValues[move.promotionPiece]
+    return victim * 10 - pieceValues[move.pieceMoved[1]] // 10
+
+
+"""
+Finds the best move for the player to move within the limit
+returns a SearchResult with the best move, principal variation and nodes per second
+if a chess_book.OpeningBook is given and has the position, a book move is played without searching
+stopCount is passed on to Searcher.search
+"""
+
+
+def find_best_move(gs, limit, searcher=None, book=None, stopCount=None):
+    if book is not None:
+        move = book.choose_move(gs)
+        if move is not None:
+            result = SearchResult()
+            result.bestMove = move
+            result.pv = [move]
+            return result
+    if searcher is None:
+        searcher = Searcher()
+    return searcher.search(gs, limit, stopCount=stopCount)
@@ -0,0 +1,269 @@
+"""
+Bitboard backend for the chess engine
+squares are numbered row * 8 + col so square 0 is a8 and square 63 is h1, matching GameState.board
+each bitboard is a python int where bit n is set if square n is occupied
+"""
+
+PIECES = ('wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK')
+FULL = (1 << 64) - 1
+
+# (row step, col step) for each sliding direction, the first four are orthogonal and the last four diagonal
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+# directions that walk towards higher square numbers find their first blocker with the lowest set bit
+POSITIVE = (False, False, True, True, False, False, True, True)
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+
+"""
+Converts (row, col) coordinates into a square number
+"""
+
+
+def square(row, col):
+    return row * 8 + col
+
+
+"""
+Gets the square number of the lowest set bit of a bitboard
+"""
+
+
+def lsb(bb):
+    return (bb & -bb).bit_length() - 1
+
+
+"""
+Gets the square number of the highest set bit of a bitboard
+"""
+
+
+def msb(bb):
+    return bb.bit_length() - 1
+
+
+"""
+Yields the square number of every set bit of a bitboard from lowest to highest
+"""
+
+
+def squares(bb):
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+"""
+Counts the set bits of a bitboard
+"""
+
+
+def popcount(bb):
+    return bin(bb).count('1')
+
+
+def _offset_table(offsets):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        bb = 0
+        for d in offsets:
+            endRow = row + d[0]
+            endCol = col + d[1]
+            if 0 <= endRow <= 7 and 0 <= endCol <= 7:
+                bb |= 1 << square(endRow, endCol)
+        table.append(bb)
+    return table
+
+
+def _ray_table():
+    rays = []
+    for d in DIRECTIONS:
+        dirRays = []
+        for sq in range(64):
+            row, col = divmod(sq, 8)
+            bb = 0
+            endRow = row + d[0]
+            endCol = col + d[1]
+            while 0 <= endRow <= 7 and 0 <= endCol <= 7:
+                bb |= 1 << square(endRow, endCol)
+                endRow += d[0]
+                endCol += d[1]
+            dirRays.append(bb)
+        rays.append(dirRays)
+    return rays
+
+
+KNIGHT_ATTACKS = _offset_table(KNIGHT_OFFSETS)
+KING_ATTACKS = _offset_table(DIRECTIONS)
+# squares attacked by a pawn of the given color standing on a square, white pawns attack towards row 0
+PAWN_ATTACKS = {'w': _offset_table(((-1, -1), (-1, 1))), 'b': _offset_table(((1, -1), (1, 1)))}
+RAYS = _ray_table()
+
+
+def _between_and_line_tables():
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        for j in range(8):
+            opposite = j ^ 2 if j < 4 else 11 - j  # index of the direction pointing the other way
+            ray = RAYS[j][sq]
+            for target in squares(ray):
+                # squares strictly between sq and target are on the ray from sq but not past target
+                between[sq][target] = ray & ~RAYS[j][target] & ~(1 << target)
+                line[sq][target] = ray | RAYS[opposite][sq] | (1 << sq)
+    return between, line
+
+
+# BETWEEN[a][b] holds the squares strictly between two aligned squares, LINE[a][b] the whole line through them
+BETWEEN, LINE = _between_and_line_tables()
+
+"""
+Gets the squares a slider on sq attacks along the given directions (indexes into DIRECTIONS)
+each ray stops at and includes its first blocker
+"""
+
+
+def slider_attacks(sq, occupied, first, last):
+    attacks = 0
+    for j in range(first, last):
+        ray = RAYS[j][sq]
+        blockers = ray & occupied
+        if blockers:
+            blocker = (blockers & -blockers).bit_length() - 1 if POSITIVE[j] else blockers.bit_length() - 1
+            ray ^= RAYS[j][blocker]
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(sq, occupied):
+    return slider_attacks(sq, occupied, 0, 4)
+
+
+def bishop_attacks(sq, occupied):
+    return slider_attacks(sq, occupied, 4, 8)
+
+
+def queen_attacks(sq, occupied):
+    return slider_attacks(sq, occupied, 0, 8)
+
+
+class Bitboards:
+    def __init__(self, board):
+        # one bitboard for each of the 12 pieces plus the occupancy of each color
+        self.pieces = dict.fromkeys(PIECES, 0)
+        self.colors = {'w': 0, 'b': 0}
+        self.occupied = 0
+        for row in range(8):
+            for col in range(8):
+                if board[row][col] != '--':
+                    self.add(board[row][col], square(row, col))
+
+    """
+    Builds the bitboards from a dict of the 12 piece bitboards
+    """
+
+    @staticmethod
+    def from_pieces(pieces):
+        bitboards = Bitboards.__new__(Bitboards)
+        bitboards.pieces = pieces
+        white = pieces['wP'] | pieces['wN'] | pieces['wB'] | pieces['wR'] | pieces['wQ'] | pieces['wK']
+        black = pieces['bP'] | pieces['bN'] | pieces['bB'] | pieces['bR'] | pieces['bQ'] | pieces['bK']
+        bitboards.colors = {'w': white, 'b': black}
+        bitboards.occupied = white | black
+        return bitboards
+
+    def copy(self):
+        bitboards = Bitboards.__new__(Bitboards)
+        bitboards.pieces = dict(self.pieces)
+        bitboards.colors = dict(self.colors)
+        bitboards.occupied = self.occupied
+        return bitboards
+
+    def add(self, piece, sq):
+        bit = 1 << sq
+        self.pieces[piece] |= bit
+        self.colors[piece[0]] |= bit
+        self.occupied |= bit
+
+    def remove(self, piece, sq):
+        mask = ~(1 << sq)
+        self.pieces[piece] &= mask
+        self.colors[piece[0]] &= mask
+        self.occupied &= mask
+
+    def move(self, piece, startSq, endSq):
+        bits = (1 << startSq) | (1 << endSq)
+        self.pieces[piece] ^= bits
+        self.colors[piece[0]] ^= bits
+        self.occupied ^= bits
+
+    """
+    Gets a bitboard of the pieces of the given color that attack sq
+    occupied can be passed in to look through pieces (e.g. a king stepping away from a slider)
+    """
+
+    def attackers_to(self, sq, color, occupied=None):
+        if occupied is None:
+            occupied = self.occupied
+        pieces = self.pieces
+        enemy = 'b' if color == 'w' else 'w'
+        queens = pieces[color + 'Q']
+        # pawn attacks are symmetric so a pawn of color attacks sq if a pawn of the enemy color on sq would attack it
+        attackers = (KNIGHT_ATTACKS[sq] & pieces[color + 'N']) | (KING_ATTACKS[sq] & pieces[color + 'K']) | \
+                    (PAWN_ATTACKS[enemy][sq] & pieces[color + 'P'])
+        rooks = pieces[color + 'R'] | queens
+        if rooks:
+            attackers |= rook_attacks(sq, occupied) & rooks
+        bishops = pieces[color + 'B'] | queens
+        if bishops:
+            attackers |= bishop_attacks(sq, occupied) & bishops
+        return attackers & occupied
+
+    def is_attacked(self, sq, color, occupied=None):
+        if occupied is None:
+            occupied = self.occupied
+        pieces = self.pieces
+        enemy = 'b' if color == 'w' else 'w'
+        if KNIGHT_ATTACKS[sq] & pieces[color + 'N'] or PAWN_ATTACKS[enemy][sq] & pieces[color + 'P'] or \
+                KING_ATTACKS[sq] & pieces[color + 'K']:
+            return True
+        queens = pieces[color + 'Q']
+        rooks = pieces[color + 'R'] | queens
+        if rooks and rook_attacks(sq, occupied) & rooks:
+            return True
+        bishops = pieces[color + 'B'] | queens
+        return bool(bishops and bishop_attacks(sq, occupied) & bishops)
+
+    """
+    Gets the squares attacked by a single piece standing on sq
+    """
+
+    def piece_attacks(self, piece, sq, occupied=None):
+        if occupied is None:
+            occupied = self.occupied
+        pieceType = piece[1]
+        if pieceType == 'P':
+            return PAWN_ATTACKS[piece[0]][sq]
+        if pieceType == 'N':
+            return KNIGHT_ATTACKS[sq]
+        if pieceType == 'K':
+            return KING_ATTACKS[sq]
+        if pieceType == 'R':
+            return rook_attacks(sq, occupied)
+        if pieceType == 'B':
+            return bishop_attacks(sq, occupied)
+        return queen_attacks(sq, occupied)
+
+    """
+    Gets a bitboard of every square attacked by the given color
+    """
+
+    def attacks_by(self, color, occupied=None):
+        if occupied is None:
+            occupied = self.occupied
+        attacks = 0
+        for pieceType in 'PNBRQK':
+            piece = color + pieceType
+            for sq in squares(self.pieces[piece]):
+                attacks |= self.piece_attacks(piece, sq, occupied)
+        return attacks
@@ -0,0 +1,195 @@
+"""
+Opening book: a sorted binary file of (position key, move, weight) entries compiled from PGN games
+the file is memory-mapped read-only and searched in place, so opening it costs nothing however big it is and
+every process that opens the same book shares the pages the operating system has cached
+keys are GameState zobrist keys, so a book only works with the zobrist tables it was compiled with
+
+usage: python chess_book.py compile GAMES.pgn [GAMES.pgn ...] -o BOOK.bin [--plies 20] [--min-count 1]
+       python chess_book.py probe BOOK.bin [--fen FEN]
+"""
+import argparse
+import functools
+import mmap
+import random
+import struct
+import sys
+import time
+
+import chess_engine
+import chess_pgn
+
+# big endian so the bytes of the entries sort in the same order as their keys
+ENTRY = struct.Struct('>QHH4x')  # zobrist key, packed move (Move.encode), weight, 4 bytes reserved
+MAX_WEIGHT = 0xFFFF
+BOOK_PLIES = 20  # moves deeper into a game than this are not added to the book
+# points a move earns for white and for black by the result of the game, unfinished games count as draws
+RESULT_POINTS = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1), '*': (1, 1)}
+
+
+class OpeningBook:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        size = self.file.seek(0, 2)
+        if size % ENTRY.size != 0:
+            self.file.close()
+            raise ValueError(path + ' is not an opening book')
+        self.entries = size // ENTRY.size
+        # an empty file can not be mapped but it is a valid (empty) book
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b''
+
+    def close(self):
+        if self.data:
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.entries
+
+    """
+    Gets the index of the first entry with a key not below the given key by binary search
+    """
+
+    def find(self, key):
+        low, high = 0, self.entries
+        unpack = ENTRY.unpack_from
+        data = self.data
+        while low < high:
+            mid = (low + high) // 2
+            if unpack(data, mid * ENTRY.size)[0] < key:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    """
+    Gets the (packed move, weight) entries stored for a zobrist key
+    """
+
+    def entries_for(self, key):
+        found = []
+        unpack = ENTRY.unpack_from
+        index = self.find(key)
+        while index < self.entries:
+            entryKey, move, weight = unpack(self.data, index * ENTRY.size)
+            if entryKey != key:
+                break
+            found.append((move, weight))
+            index += 1
+        return found
+
+    """
+    Gets the book moves of the position as (move, weight) pairs, heaviest first
+    the moves are the matching Move objects of get_valid_moves so they can be played straight away,
+    entries that are not legal in the position (a key collision) are skipped
+    """
+
+    def lookup(self, gs):
+        found = self.entries_for(gs.zobristKey)
+        if len(found) == 0:
+            return []
+        checkMate, staleMate = gs.checkMate, gs.staleMate
+        validMoves = {move.encode(): move for move in gs.get_valid_moves()}
+        gs.checkMate, gs.staleMate = checkMate, staleMate
+        moves = [(validMoves[packed], weight) for packed, weight in found if packed in validMoves and weight > 0]
+        moves.sort(key=lambda entry: entry[1], reverse=True)
+        return moves
+
+    """
+    Picks a book move for the position, at random in proportion to the weights unless best is set
+    returns None when the position is not in the book
+    """
+
+    def choose_move(self, gs, rng=random, best=False):
+        moves = self.lookup(gs)
+        if len(moves) == 0:
+            return None
+        if best:
+            return moves[0][0]
+        pick = rng.random() * sum(weight for move, weight in moves)
+        for move, weight in moves:
+            pick -= weight
+            if pick < 0:
+                return move
+        return moves[-1][0]
+
+
+def _book_entries(text, plies=BOOK_PLIES):
+    # runs in the chess_pgn replay workers: the (key, move, points) of every book move of one game
+    game = chess_pgn.parse_game(text)
+    whitePoints, blackPoints = RESULT_POINTS[game.result]
+    entries = []
+    try:
+        gs = game.start_state()
+        for san in game.moves[:plies]:
+            move = chess_pgn.san_to_move(gs, san)
+            entries.append((gs.zobristKey, move.encode(), whitePoints if gs.whiteToMove else blackPoints))
+            gs.make_move(move)
+    except ValueError:  # the moves up to the bad one are still good
+        pass
+    return entries
+
+
+"""
+Compiles PGN files into a book file, returns the number of entries written
+a move needs to be played minCount times to get in, weights are the points scored with it scaled into 16 bits
+"""
+
+
+def compile_book(pgnPaths, outPath, plies=BOOK_PLIES, minCount=1, workers=None):
+    counts = {}
+    points = {}
+    for path in pgnPaths:
+        with open(path) as f:
+            for entries in chess_pgn.replay_games(f, workers, functools.partial(_book_entries, plies=plies)):
+                for key, move, score in entries:
+                    counts[key, move] = counts.get((key, move), 0) + 1
+                    points[key, move] = points.get((key, move), 0) + score
+    # a move that was played but never scored still gets a weight of 1 so it can be found
+    kept = [(entry, max(points[entry], 1)) for entry, count in counts.items() if count >= minCount]
+    scale = max([weight for entry, weight in kept] + [MAX_WEIGHT]) / MAX_WEIGHT
+    kept.sort()
+    with open(outPath, 'wb') as f:
+        for (key, move), weight in kept:
+            f.write(ENTRY.pack(key, move, max(int(weight / scale), 1)))
+    return len(kept)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compile and query opening books')
+    commands = parser.add_subparsers(dest='command')
+    compileParser = commands.add_parser('compile', help='compile PGN files into a book')
+    compileParser.add_argument('pgn', nargs='+')
+    compileParser.add_argument('-o', '--output', required=True)
+    compileParser.add_argument('--plies', type=int, default=BOOK_PLIES, help='moves of each game to add')
+    compileParser.add_argument('--min-count', type=int, default=1, help='games a move must appear in')
+    compileParser.add_argument('--workers', type=int, help='worker processes (defaults to the number of cores)')
+    probeParser = commands.add_parser('probe', help='list the book moves of a position')
+    probeParser.add_argument('book')
+    probeParser.add_argument('--fen', help='position to look up (defaults to the start position)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'compile':
+        start = time.time()
+        entries = compile_book(args.pgn, args.output, args.plies, args.min_count, args.workers)
+        sys.stderr.write('%d entries written in %.2fs\n' % (entries, time.time() - start))
+    elif args.command == 'probe':
+        gs = chess_engine.GameState.from_fen(args.fen) if args.fen else chess_engine.GameState()
+        with OpeningBook(args.book) as book:
+            moves = book.lookup(gs)
+            validMoves = gs.get_valid_moves()
+            for move, weight in moves:
+                print('%-8s %d' % (chess_pgn.move_to_san(gs, move, validMoves), weight))
+    else:
+        parser.print_help()
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+Cache of what has been worked out about positions: their legal moves and game over flags, and engine results
+undoing and replaying moves, or reviewing the same games again, looks positions up here instead of generating
+their moves or searching them again
+positions are keyed by zobrist key, the least recently used ones are dropped once the entries take more than the
+memory cap, and the cache can be saved to a file and loaded again so it survives restarts; like an opening book a
+saved cache only works with the zobrist tables it was made with
+the draw flags depend on how a position was reached, not just on the position, so they are never cached
+
+usage: python chess_cache.py info CACHE.bin
+"""
+import argparse
+import collections
+import os
+import struct
+import sys
+import threading
+from array import array
+
+import chess_ai
+import chess_engine
+
+MAGIC = b'CHCACHE2'
+# zobrist key, flags, number of legal moves, engine score, depth, nodes and seconds given, principal variation length
+ENTRY = struct.Struct('<QBHiBIfB')
+HAS_MOVES, CHECKMATE, STALEMATE, HAS_ENGINE = 1, 2, 4, 8
+# bytes an entry takes besides its packed moves: the dict slot, the record and the key and moves objects
+ENTRY_OVERHEAD = 256
+DEFAULT_SIZE_MB = 16
+
+
+class PositionCache:
+    def __init__(self, sizeMb=DEFAULT_SIZE_MB, path=None):
+        self.maxBytes = int(sizeMb * 1024 * 1024)
+        # zobrist key -> [packed legal moves or None, checkMate, staleMate,
+        # (score, depth, packed pv, nodes, seconds given) or None], least recently used first
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # the GUI looks positions up on its own thread and the move worker stores what it works out on another
+        self.lock = threading.Lock()
+        self.path = path
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    """
+    Gets the entry of the position and makes it the most recently used, or None
+    """
+
+    def lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    """
+    Gets the legal moves of the position as Move objects for its board, with its checkmate and stalemate flags,
+    as (moves, checkMate, staleMate), or None if they are not cached
+    a key collision is not checked for and would give the moves of another position: checking them would take the
+    move generation the cache saves, and with 64 bit keys the transposition table takes the same risk
+    """
+
+    def get_moves(self, gs):
+        with self.lock:
+            entry = self.lookup(gs.zobristKey)
+            if entry is None or entry[0] is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            packedMoves, checkMate, staleMate = entry[0], entry[1], entry[2]
+        return [chess_engine.Move.decode(packed, gs.board) for packed in packedMoves], checkMate, staleMate
+
+    def put_moves(self, gs, moves, checkMate, staleMate):
+        with self.lock:
+            entry = self.entry_for(gs.zobristKey)
+            if entry[0] is not None:
+                return
+            entry[0] = array('H', [move.encode() for move in moves])
+            entry[1], entry[2] = checkMate, staleMate
+            self.resize(entry, len(entry[0]) * 2)
+
+    """
+    Gets an engine result for the position as a chess_ai.SearchResult, or None if there is none good enough for
+    the chess_ai.SearchLimit: it must have reached the depth and nodes and been given the time the limit asks for,
+    and a limit without any is never met from the cache
+    nodes and time are left at 0 since no search was run, the moves of the principal variation are checked to be
+    legal so a key collision gives None
+    """
+
+    def get_engine(self, gs, limit):
+        with self.lock:
+            entry = self.lookup(gs.zobristKey)
+            if entry is None or entry[3] is None or not meets(entry[3], limit):
+                self.misses += 1
+                return None
+            self.hits += 1
+            score, depth, packedPv = entry[3][:3]
+        pv = decode_line(gs, packedPv)
+        if len(pv) == 0:
+            return None
+        result = chess_ai.SearchResult()
+        result.bestMove = pv[0]
+        result.pv = pv
+        result.score = score
+        result.depth = depth
+        return result
+
+    """
+    Stores a search result for the position with the limit it was searched with, it replaces a stored result only
+    when searched at least as deep; results without a search (book and tablebase moves, depth 0) are not stored
+    """
+
+    def put_engine(self, gs, result, limit):
+        if result.bestMove is None or result.depth == 0:
+            return
+        with self.lock:
+            entry = self.entry_for(gs.zobristKey)
+            if entry[3] is not None and entry[3][1] > result.depth:
+                return
+            pv = array('H', [move.encode() for move in result.pv] or [result.bestMove.encode()])
+            growth = len(pv) * 2 - (len(entry[3][2]) * 2 if entry[3] is not None else 0)
+            # a search with a movetime can stop early when the next depth would not finish, so it is counted as
+            # having had the whole movetime
+            seconds = limit.movetime if limit.movetime is not None else result.time
+            entry[3] = (result.score, result.depth, pv, result.nodes, seconds)
+            self.resize(entry, growth)
+
+    def entry_for(self, key):
+        # the entry of the position, added if it is not there yet
+        entry = self.lookup(key)
+        if entry is None:
+            entry = [None, False, False, None]
+            self.entries[key] = entry
+            self.bytes += ENTRY_OVERHEAD
+        return entry
+
+    def resize(self, entry, growth):
+        # accounts for the entry growing and drops the least recently used entries while over the cap, the entry
+        # itself was just used so it goes last
+        self.bytes += growth
+        while self.bytes > self.maxBytes and len(self.entries) > 1:
+            key, oldest = self.entries.popitem(last=False)
+            self.bytes -= entry_size(oldest)
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    """
+    Gets the hit and miss counts, the hit rate and how full the cache is
+    """
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self.entries), 'bytes': self.bytes, 'maxBytes': self.maxBytes, 'hits': self.hits,
+                    'misses': self.misses, 'hitRate': self.hits / lookups if lookups > 0 else 0.0,
+                    'evictions': self.evictions}
+
+    """
+    Writes the cache to a file, least recently used first so loading it keeps the order
+    the file is written next to the old one and then moved over it, so a crash can not leave half a file
+    """
+
+    def save(self, path=None):
+        path = path if path is not None else self.path
+        with self.lock:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(MAGIC)
+                for key, (packedMoves, checkMate, staleMate, engine) in self.entries.items():
+                    flags = (HAS_MOVES if packedMoves is not None else 0) | (CHECKMATE if checkMate else 0) | \
+                            (STALEMATE if staleMate else 0) | (HAS_ENGINE if engine is not None else 0)
+                    score, depth, pv, nodes, seconds = engine if engine is not None else (0, 0, array('H'), 0, 0.0)
+                    f.write(ENTRY.pack(key, flags, len(packedMoves) if packedMoves is not None else 0, score, depth,
+                                       min(nodes, 0xffffffff), seconds, len(pv)))
+                    if packedMoves is not None:
+                        f.write(packedMoves.tobytes())
+                    f.write(pv.tobytes())
+        os.replace(path + '.tmp', path)
+
+    """
+    Adds the entries of a saved cache, raises ValueError if the file is not a cache
+    """
+
+    def load(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(path + ' is not a position cache')
+        offset = len(MAGIC)
+        with self.lock:
+            while offset + ENTRY.size <= len(data):
+                key, flags, moveCount, score, depth, nodes, seconds, pvLength = ENTRY.unpack_from(data, offset)
+                offset += ENTRY.size
+                packedMoves = array('H', data[offset:offset + moveCount * 2])
+                offset += moveCount * 2
+                pv = array('H', data[offset:offset + pvLength * 2])
+                offset += pvLength * 2
+                if key in self.entries:
+                    self.bytes -= entry_size(self.entries.pop(key))
+                entry = [packedMoves if flags & HAS_MOVES else None, bool(flags & CHECKMATE),
+                         bool(flags & STALEMATE), (score, depth, pv, nodes, seconds) if flags & HAS_ENGINE else None]
+                self.entries[key] = entry
+                self.bytes += ENTRY_OVERHEAD
+                self.resize(entry, entry_size(entry) - ENTRY_OVERHEAD)
+
+
+"""
+Turns a line of packed moves into Move objects, each for the board it is played on, stopping at the first move
+that is not legal; the game state is left as it was
+"""
+
+
+def decode_line(gs, packedMoves):
+    line = []
+    for packed in packedMoves:
+        move = None
+        for validMove in gs.get_valid_moves(targets=1 << (packed >> 6 & 63)):
+            if validMove.encode() == packed:
+                move = validMove
+                break
+        if move is None:
+            break
+        line.append(move)
+        gs.make_move(move)
+    for _ in line:
+        gs.undo_move()
+    return line
+
+
+def meets(engine, limit):
+    # whether a stored (score, depth, packed pv, nodes, seconds given) searched as far as the limit would
+    score, depth, packedPv, nodes, seconds = engine
+    if limit.depth is None and limit.nodes is None and limit.movetime is None:
+        return False
+    return (limit.depth is None or depth >= limit.depth) and (limit.nodes is None or nodes >= limit.nodes) and \
+        (limit.movetime is None or seconds >= limit.movetime)
+
+
+def entry_size(entry):
+    return ENTRY_OVERHEAD + (len(entry[0]) * 2 if entry[0] is not None else 0) + \
+        (len(entry[3][2]) * 2 if entry[3] is not None else 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect a saved position cache')
+    commands = parser.add_subparsers(dest='command')
+    infoParser = commands.add_parser('info', help='count the entries of a cache file')
+    infoParser.add_argument('cache')
+    args = parser.parse_args(argv)
+
+    if args.command == 'info':
+        cache = PositionCache(sizeMb=1024 * 1024)  # no cap, every entry of the file is counted
+        cache.load(args.cache)
+        withMoves = sum(1 for entry in cache.entries.values() if entry[0] is not None)
+        withEngine = sum(1 for entry in cache.entries.values() if entry[3] is not None)
+        print('%d positions, %d with legal moves, %d with engine results, about %.1f MB in memory' % (
+            len(cache), withMoves, withEngine, cache.bytes / (1024 * 1024)))
+    else:
+        parser.print_help()
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
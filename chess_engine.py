@@ -1,3 +1,35 @@
+from chess_zobrist import PIECE_KEYS, CASTLE_KEYS, EN_PASSANT_KEYS, SIDE_KEY, castle_index, compute_key
+from chess_eval import PST_MG, PST_EG, PIECE_PHASE
+from chess_bitboard import Bitboards, PIECES, FULL, KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, BETWEEN, LINE, \
+    rook_attacks, bishop_attacks, squares, lsb, popcount
+
+# castle rights are kept as 4 bits, in the same order as chess_zobrist.castle_index
+WKS, WQS, BKS, BQS = 1, 2, 4, 8
+ALL_CASTLE_RIGHTS = WKS | WQS | BKS | BQS
+# rights that survive a move from or to each square, a move touching a king or rook home square clears its rights
+CASTLE_MASKS = [ALL_CASTLE_RIGHTS] * 64
+CASTLE_MASKS[0] = ALL_CASTLE_RIGHTS & ~BQS  # a8
+CASTLE_MASKS[4] = ALL_CASTLE_RIGHTS & ~(BKS | BQS)  # e8
+CASTLE_MASKS[7] = ALL_CASTLE_RIGHTS & ~BKS  # h8
+CASTLE_MASKS[56] = ALL_CASTLE_RIGHTS & ~WQS  # a1
+CASTLE_MASKS[60] = ALL_CASTLE_RIGHTS & ~(WKS | WQS)  # e1
+CASTLE_MASKS[63] = ALL_CASTLE_RIGHTS & ~WKS  # h1
+# FEN letters of each piece and castle right
+FEN_PIECES = {'P': 'wP', 'N': 'wN', 'B': 'wB', 'R': 'wR', 'Q': 'wQ', 'K': 'wK',
+              'p': 'bP', 'n': 'bN', 'b': 'bB', 'r': 'bR', 'q': 'bQ', 'k': 'bK'}
+PIECES_TO_FEN = {v: k for k, v in FEN_PIECES.items()}
+FEN_CASTLE_RIGHTS = {'K': WKS, 'Q': WQS, 'k': BKS, 'q': BQS}
+# the king and rook squares each castle right needs, (row, col, piece)
+CASTLE_PIECES = {WKS: ((7, 4, 'wK'), (7, 7, 'wR')), WQS: ((7, 4, 'wK'), (7, 0, 'wR')),
+                 BKS: ((0, 4, 'bK'), (0, 7, 'bR')), BQS: ((0, 4, 'bK'), (0, 0, 'bR'))}
+EMPTY_ROW = ['--'] * 8
+UNDO_STACK_SIZE = 256  # plies the undo stack starts with, it doubles if a game gets longer
+FIFTY_MOVE_PLIES = 100  # plies without a capture or pawn move after which the game is drawn
+LIGHT_SQUARES = sum(1 << (row * 8 + col) for row in range(8) for col in range(8) if (row + col) % 2 == 0)
+# squares each color's pawns promote on
+PROMOTION_SQUARES = {'w': 0xFF, 'b': 0xFF << 56}
+
+
 class GameState:
     def __init__(self):
         # 8x8 2d list, each element of list is represented by 2 chars
@@ -14,23 +46,268 @@ class GameState:
             ['wR', 'wN', 'wB', 'wQ', 'wK', 'wB', 'wN', 'wR'],
         ]
         self.whiteToMove = True
+        self.possibleEnPassant = ()  # coordinates of square where en passant is possible
+        self.castleRights = ALL_CASTLE_RIGHTS
+        self.halfmoveClock = 0  # plies since the last capture or pawn move
+        self.fullmoveNumber = 1  # starts at 1 and goes up after every black move
+        # one record per ply of [castle rights, en passant square, zobrist key, pawn key, mg, eg, phase, halfmove
+        # clock, fullmove number] from before the move at that ply, allocated up front and overwritten in place
+        # so make/undo allocate nothing
+        self.undoStack = [[0, (), 0, 0, 0, 0, 0, 0, 0] for _ in range(UNDO_STACK_SIZE)]
+        self.setup_derived_state()
+
+    """
+    Builds a game state from a FEN string, the halfmove and fullmove counters may be left out
+    castle rights whose king or rook is not on its home square are dropped
+    raises ValueError if the FEN can not be read or its en passant square does not follow a double pawn push
+    """
+
+    @classmethod
+    def from_fen(cls, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError('FEN needs at least 4 fields: ' + fen)
+        ranks = fields[0].split('/')
+        if len(ranks) != 8:
+            raise ValueError('FEN board needs 8 ranks: ' + fen)
+        board = []
+        for rank in ranks:
+            row = []
+            for char in rank:
+                piece = FEN_PIECES.get(char)
+                if piece is not None:
+                    row.append(piece)
+                elif char in '12345678':
+                    row.extend(EMPTY_ROW[:int(char)])
+                else:
+                    raise ValueError('bad character ' + char + ' in FEN board: ' + fen)
+            if len(row) != 8:
+                raise ValueError('FEN rank ' + rank + ' is not 8 squares long: ' + fen)
+            board.append(row)
+        if fields[1] not in ('w', 'b'):
+            raise ValueError('FEN side to move must be w or b: ' + fen)
+        gs = cls.__new__(cls)
+        gs.board = board
+        gs.whiteToMove = fields[1] == 'w'
+        gs.castleRights = 0
+        if fields[2] != '-':
+            for char in fields[2]:
+                if char not in FEN_CASTLE_RIGHTS:
+                    raise ValueError('bad castle rights in FEN: ' + fen)
+                gs.castleRights |= FEN_CASTLE_RIGHTS[char]
+        for right, homeSquares in CASTLE_PIECES.items():
+            if any(board[row][col] != piece for row, col, piece in homeSquares):
+                gs.castleRights &= ~right
+        gs.possibleEnPassant = ()
+        if fields[3] != '-':
+            epRank = '6' if gs.whiteToMove else '3'  # behind a pawn the other player just moved two squares
+            if len(fields[3]) != 2 or fields[3][0] not in Move.filesToCols or fields[3][1] != epRank:
+                raise ValueError('bad en passant square in FEN: ' + fen)
+            row, col = Move.ranksToRow[fields[3][1]], Move.filesToCols[fields[3][0]]
+            # the pawn that just moved two squares stands behind the square, which it and the one it came from
+            # passed over empty
+            step, pawn = (1, 'bP') if gs.whiteToMove else (-1, 'wP')
+            if board[row][col] != '--' or board[row - step][col] != '--' or board[row + step][col] != pawn:
+                raise ValueError('en passant square in FEN does not follow a double pawn push: ' + fen)
+            gs.possibleEnPassant = (row, col)
+        try:
+            gs.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+            gs.fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError('bad move counters in FEN: ' + fen)
+        # positions loaded in bulk are often never played on, so the undo stack is only allocated on the first move
+        gs.undoStack = []
+        gs.setup_derived_state()
+        return gs
+
+    """
+    Writes the position as a FEN string
+    """
+
+    def to_fen(self):
+        ranks = []
+        for row in self.board:
+            rank = ''
+            empty = 0
+            for piece in row:
+                if piece == '--':
+                    empty += 1
+                else:
+                    if empty:
+                        rank += str(empty)
+                        empty = 0
+                    rank += PIECES_TO_FEN[piece]
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        rights = ''.join(char for char in 'KQkq' if self.castleRights & FEN_CASTLE_RIGHTS[char]) or '-'
+        enPassant = '-'
+        if self.possibleEnPassant != ():
+            enPassant = Move.colsToFiles[self.possibleEnPassant[1]] + Move.rowsToRanks[self.possibleEnPassant[0]]
+        return ' '.join(('/'.join(ranks), 'w' if self.whiteToMove else 'b', rights, enPassant,
+                         str(self.halfmoveClock), str(self.fullmoveNumber)))
+
+    """
+    Sets up everything that follows from the board, side to move, castle rights and en passant square:
+    bitboards, king locations, hashes and evaluation sums, with an empty move log
+    """
+
+    def setup_derived_state(self):
+        # one pass over the board fills the bitboards, hashes and evaluation sums together, the same values
+        # compute_key, pawn_key and compute_scores give but without scanning the board once for each
+        pieces = dict.fromkeys(PIECES, 0)
+        pieceCounts = dict.fromkeys(PIECES, 0)
+        key = pawnKey = mg = eg = phase = 0
+        sq = 0
+        for row in self.board:
+            for piece in row:
+                if piece != '--':
+                    pieces[piece] |= 1 << sq
+                    pieceCounts[piece] += 1
+                    key ^= PIECE_KEYS[piece][sq]
+                    mg += PST_MG[piece][sq]
+                    eg += PST_EG[piece][sq]
+                    phase += PIECE_PHASE[piece]
+                    if piece[1] == 'P':
+                        pawnKey ^= PIECE_KEYS[piece][sq]
+                sq += 1
+        # piece bitboards that the move generator works from, board is kept in sync with them as a
+        # read-only view for the graphics and should only be changed through make_move/undo_move
+        self.bitboards = Bitboards.from_pieces(pieces)
+        if popcount(pieces['wK']) != 1 or popcount(pieces['bK']) != 1:
+            raise ValueError('a position needs exactly one king of each color')
         self.moveLog = []
         # variables to track where to king moves
-        self.whiteKingLoc = (7, 4)
-        self.blackKingLoc = (0, 4)
+        self.whiteKingLoc = divmod(lsb(pieces['wK']), 8)
+        self.blackKingLoc = divmod(lsb(pieces['bK']), 8)
         self.checkMate = False
         self.staleMate = False
-        self.possibleEnPassant = ()  # coordinates of square where en passant is possible
-        self.currCastleRights = CastleRights(True, True, True, True)
-        self.castleRightsLog = [CastleRights(self.currCastleRights.wks, self.currCastleRights.bks,
-                                             self.currCastleRights.wqs, self.currCastleRights.bqs)]
+        self.inCheck = False
+        self.pins = []  # pieces pinned to the king of the player to move
+        self.checks = []  # pieces giving check to the king of the player to move
+        # 64 bit zobrist hash of the position, updated by make_move and restored from the undo stack by undo_move
+        key ^= CASTLE_KEYS[self.castleRights]
+        if self.possibleEnPassant != ():
+            key ^= EN_PASSANT_KEYS[self.possibleEnPassant[1]]
+        self.zobristKey = key if self.whiteToMove else key ^ SIDE_KEY
+        # zobrist key of the pawns only, for the pawn structure cache of chess_eval
+        self.pawnKey = pawnKey
+        # material plus piece-square sums (white's point of view) and game phase, kept up to date for chess_eval
+        self.mgScore, self.egScore, self.phase = mg, eg, phase
+        # number of each piece on the board, changed by captures and promotions, for the insufficient material draw
+        self.pieceCounts = pieceCounts
+
+    """
+    Draw flags, worked out from the position when read so they are never stale:
+    threefoldRepetition is set when the position has been on the board twice before with the same player to move,
+    fiftyMoveRule when 50 moves each went by without a capture or pawn move (a checkmate on the last move still
+    counts, so it relies on checkMate being up to date) and insufficientMaterial when neither player has enough
+    pieces left to ever give checkmate
+    """
+
+    @property
+    def threefoldRepetition(self):
+        return self.repetitions() >= 2
+
+    @property
+    def fiftyMoveRule(self):
+        return self.halfmoveClock >= FIFTY_MOVE_PLIES and not self.checkMate
+
+    @property
+    def insufficientMaterial(self):
+        counts = self.pieceCounts
+        if counts['wP'] or counts['bP'] or counts['wR'] or counts['bR'] or counts['wQ'] or counts['bQ']:
+            return False
+        if counts['wN'] + counts['bN'] + counts['wB'] + counts['bB'] <= 1:  # bare kings or one minor piece
+            return True
+        if counts['wN'] or counts['bN']:
+            return False
+        # only bishops left, they can never checkmate if they all move on squares of the same color
+        bishops = self.bitboards.pieces['wB'] | self.bitboards.pieces['bB']
+        return bishops & LIGHT_SQUARES == 0 or bishops & ~LIGHT_SQUARES == 0
+
+    @property
+    def draw(self):
+        return self.staleMate or self.threefoldRepetition or self.fiftyMoveRule or self.insufficientMaterial
+
+    """
+    Counts how many times the current position was on the board before in this game
+    the zobrist keys of earlier positions are in the undo stack, only positions since the last capture or pawn
+    move with the same player to move can be the same, so only every second key back to there is looked at
+    """
+
+    def repetitions(self):
+        key = self.zobristKey
+        undoStack = self.undoStack
+        ply = len(self.moveLog)
+        count = 0
+        for i in range(ply - 2, max(ply - self.halfmoveClock, 0) - 1, -2):
+            if undoStack[i][2] == key:
+                count += 1
+        return count
+
+    """
+    The castle rights as a CastleRights object, the state itself only keeps the 4 bits in castleRights
+    """
+
+    @property
+    def currCastleRights(self):
+        rights = self.castleRights
+        return CastleRights(bool(rights & WKS), bool(rights & BKS), bool(rights & WQS), bool(rights & BQS))
+
+    @currCastleRights.setter
+    def currCastleRights(self, castleRights):
+        self.castleRights = castle_index(castleRights)
 
     def make_move(self, move):
+        bitboards = self.bitboards
+        startSq = move.startRow * 8 + move.startCol
+        endSq = move.endRow * 8 + move.endCol
+        ply = len(self.moveLog)
+        if ply == len(self.undoStack):
+            self.undoStack.extend([[0, (), 0, 0, 0, 0, 0, 0, 0] for _ in range(max(ply, UNDO_STACK_SIZE))])
+        record = self.undoStack[ply]
+        record[0] = self.castleRights
+        record[1] = self.possibleEnPassant
+        record[2] = self.zobristKey
+        record[3] = pawnKey = self.pawnKey
+        record[4] = mg = self.mgScore
+        record[5] = eg = self.egScore
+        record[6] = self.phase
+        record[7] = self.halfmoveClock
+        record[8] = self.fullmoveNumber
+        pieceMoved = move.pieceMoved
+        # xor out everything the move can change, the new values are xored back in below
+        key = self.zobristKey ^ SIDE_KEY ^ PIECE_KEYS[pieceMoved][startSq]
+        key ^= CASTLE_KEYS[self.castleRights]
+        if self.possibleEnPassant != ():
+            key ^= EN_PASSANT_KEYS[self.possibleEnPassant[1]]
+        mg -= PST_MG[pieceMoved][startSq]
+        eg -= PST_EG[pieceMoved][startSq]
+        if pieceMoved[1] == 'P':
+            pawnKey ^= PIECE_KEYS[pieceMoved][startSq]
+        if move.pieceCapt != '--':  # en passant captures the pawn beside the moving pawn
+            capturedSq = move.startRow * 8 + move.endCol if move.isEnPassant else endSq
+            bitboards.remove(move.pieceCapt, capturedSq)
+            key ^= PIECE_KEYS[move.pieceCapt][capturedSq]
+            mg -= PST_MG[move.pieceCapt][capturedSq]
+            eg -= PST_EG[move.pieceCapt][capturedSq]
+            self.phase -= PIECE_PHASE[move.pieceCapt]
+            self.pieceCounts[move.pieceCapt] -= 1
+            if move.pieceCapt[1] == 'P':
+                pawnKey ^= PIECE_KEYS[move.pieceCapt][capturedSq]
+        bitboards.move(move.pieceMoved, startSq, endSq)
         # leaves empty space from position moved
         self.board[move.startRow][move.startCol] = "--"
         # moves the piece to where the player wants
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.moveLog.append(move)
+        if pieceMoved[1] == 'P' or move.pieceCapt != '--':
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if not self.whiteToMove:
+            self.fullmoveNumber += 1
         self.whiteToMove = not self.whiteToMove  # switch players turn
         # update king's location if it was moved
         if move.pieceMoved == 'wK':
@@ -38,15 +315,31 @@ class GameState:
         elif move.pieceMoved == 'bK':
             self.blackKingLoc = (move.endRow, move.endCol)
 
-        # pawn promotion automatically upgrade to queen
+        # pawn promotion, upgrades to a queen unless another piece was chosen
         if move.isPawnPromotion:
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + 'Q'
+            promotedPiece = move.pieceMoved[0] + move.promotionPiece
+            self.board[move.endRow][move.endCol] = promotedPiece
+            bitboards.remove(move.pieceMoved, endSq)
+            bitboards.add(promotedPiece, endSq)
+            key ^= PIECE_KEYS[promotedPiece][endSq]
+            mg += PST_MG[promotedPiece][endSq]
+            eg += PST_EG[promotedPiece][endSq]
+            self.phase += PIECE_PHASE[promotedPiece]
+            self.pieceCounts[pieceMoved] -= 1
+            self.pieceCounts[promotedPiece] += 1
+        else:
+            key ^= PIECE_KEYS[pieceMoved][endSq]
+            mg += PST_MG[pieceMoved][endSq]
+            eg += PST_EG[pieceMoved][endSq]
+            if pieceMoved[1] == 'P':
+                pawnKey ^= PIECE_KEYS[pieceMoved][endSq]
 
         # en Passant move
         if move.isEnPassant:
             self.board[move.startRow][move.endCol] = '--'  # capture the pawn
         if move.pieceMoved[1] == 'P' and abs(move.startRow - move.endRow) == 2:  # can happen on 2 square advances
             self.possibleEnPassant = ((move.startRow + move.endRow) // 2, move.endCol)
+            key ^= EN_PASSANT_KEYS[move.endCol]
         else:
             self.possibleEnPassant = ()
 
@@ -55,18 +348,44 @@ class GameState:
             if move.endCol - move.startCol == 2:  # king side castle
                 self.board[move.endRow][move.endCol - 1] = self.board[move.endRow][move.endCol + 1]  # moves rook
                 self.board[move.endRow][move.endCol + 1] = '--'  # remove old rook
+                rook = self.board[move.endRow][move.endCol - 1]
+                bitboards.move(rook, endSq + 1, endSq - 1)
+                key ^= PIECE_KEYS[rook][endSq + 1] ^ PIECE_KEYS[rook][endSq - 1]
+                mg += PST_MG[rook][endSq - 1] - PST_MG[rook][endSq + 1]
+                eg += PST_EG[rook][endSq - 1] - PST_EG[rook][endSq + 1]
             else:  # queen side castle
                 self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 2]  # moves rook
                 self.board[move.endRow][move.endCol - 2] = '--'  # remove old rook
-
-        # castle rights (update on rook or king move)
-        self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRights(self.currCastleRights.wks, self.currCastleRights.bks,
-                                                 self.currCastleRights.wqs, self.currCastleRights.bqs))
+                rook = self.board[move.endRow][move.endCol + 1]
+                bitboards.move(rook, endSq - 2, endSq + 1)
+                key ^= PIECE_KEYS[rook][endSq - 2] ^ PIECE_KEYS[rook][endSq + 1]
+                mg += PST_MG[rook][endSq + 1] - PST_MG[rook][endSq - 2]
+                eg += PST_EG[rook][endSq + 1] - PST_EG[rook][endSq - 2]
+
+        # castle rights (update on rook or king move, or a rook captured on its starting square)
+        self.castleRights &= CASTLE_MASKS[startSq] & CASTLE_MASKS[endSq]
+        self.zobristKey = key ^ CASTLE_KEYS[self.castleRights]
+        self.pawnKey = pawnKey
+        self.mgScore = mg
+        self.egScore = eg
 
     def undo_move(self):
         if len(self.moveLog) != 0:  # make sure there is a move to undo (at least 1 move made)
             prevMove = self.moveLog.pop()
+            bitboards = self.bitboards
+            startSq = prevMove.startRow * 8 + prevMove.startCol
+            endSq = prevMove.endRow * 8 + prevMove.endCol
+            if prevMove.isPawnPromotion:
+                promotedPiece = self.board[prevMove.endRow][prevMove.endCol]
+                bitboards.remove(promotedPiece, endSq)
+                bitboards.add(prevMove.pieceMoved, endSq)
+                self.pieceCounts[promotedPiece] -= 1
+                self.pieceCounts[prevMove.pieceMoved] += 1
+            bitboards.move(prevMove.pieceMoved, endSq, startSq)
+            if prevMove.pieceCapt != '--':
+                self.pieceCounts[prevMove.pieceCapt] += 1
+                bitboards.add(prevMove.pieceCapt,
+                              prevMove.startRow * 8 + prevMove.endCol if prevMove.isEnPassant else endSq)
             self.board[prevMove.startRow][prevMove.startCol] = prevMove.pieceMoved
             self.board[prevMove.endRow][prevMove.endCol] = prevMove.pieceCapt
             self.whiteToMove = not self.whiteToMove
@@ -80,79 +399,227 @@ class GameState:
             if prevMove.isEnPassant:
                 self.board[prevMove.endRow][prevMove.endCol] = '--'  # makes the "landing" square blank
                 self.board[prevMove.startRow][prevMove.endCol] = prevMove.pieceCapt
-                self.possibleEnPassant = (prevMove.endRow, prevMove.endCol)
-
-            # undo 2 square pawn advance
-            if prevMove.pieceMoved[1] == 'P' and abs(prevMove.startRow - prevMove.endRow) == 2:
-                self.possibleEnPassant = ()
+            # restore the castle rights, en passant square, hashes and scores from before the move
+            record = self.undoStack[len(self.moveLog)]
+            self.castleRights = record[0]
+            self.possibleEnPassant = record[1]
+            self.zobristKey = record[2]
+            self.pawnKey = record[3]
+            self.mgScore = record[4]
+            self.egScore = record[5]
+            self.phase = record[6]
+            self.halfmoveClock = record[7]
+            self.fullmoveNumber = record[8]
 
             # undo castle
             if prevMove.isCastle:
                 if prevMove.endCol - prevMove.startCol == 2:  # kingside castle
                     self.board[prevMove.endRow][prevMove.endCol + 1] = self.board[prevMove.endRow][prevMove.endCol - 1]
                     self.board[prevMove.endRow][prevMove.endCol - 1] = '--'
+                    bitboards.move(self.board[prevMove.endRow][prevMove.endCol + 1], endSq - 1, endSq + 1)
                 else:  # queenside castle
                     self.board[prevMove.endRow][prevMove.endCol - 2] = self.board[prevMove.endRow][prevMove.endCol + 1]
                     self.board[prevMove.endRow][prevMove.endCol + 1] = '--'
+                    bitboards.move(self.board[prevMove.endRow][prevMove.endCol - 2], endSq + 1, endSq - 2)
+
+    """
+    Makes an independent copy of the game state, e.g. to hand a snapshot of the position to another thread
+    """
 
-            # undo castle rights
-            self.castleRightsLog.pop()  # remove castle rights from prevMove
-            currRights = self.castleRightsLog[-1]  # set current castle rights to last one in list
-            self.currCastleRights = CastleRights(currRights.wks, currRights.bks, currRights.wqs, currRights.bqs)
-
-    """
-    Updates the castle rights given the move
-    """
-
-    def updateCastleRights(self, move):
-        if move.pieceMoved == 'wK':  # if white king moves
-            self.currCastleRights.wks = False
-            self.currCastleRights.wqs = False
-        elif move.pieceMoved == 'bK':  # if black king moves
-            self.currCastleRights.bks = False
-            self.currCastleRights.bqs = False
-        elif move.pieceMoved == 'wR':  # if white rook moves
-            if move.startRow == 7:
-                if move.startCol == 0:  # left rook
-                    self.currCastleRights.wqs = False
-                if move.startCol == 7:  # right rook
-                    self.currCastleRights.wks = False
-        elif move.pieceMoved == 'bR':  # if black rook moves
-            if move.startRow == 0:
-                if move.startCol == 0:  # left rook
-                    self.currCastleRights.bqs = False
-                if move.startCol == 7:  # right rook
-                    self.currCastleRights.bks = False
-
-    def get_valid_moves(self):
-        tempEnPassant = self.possibleEnPassant
-        tempCastleRights = CastleRights(self.currCastleRights.wks, self.currCastleRights.bks,
-                                        self.currCastleRights.wqs, self.currCastleRights.bqs)
-        moves = self.get_all_moves()
+    def copy(self):
+        gs = GameState.__new__(GameState)
+        gs.__dict__.update(self.__dict__)
+        # everything make_move and undo_move change in place needs its own copy
+        gs.board = [row[:] for row in self.board]
+        gs.bitboards = self.bitboards.copy()
+        gs.moveLog = self.moveLog[:]
+        gs.undoStack = [record[:] for record in self.undoStack]
+        gs.pieceCounts = dict(self.pieceCounts)
+        return gs
+
+    """
+    Recomputes the zobrist key from scratch, used to verify the incremental key
+    """
+
+    def compute_zobrist_key(self):
+        return compute_key(self)
+
+    """
+    Gets all the legal moves for the player to move
+    pins, check rays and checkers are found once so only legal moves are kept
+    a list can be passed in to be cleared and reused instead of allocating a new one
+    targets limits the moves to those ending on its squares (e.g. to look up a move from its notation),
+    the checkmate and stalemate flags are only updated when all moves are generated
+    """
+
+    def get_valid_moves(self, moves=None, targets=FULL):
+        if moves is None:
+            moves = []
+        else:
+            del moves[:]
+        self.inCheck, self.pins, self.checks = self.check_for_pins_and_checks()
         if self.whiteToMove:
-            self.get_castle_moves(self.whiteKingLoc[0], self.whiteKingLoc[1], moves)
+            kingRow, kingCol = self.whiteKingLoc
         else:
-            self.get_castle_moves(self.blackKingLoc[0], self.blackKingLoc[1], moves)
-        for i in range(len(moves) - 1, -1, -1):
-            self.make_move(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            # if king would be in check, it is not a valid move
-            if self.in_check():
-                moves.remove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            self.undo_move()
+            kingRow, kingCol = self.blackKingLoc
+        kingTargets = self.get_king_targets(kingRow, kingCol, targets)
+        if len(self.checks) > 1:  # double check, only the king can move
+            self.get_king_moves(kingRow, kingCol, moves, kingTargets)
+        else:
+            checkMask = targets  # squares a piece can move to in order to stop a single check
+            if self.inCheck:
+                checkSq = self.checks[0][0] * 8 + self.checks[0][1]
+                # checks from sliders can also be blocked, for other pieces nothing is in between
+                checkMask &= BETWEEN[kingRow * 8 + kingCol][checkSq] | (1 << checkSq)
+            self.get_legal_piece_moves(checkMask, kingTargets, moves)
+            if not self.inCheck:
+                self.get_castle_moves(kingRow, kingCol, moves)
+        if targets != FULL:
+            # en passant and castle moves are generated whatever the targets so they are filtered here
+            moves[:] = [move for move in moves if targets >> (move.endRow * 8 + move.endCol) & 1]
+            return moves
         if len(moves) == 0:  # means it is either checkmate or stalemate
-            if self.in_check():
+            if self.inCheck:
                 self.checkMate = True
             else:
                 self.staleMate = True
         else:
             self.checkMate = False
             self.staleMate = False
-        self.possibleEnPassant = tempEnPassant
-        self.currCastleRights = tempCastleRights
         return moves
 
+    """
+    Gets only the legal captures and promotions (en passant included) of the player to move, for quiescence search
+    and the first stages of the search's staged move generation; a list can be passed in to be reused
+    """
+
+    def get_capture_moves(self, moves=None):
+        color, enemyColor = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        targets = self.bitboards.colors[enemyColor] | PROMOTION_SQUARES[color]
+        if self.possibleEnPassant != ():
+            targets |= 1 << (self.possibleEnPassant[0] * 8 + self.possibleEnPassant[1])
+        moves = self.get_valid_moves(moves, targets)
+        # the promotion and en passant squares are empty, so quiet moves of other pieces to them are dropped
+        moves[:] = [move for move in moves if move.pieceCapt != '--' or move.isPawnPromotion or move.isEnPassant]
+        return moves
+
+    """
+    Gets the legal moves that neither capture nor promote, castling included, the moves get_capture_moves leaves
+    out; a list can be passed in to be reused
+    """
+
+    def get_quiet_moves(self, moves=None):
+        moves = self.get_valid_moves(moves, ~self.bitboards.occupied & FULL)
+        moves[:] = [move for move in moves if not move.isPawnPromotion and not move.isEnPassant]
+        return moves
+
+    """
+    Adds the legal moves of every piece of the player to move to the list
+    checkMask restricts non king moves to squares that stop a single check, kingTargets are the safe king squares
+    """
+
+    def get_legal_piece_moves(self, checkMask, kingTargets, moves):
+        kingSq = self.whiteKingLoc[0] * 8 + self.whiteKingLoc[1] if self.whiteToMove else \
+            self.blackKingLoc[0] * 8 + self.blackKingLoc[1]
+        pinMasks = {}
+        for pin in self.pins:  # pinned pieces can only move along the line through the king and the pinner
+            pinSq = pin[0] * 8 + pin[1]
+            pinMasks[pinSq] = LINE[kingSq][pinSq]
+        for sq in squares(self.bitboards.colors['w' if self.whiteToMove else 'b']):
+            row, col = divmod(sq, 8)
+            pieceType = self.board[row][col][1]
+            if pieceType == 'K':
+                self.get_king_moves(row, col, moves, kingTargets)
+            elif pieceType == 'P' and self.possibleEnPassant != ():
+                first = len(moves)
+                self.get_pawn_moves(row, col, moves, checkMask & pinMasks.get(sq, FULL))
+                for i in range(len(moves) - 1, first - 1, -1):
+                    # en passant removes two pieces from the board so it is verified by making the move
+                    if moves[i].isEnPassant and not self.en_passant_is_legal(moves[i]):
+                        del moves[i]
+            else:
+                self.moveFunctions[pieceType](self, row, col, moves, checkMask & pinMasks.get(sq, FULL))
+
+    """
+    Gets a bitboard of the squares the king at (row, col) can step to without being attacked, only squares in
+    targets are looked at
+    the king is taken off the board first so sliders checking it also cover the squares behind it
+    """
+
+    def get_king_targets(self, row, col, targets=FULL):
+        bitboards = self.bitboards
+        color, enemyColor = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        kingSq = row * 8 + col
+        occupied = bitboards.occupied & ~(1 << kingSq)
+        safe = 0
+        for sq in squares(KING_ATTACKS[kingSq] & ~bitboards.colors[color] & targets):
+            if not bitboards.is_attacked(sq, enemyColor, occupied):
+                safe |= 1 << sq
+        return safe
+
+    """
+    Makes and undoes an en passant capture to see if it leaves the king in check
+    """
+
+    def en_passant_is_legal(self, move):
+        self.make_move(move)
+        self.whiteToMove = not self.whiteToMove
+        legal = not self.in_check()
+        self.whiteToMove = not self.whiteToMove
+        self.undo_move()
+        return legal
+
+    """
+    Looks along the lines through the king (or through (row, col) if given) for pins and checks
+    returns if the square is in check, a list of pins and a list of checks
+    each pin and check is stored as (row, col, dirRow, dirCol) with the direction pointing away from the king
+    """
+
+    def check_for_pins_and_checks(self, row=None, col=None):
+        pins = []
+        checks = []
+        if self.whiteToMove:
+            enemyColor, allyColor = 'b', 'w'
+            startRow, startCol = self.whiteKingLoc
+        else:
+            enemyColor, allyColor = 'w', 'b'
+            startRow, startCol = self.blackKingLoc
+        if row is not None:
+            startRow, startCol = row, col
+        startSq = startRow * 8 + startCol
+        pieces = self.bitboards.pieces
+        # the king itself never blocks a line
+        occupied = self.bitboards.occupied & ~pieces[allyColor + 'K']
+        queens = pieces[enemyColor + 'Q']
+        # sliders that would attack the square on an empty board either check, pin or are blocked
+        snipers = (rook_attacks(startSq, 0) & (pieces[enemyColor + 'R'] | queens)) | \
+                  (bishop_attacks(startSq, 0) & (pieces[enemyColor + 'B'] | queens))
+        for sniperSq in squares(snipers):
+            blockers = BETWEEN[startSq][sniperSq] & occupied
+            if not blockers:
+                checks.append(self.get_line_to(startRow, startCol, sniperSq))
+            elif blockers & (blockers - 1) == 0 and blockers & self.bitboards.colors[allyColor]:
+                # a single allied piece in between is pinned
+                pins.append(self.get_line_to(startRow, startCol, (blockers & -blockers).bit_length() - 1))
+        # knights jump so they can only check, never pin
+        for sq in squares(KNIGHT_ATTACKS[startSq] & pieces[enemyColor + 'N']):
+            checks.append((sq // 8, sq % 8, sq // 8 - startRow, sq % 8 - startCol))
+        for sq in squares((PAWN_ATTACKS[allyColor][startSq] & pieces[enemyColor + 'P']) |
+                          (KING_ATTACKS[startSq] & pieces[enemyColor + 'K'])):
+            checks.append(self.get_line_to(startRow, startCol, sq))
+        return len(checks) > 0, pins, checks
+
+    """
+    Gets (row, col, dirRow, dirCol) for the square sq where the direction is the step from (row, col) towards it
+    """
+
+    @staticmethod
+    def get_line_to(row, col, sq):
+        endRow, endCol = divmod(sq, 8)
+        dirRow = (endRow > row) - (endRow < row)
+        dirCol = (endCol > col) - (endCol < col)
+        return endRow, endCol, dirRow, dirCol
+
     """
     Determines if player is in check
     """
@@ -168,191 +635,159 @@ class GameState:
     """
 
     def square_in_attack(self, row, col):
-        # switch players turn to look at the opponents moves
-        self.whiteToMove = not self.whiteToMove
-        oppMoves = self.get_all_moves()
-        self.whiteToMove = not self.whiteToMove  # switch turn back to player
-        for move in oppMoves:
-            if move.endRow == row and move.endCol == col:  # (row, col) square is under attack
-                return True
-        return False
+        return self.is_square_attacked(row, col, 'b' if self.whiteToMove else 'w')
+
+    """
+    Determines if any piece of the given color ('w' or 'b') attacks the (row, col) position
+    looks up attacks from the square so no moves are generated and the game state is not changed
+    """
 
-    def get_all_moves(self):
-        moves = []
-        for row in range(len(self.board)):
-            for col in range(len(self.board[row])):
-                turn = self.board[row][col][0]
-                if (turn == 'w' and self.whiteToMove) or (turn == 'b' and not self.whiteToMove):
-                    piece = self.board[row][col][1]
-                    if piece == 'P':
-                        self.get_pawn_moves(row, col, moves)
-                    if piece == 'R':
-                        self.get_rook_moves(row, col, moves)
-                    if piece == 'N':
-                        self.get_knight_moves(row, col, moves)
-                    if piece == 'B':
-                        self.get_bishop_moves(row, col, moves)
-                    if piece == 'Q':
-                        self.get_queen_moves(row, col, moves)
-                    if piece == 'K':
-                        self.get_king_moves(row, col, moves)
+    def is_square_attacked(self, row, col, color):
+        return self.bitboards.is_attacked(row * 8 + col, color)
+
+    """
+    Gets the coordinates of every piece of the given color that attacks the (row, col) position
+    """
+
+    def get_attackers(self, row, col, color):
+        return [divmod(sq, 8) for sq in squares(self.bitboards.attackers_to(row * 8 + col, color))]
+
+    """
+    Builds an 8x8 attack map with the number of pieces of the given color attacking each square
+    """
+
+    def get_attack_map(self, color):
+        bitboards = self.bitboards
+        attackMap = [[0] * 8 for _ in range(8)]
+        for pieceType in 'PNBRQK':
+            piece = color + pieceType
+            for sq in squares(bitboards.pieces[piece]):
+                for target in squares(bitboards.piece_attacks(piece, sq)):
+                    attackMap[target // 8][target % 8] += 1
+        return attackMap
+
+    def get_all_moves(self, moves=None):
+        if moves is None:
+            moves = []
+        else:
+            del moves[:]
+        for sq in squares(self.bitboards.colors['w' if self.whiteToMove else 'b']):
+            row, col = divmod(sq, 8)
+            self.moveFunctions[self.board[row][col][1]](self, row, col, moves)
         return moves
 
+    """
+    Adds a move from (row, col) to every square in the targets bitboard
+    """
+
+    def add_moves(self, row, col, targets, moves):
+        board = self.board
+        for sq in squares(targets):
+            moves.append(Move((row, col), divmod(sq, 8), board))
+
     """
     Gets all the pawn moves for the pawn at the given coordinates and add the moves to the list
+    targets limits the end squares of every move except en passant (used for pins and checks)
     """
 
-    def get_pawn_moves(self, row, col, moves):
+    def get_pawn_moves(self, row, col, moves, targets=FULL):
+        bitboards = self.bitboards
+        sq = row * 8 + col
         if self.whiteToMove:  # white pawn moves
-            if self.board[row - 1][col] == "--":  # move one square
-                moves.append(Move((row, col), (row - 1, col), self.board))
-                if row == 6 and self.board[row - 2][col] == "--":  # move two square
-                    moves.append(Move((row, col), (row - 2, col), self.board))
-            if col - 1 >= 0:
-                if self.board[row - 1][col - 1][0] == 'b':  # capture to left diagonal
-                    moves.append(Move((row, col), (row - 1, col - 1), self.board))
-                elif (row - 1, col - 1) == self.possibleEnPassant:
-                    moves.append(Move((row, col), (row - 1, col - 1), self.board, isEnPassantMove=True))
-            if col + 1 <= 7:
-                if self.board[row - 1][col + 1][0] == 'b':  # capture to right diagonal
-                    moves.append(Move((row, col), (row - 1, col + 1), self.board))
-                elif (row - 1, col + 1) == self.possibleEnPassant:
-                    moves.append(Move((row, col), (row - 1, col + 1), self.board, isEnPassantMove=True))
+            color, enemyColor, step, startRow, lastRow = 'w', 'b', -8, 6, 1
         else:  # black pawn moves
-            if self.board[row + 1][col] == '--':  # move one square
-                moves.append(Move((row, col), (row + 1, col), self.board))
-                if row == 1 and self.board[row + 2][col] == '--':  # move two squares
-                    moves.append(Move((row, col), (row + 2, col), self.board))
-            if col - 1 >= 0:
-                if self.board[row + 1][col - 1][0] == 'w':  # capture to left diagonal
-                    moves.append(Move((row, col), (row + 1, col - 1), self.board))
-                elif (row + 1, col - 1) == self.possibleEnPassant:
-                    moves.append(Move((row, col), (row + 1, col - 1), self.board, isEnPassantMove=True))
-            if col + 1 <= 7:
-                if self.board[row + 1][col + 1][0] == 'w':  # capture to right diagonal
-                    moves.append(Move((row, col), (row + 1, col + 1), self.board))
-                elif (row + 1, col + 1) == self.possibleEnPassant:
-                    moves.append(Move((row, col), (row + 1, col + 1), self.board, isEnPassantMove=True))
+            color, enemyColor, step, startRow, lastRow = 'b', 'w', 8, 1, 6
+        oneStep = sq + step
+        attacks = PAWN_ATTACKS[color][sq]
+        if row == lastRow:  # every move from the row before the last promotes
+            endSquares = attacks & bitboards.colors[enemyColor]
+            if not bitboards.occupied >> oneStep & 1:
+                endSquares |= 1 << oneStep
+            for endSq in squares(endSquares & targets):
+                for promotionPiece in 'QRBN':  # queen first so it is the default choice
+                    moves.append(Move((row, col), divmod(endSq, 8), self.board, promotionPiece=promotionPiece))
+            return
+        if not bitboards.occupied >> oneStep & 1:  # move one square
+            if targets >> oneStep & 1:
+                moves.append(Move((row, col), divmod(oneStep, 8), self.board))
+            twoStep = oneStep + step
+            # move two squares
+            if row == startRow and not bitboards.occupied >> twoStep & 1 and targets >> twoStep & 1:
+                moves.append(Move((row, col), divmod(twoStep, 8), self.board))
+        self.add_moves(row, col, attacks & bitboards.colors[enemyColor] & targets, moves)  # diagonal captures
+        if self.possibleEnPassant != ():
+            epSq = self.possibleEnPassant[0] * 8 + self.possibleEnPassant[1]
+            if attacks >> epSq & 1:
+                moves.append(Move((row, col), self.possibleEnPassant, self.board, isEnPassantMove=True))
 
     """
     Gets all the rook moves for the rook at the given coordinates and add the moves to the list
     """
 
-    def get_rook_moves(self, row, col, moves):
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1))  # rooks can move in straight lines each way
-        friendlyColor = 'w' if self.whiteToMove else 'b'  # used to make it so same color cant capture same color
-        for d in directions:
-            for i in range(1, 8):
-                endRow = row + d[0] * i
-                endCol = col + d[1] * i
-                if 0 <= endRow <= 7 and 0 <= endCol <= 7:  # makes sure its on the board
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece == '--':  # can move to end if spot is empty
-                        moves.append(Move((row, col), (endRow, endCol), self.board))
-                    elif endPiece[0] != friendlyColor:  # can capture enemy piece
-                        moves.append(Move((row, col), (endRow, endCol), self.board))
-                        break
-                    else:  # can not stack friendly pieces -> do nothing
-                        break
-                else:  # we do not need to look at spaces off the board
-                    break
+    def get_rook_moves(self, row, col, moves, targets=FULL):
+        friendly = self.bitboards.colors['w' if self.whiteToMove else 'b']  # same color cant capture same color
+        attacks = rook_attacks(row * 8 + col, self.bitboards.occupied)
+        self.add_moves(row, col, attacks & ~friendly & targets, moves)
 
     """
     Gets all the knight moves for the knight at the given coordinates and add the moves to the list
     """
 
-    def get_knight_moves(self, row, col, moves):
-        friendlyColor = 'w' if self.whiteToMove else 'b'  # used to make it so same color cant capture same color
-        if row - 1 >= 0 and col - 2 >= 0 and self.board[row - 1][col - 2][0] != friendlyColor:
-            moves.append(Move((row, col), (row - 1, col - 2), self.board))
-        if row - 2 >= 0 and col - 1 >= 0 and self.board[row - 2][col - 1][0] != friendlyColor:
-            moves.append(Move((row, col), (row - 2, col - 1), self.board))
-        if row - 2 >= 0 and col + 1 <= 7 and self.board[row - 2][col + 1][0] != friendlyColor:
-            moves.append(Move((row, col), (row - 2, col + 1), self.board))
-        if row - 1 >= 0 and col + 2 <= 7 and self.board[row - 1][col + 2][0] != friendlyColor:
-            moves.append(Move((row, col), (row - 1, col + 2), self.board))
-        if row + 1 <= 7 and col + 2 <= 7 and self.board[row + 1][col + 2][0] != friendlyColor:
-            moves.append(Move((row, col), (row + 1, col + 2), self.board))
-        if row + 2 <= 7 and col + 1 <= 7 and self.board[row + 2][col + 1][0] != friendlyColor:
-            moves.append(Move((row, col), (row + 2, col + 1), self.board))
-        if row + 2 <= 7 and col - 1 >= 0 and self.board[row + 2][col - 1][0] != friendlyColor:
-            moves.append(Move((row, col), (row + 2, col - 1), self.board))
-        if row + 1 <= 7 and col - 2 >= 0 and self.board[row + 1][col - 2][0] != friendlyColor:
-            moves.append(Move((row, col), (row + 1, col - 2), self.board))
+    def get_knight_moves(self, row, col, moves, targets=FULL):
+        friendly = self.bitboards.colors['w' if self.whiteToMove else 'b']  # same color cant capture same color
+        self.add_moves(row, col, KNIGHT_ATTACKS[row * 8 + col] & ~friendly & targets, moves)
 
     """
     Gets all the bishop moves for the bishop at the given coordinates and add the moves to the list
     """
 
-    def get_bishop_moves(self, row, col, moves):
-        directions = ((-1, -1), (-1, 1), (1, 1), (1, -1))  # bishops can move on the diagonals each way
-        friendlyColor = 'w' if self.whiteToMove else 'b'  # used to make it so same color cant capture same color
-        for d in directions:
-            for i in range(1, 8):
-                endRow = row + d[0] * i
-                endCol = col + d[1] * i
-                if 0 <= endRow <= 7 and 0 <= endCol <= 7:  # makes sure its on the board
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece == '--':  # can move to end if spot is empty
-                        moves.append(Move((row, col), (endRow, endCol), self.board))
-                    elif endPiece[0] != friendlyColor:  # can capture enemy piece
-                        moves.append(Move((row, col), (endRow, endCol), self.board))
-                        break
-                    else:  # can not stack friendly pieces -> do nothing
-                        break
-                else:  # we do not need to look at spaces off the board
-                    break
+    def get_bishop_moves(self, row, col, moves, targets=FULL):
+        friendly = self.bitboards.colors['w' if self.whiteToMove else 'b']  # same color cant capture same color
+        attacks = bishop_attacks(row * 8 + col, self.bitboards.occupied)
+        self.add_moves(row, col, attacks & ~friendly & targets, moves)
 
     """
     Gets all the queen moves for the queen at the given coordinates and add the moves to the list
     """
 
-    def get_queen_moves(self, row, col, moves):
+    def get_queen_moves(self, row, col, moves, targets=FULL):
         # the queen's moves are just the sum of the rook and bishop moves
-        self.get_rook_moves(row, col, moves)
-        self.get_bishop_moves(row, col, moves)
+        self.get_rook_moves(row, col, moves, targets)
+        self.get_bishop_moves(row, col, moves, targets)
 
     """
     Gets all the king moves for the king at the given coordinates and add the moves to the list
     """
 
-    def get_king_moves(self, row, col, moves):
-        friendlyColor = 'w' if self.whiteToMove else 'b'  # used to make it so same color cant capture same color
-        if row - 1 >= 0 and col - 1 >= 0 and self.board[row - 1][col - 1][0] != friendlyColor:
-            moves.append(Move((row, col), (row - 1, col - 1), self.board))
-        if row - 1 >= 0 and self.board[row - 1][col][0] != friendlyColor:
-            moves.append(Move((row, col), (row - 1, col), self.board))
-        if row - 1 >= 0 and col + 1 <= 7 and self.board[row - 1][col + 1][0] != friendlyColor:
-            moves.append(Move((row, col), (row - 1, col + 1), self.board))
-        if col + 1 <= 7 and self.board[row][col + 1][0] != friendlyColor:
-            moves.append(Move((row, col), (row, col + 1), self.board))
-        if row + 1 <= 7 and col + 1 <= 7 and self.board[row + 1][col + 1][0] != friendlyColor:
-            moves.append(Move((row, col), (row + 1, col + 1), self.board))
-        if row + 1 <= 7 and self.board[row + 1][col][0] != friendlyColor:
-            moves.append(Move((row, col), (row + 1, col), self.board))
-        if row + 1 <= 7 and col - 1 >= 0 and self.board[row + 1][col - 1][0] != friendlyColor:
-            moves.append(Move((row, col), (row + 1, col - 1), self.board))
-        if col - 1 >= 0 and self.board[row][col - 1][0] != friendlyColor:
-            moves.append(Move((row, col), (row, col - 1), self.board))
+    def get_king_moves(self, row, col, moves, targets=FULL):
+        friendly = self.bitboards.colors['w' if self.whiteToMove else 'b']  # same color cant capture same color
+        self.add_moves(row, col, KING_ATTACKS[row * 8 + col] & ~friendly & targets, moves)
 
     def get_castle_moves(self, row, col, moves):
         if self.square_in_attack(row, col):  # can not castle while in check
             return
-        if (self.whiteToMove and self.currCastleRights.wks) or (not self.whiteToMove and self.currCastleRights.bks):
+        if self.castleRights & (WKS if self.whiteToMove else BKS):
             self.king_side_castle_moves(row, col, moves)
-        if (self.whiteToMove and self.currCastleRights.wqs) or (not self.whiteToMove and self.currCastleRights.bqs):
+        if self.castleRights & (WQS if self.whiteToMove else BQS):
             self.queen_side_castle_moves(row, col, moves)
 
     def king_side_castle_moves(self, row, col, moves):
-        if self.board[row][col + 1] == '--' and self.board[row][col + 2] == '--':
+        rook = ('w' if self.whiteToMove else 'b') + 'R'
+        if self.board[row][col + 1] == '--' and self.board[row][col + 2] == '--' and self.board[row][col + 3] == rook:
             if not self.square_in_attack(row, col + 1) and not self.square_in_attack(row, col + 2):
                 moves.append(Move((row, col), (row, col + 2), self.board, isCastle=True))
 
     def queen_side_castle_moves(self, row, col, moves):
-        if self.board[row][col - 1] == '--' and self.board[row][col - 2] and self.board[row][col - 3] == '--':
+        rook = ('w' if self.whiteToMove else 'b') + 'R'
+        if self.board[row][col - 1] == '--' and self.board[row][col - 2] == '--' and self.board[row][col - 3] == '--' \
+                and self.board[row][col - 4] == rook:
             if not self.square_in_attack(row, col - 1) and not self.square_in_attack(row, col - 2):
                 moves.append(Move((row, col), (row, col - 2), self.board, isCastle=True))
 
+    # maps each piece type to the function that generates its moves
+    moveFunctions = {'P': get_pawn_moves, 'R': get_rook_moves, 'N': get_knight_moves,
+                     'B': get_bishop_moves, 'Q': get_queen_moves, 'K': get_king_moves}
+
 
 class CastleRights:
     def __init__(self, wks, bks, wqs, bqs):
@@ -363,35 +798,47 @@ class CastleRights:
 
 
 class Move:
+    # moves are created by the thousand during search so they keep fixed attributes instead of a __dict__
+    __slots__ = ('startRow', 'startCol', 'endRow', 'endCol', 'pieceMoved', 'pieceCapt', 'isPawnPromotion',
+                 'promotionPiece', 'isEnPassant', 'isCastle', 'moveId')
+
     # allows us to use chess notation
     ranksToRow = {'1': 7, '2': 6, '3': 5, '4': 4, '5': 3, '6': 2, '7': 1, '8': 0}
     rowsToRanks = {v: k for k, v in ranksToRow.items()}
     filesToCols = {'a': 0, 'b': 1, 'c': 2, 'd': 3, 'e': 4, 'f': 5, 'g': 6, 'h': 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
 
-    def __init__(self, startSq, endSq, board, isEnPassantMove=False, isCastle=False):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCapt = board[self.endRow][self.endCol]
+    # flag bits of the packed 16 bit encoding, the low 12 bits hold the start and end squares
+    # and the top 2 bits the promotion piece
+    EN_PASSANT_FLAG = 1 << 12
+    CASTLE_FLAG = 1 << 13
+    promotionPieces = 'QRBN'
+
+    def __init__(self, startSq, endSq, board, isEnPassantMove=False, isCastle=False, promotionPiece='Q'):
+        self.startRow = startRow = startSq[0]
+        self.startCol = startCol = startSq[1]
+        self.endRow = endRow = endSq[0]
+        self.endCol = endCol = endSq[1]
+        self.pieceMoved = pieceMoved = board[startRow][startCol]
 
         # pawn promotion
-        self.isPawnPromotion = False
-        if (self.pieceMoved == 'wP' and self.endRow == 0) or (self.pieceMoved == 'bP' and self.endRow == 7):
-            self.isPawnPromotion = True
+        self.isPawnPromotion = (pieceMoved == 'wP' and endRow == 0) or (pieceMoved == 'bP' and endRow == 7)
+        self.promotionPiece = promotionPiece if self.isPawnPromotion else None
 
         # en passant
         self.isEnPassant = isEnPassantMove
-        if self.isEnPassant:
-            self.pieceCapt = 'wP' if self.pieceMoved == 'bP' else 'bP'  # set pawn to captured
+        if isEnPassantMove:
+            self.pieceCapt = 'wP' if pieceMoved == 'bP' else 'bP'  # set pawn to captured
+        else:
+            self.pieceCapt = board[endRow][endCol]
 
         # castle move
         self.isCastle = isCastle
 
         # given the current gamestate we give each move a unique Id
-        self.moveId = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+        self.moveId = startRow * 1000 + startCol * 100 + endRow * 10 + endCol
+        if self.isPawnPromotion and promotionPiece != 'Q':  # under promotions get their own ids
+            self.moveId += 10000 * self.promotionPieces.index(promotionPiece)
 
     """
     Override the equals method
@@ -402,6 +849,34 @@ class Move:
             return self.moveId == other.moveId
         return False
 
+    def __hash__(self):
+        return self.moveId
+
+    """
+    Packs the move into a 16 bit int: start square, end square (row * 8 + col) and the special move flags
+    the pieces are left out since they can be read back from the board the move is played on
+    """
+
+    def encode(self):
+        packed = (self.startRow * 8 + self.startCol) | (self.endRow * 8 + self.endCol) << 6
+        if self.isEnPassant:
+            packed |= Move.EN_PASSANT_FLAG
+        if self.isCastle:
+            packed |= Move.CASTLE_FLAG
+        if self.isPawnPromotion:
+            packed |= self.promotionPieces.index(self.promotionPiece) << 14
+        return packed
+
+    """
+    Rebuilds a move from its packed 16 bit form for the given board
+    """
+
+    @staticmethod
+    def decode(packed, board):
+        return Move(divmod(packed & 63, 8), divmod(packed >> 6 & 63, 8), board,
+                    isEnPassantMove=bool(packed & Move.EN_PASSANT_FLAG), isCastle=bool(packed & Move.CASTLE_FLAG),
+                    promotionPiece=Move.promotionPieces[packed >> 14])
+
     def get_chess_notation(self):
         return self.get_rank_file(self.startRow, self.startCol) + self.get_rank_file(self.endRow, self.endCol)
 
@@ -0,0 +1,514 @@
+"""
+Static evaluation of chess positions
+material and piece-square tables are tapered between a middlegame and an endgame score by the material left
+on the board, GameState keeps both sums up to date in make_move/undo_move so they are never rescanned
+pawn structure is cached in a pawn hash table keyed by the pawn-only zobrist key, king safety is scored on top
+evaluate_many scores large sets of positions at once and uses NumPy when it is installed, NumPy is only imported
+the first time it is called since importing it takes longer than loading the whole engine
+"""
+from array import array
+
+from chess_bitboard import Bitboards, PIECES, KING_ATTACKS, KNIGHT_ATTACKS, squares, popcount, lsb, \
+    rook_attacks, bishop_attacks, queen_attacks
+from chess_zobrist import pawn_key
+
+MATERIAL_MG = {'P': 82, 'N': 337, 'B': 365, 'R': 477, 'Q': 1025, 'K': 0}
+MATERIAL_EG = {'P': 94, 'N': 281, 'B': 297, 'R': 512, 'Q': 936, 'K': 0}
+# how much each piece counts towards the middlegame, 24 with all pieces on the board and 0 with only pawns
+PHASE_WEIGHTS = {'P': 0, 'N': 1, 'B': 1, 'R': 2, 'Q': 4, 'K': 0}
+MAX_PHASE = 24
+
+# piece-square tables from white's point of view, listed from a8 to h1 like GameState.board
+_PST_MG = {
+    'P': (0, 0, 0, 0, 0, 0, 0, 0,
+          98, 134, 61, 95, 68, 126, 34, -11,
+          -6, 7, 26, 31, 65, 56, 25, -20,
+          -14, 13, 6, 21, 23, 12, 17, -23,
+          -27, -2, -5, 12, 17, 6, 10, -25,
+          -26, -4, -4, -10, 3, 3, 33, -12,
+          -35, -1, -20, -23, -15, 24, 38, -22,
+          0, 0, 0, 0, 0, 0, 0, 0),
+    'N': (-167, -89, -34, -49, 61, -97, -15, -107,
+          -73, -41, 72, 36, 23, 62, 7, -17,
+          -47, 60, 37, 65, 84, 129, 73, 44,
+          -9, 17, 19, 53, 37, 69, 18, 22,
+          -13, 4, 16, 13, 28, 19, 21, -8,
+          -23, -9, 12, 10, 19, 17, 25, -16,
+          -29, -53, -12, -3, -1, 18, -14, -19,
+          -105, -21, -58, -33, -17, -28, -19, -23),
+    'B': (-29, 4, -82, -37, -25, -42, 7, -8,
+          -26, 16, -18, -13, 30, 59, 18, -47,
+          -16, 37, 43, 40, 35, 50, 37, -2,
+          -4, 5, 19, 50, 37, 37, 7, -2,
+          -6, 13, 13, 26, 34, 12, 10, 4,
+          0, 15, 15, 15, 14, 27, 18, 10,
+          4, 15, 16, 0, 7, 21, 33, 1,
+          -33, -3, -14, -21, -13, -12, -39, -21),
+    'R': (32, 42, 32, 51, 63, 9, 31, 43,
+          27, 32, 58, 62, 80, 67, 26, 44,
+          -5, 19, 26, 36, 17, 45, 61, 16,
+          -24, -11, 7, 26, 24, 35, -8, -20,
+          -36, -26, -12, -1, 9, -7, 6, -23,
+          -45, -25, -16, -17, 3, 0, -5, -33,
+          -44, -16, -20, -9, -1, 11, -6, -71,
+          -19, -13, 1, 17, 16, 7, -37, -26),
+    'Q': (-28, 0, 29, 12, 59, 44, 43, 45,
+          -24, -39, -5, 1, -16, 57, 28, 54,
+          -13, -17, 7, 8, 29, 56, 47, 57,
+          -27, -27, -16, -16, -1, 17, -2, 1,
+          -9, -26, -9, -10, -2, -4, 3, -3,
+          -14, 2, -11, -2, -5, 2, 14, 5,
+          -35, -8, 11, 2, 8, 15, -3, 1,
+          -1, -18, -9, 10, -15, -25, -31, -50),
+    'K': (-65, 23, 16, -15, -56, -34, 2, 13,
+          29, -1, -20, -7, -8, -4, -38, -29,
+          -9, 24, 2, -16, -20, 6, 22, -22,
+          -17, -20, -12, -27, -30, -25, -14, -36,
+          -49, -1, -27, -39, -46, -44, -33, -51,
+          -14, -14, -22, -46, -44, -30, -15, -27,
+          1, 7, -8, -64, -43, -16, 9, 8,
+          -15, 36, 12, -54, 8, -28, 24, 14),
+}
+_PST_EG = {
+    'P': (0, 0, 0, 0, 0, 0, 0, 0,
+          178, 173, 158, 134, 147, 132, 165, 187,
+          94, 100, 85, 67, 56, 53, 82, 84,
+          32, 24, 13, 5, -2, 4, 17, 17,
+          13, 9, -3, -7, -7, -8, 3, -1,
+          4, 7, -6, 1, 0, -5, -1, -8,
+          13, 8, 8, 10, 13, 0, 2, -7,
+          0, 0, 0, 0, 0, 0, 0, 0),
+    'N': (-58, -38, -13, -28, -31, -27, -63, -99,
+          -25, -8, -25, -2, -9, -25, -24, -52,
+          -24, -20, 10, 9, -1, -9, -19, -41,
+          -17, 3, 22, 22, 22, 11, 8, -18,
+          -18, -6, 16, 25, 16, 17, 4, -18,
+          -23, -3, -1, 15, 10, -3, -20, -22,
+          -42, -20, -10, -5, -2, -20, -23, -44,
+          -29, -51, -23, -15, -22, -18, -50, -64),
+    'B': (-14, -21, -11, -8, -7, -9, -17, -24,
+          -8, -4, 7, -12, -3, -13, -4, -14,
+          2, -8, 0, -1, -2, 6, 0, 4,
+          -3, 9, 12, 9, 14, 10, 3, 2,
+          -6, 3, 13, 19, 7, 10, -3, -9,
+          -12, -3, 8, 10, 13, 3, -7, -15,
+          -14, -18, -7, -1, 4, -9, -15, -27,
+          -23, -9, -23, -5, -9, -16, -5, -17),
+    'R': (13, 10, 18, 15, 12, 12, 8, 5,
+          11, 13, 13, 11, -3, 3, 8, 3,
+          7, 7, 7, 5, 4, -3, -5, -3,
+          4, 3, 13, 1, 2, 1, -1, 2,
+          3, 5, 8, 4, -5, -6, -8, -11,
+          -4, 0, -5, -1, -7, -12, -8, -16,
+          -6, -6, 0, 2, -9, -9, -11, -3,
+          -9, 2, 3, -1, -5, -13, 4, -20),
+    'Q': (-9, 22, 22, 27, 27, 19, 10, 20,
+          -17, 20, 32, 41, 58, 25, 30, 0,
+          -20, 6, 9, 49, 47, 35, 19, 9,
+          3, 22, 24, 45, 57, 40, 57, 36,
+          -18, 28, 19, 47, 31, 34, 39, 23,
+          -16, -27, 15, 6, 9, 17, 10, 5,
+          -22, -23, -30, -16, -16, -23, -36, -32,
+          -33, -28, -22, -43, -5, -32, -20, -41),
+    'K': (-74, -35, -18, -18, -11, 15, 4, -17,
+          -12, 17, 14, 17, 17, 38, 23, 11,
+          10, 17, 23, 15, 20, 45, 44, 13,
+          -8, 22, 24, 27, 26, 33, 26, 3,
+          -18, -4, 21, 24, 27, 23, 9, -11,
+          -19, -3, 11, 21, 23, 16, 7, -9,
+          -27, -11, 4, 13, 14, 4, -5, -17,
+          -53, -34, -21, -11, -28, -14, -24, -43),
+}
+
+
+def _signed_tables(material, pst):
+    # material plus the square bonus for every piece, positive for white and negative for black
+    # black looks up the square mirrored vertically (sq ^ 56)
+    tables = {}
+    for piece in PIECES:
+        pieceType = piece[1]
+        if piece[0] == 'w':
+            tables[piece] = [material[pieceType] + pst[pieceType][sq] for sq in range(64)]
+        else:
+            tables[piece] = [-(material[pieceType] + pst[pieceType][sq ^ 56]) for sq in range(64)]
+    return tables
+
+
+# PST_MG[piece][sq] and PST_EG[piece][sq] are what the piece on sq adds to the score from white's point of view
+PST_MG = _signed_tables(MATERIAL_MG, _PST_MG)
+PST_EG = _signed_tables(MATERIAL_EG, _PST_EG)
+PIECE_PHASE = {piece: PHASE_WEIGHTS[piece[1]] for piece in PIECES}
+
+# pawn structure terms as (middlegame, endgame)
+DOUBLED_PAWN = (-10, -20)  # for each extra pawn on a file
+ISOLATED_PAWN = (-12, -15)
+# passed pawn bonus by how many rows the pawn has advanced from its starting rank
+PASSED_PAWN_MG = (0, 5, 10, 15, 25, 40, 60, 0)
+PASSED_PAWN_EG = (0, 10, 20, 35, 60, 90, 130, 0)
+# king safety, middlegame only
+SHIELD_NEAR = 12  # for each own pawn on the three squares right in front of the king
+SHIELD_FAR = 6  # for each own pawn two rows in front of the king
+ATTACK_WEIGHTS = {'N': 2, 'B': 2, 'R': 3, 'Q': 5}
+
+
+def _file_masks():
+    files = []
+    for col in range(8):
+        bb = 0
+        for row in range(8):
+            bb |= 1 << (row * 8 + col)
+        files.append(bb)
+    return files
+
+
+FILE_MASKS = _file_masks()
+ADJACENT_FILES = [(FILE_MASKS[col - 1] if col > 0 else 0) | (FILE_MASKS[col + 1] if col < 7 else 0)
+                  for col in range(8)]
+
+
+def _front_masks(color, width):
+    # squares in front of each square (towards row 0 for white) on its own file and, for width 1, the adjacent ones
+    masks = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        rows = range(row) if color == 'w' else range(row + 1, 8)
+        bb = 0
+        for r in rows:
+            for c in range(max(col - width, 0), min(col + width, 7) + 1):
+                bb |= 1 << (r * 8 + c)
+        masks.append(bb)
+    return masks
+
+
+# a pawn is passed when no enemy pawn stands in PASSED_MASKS[color][sq]
+PASSED_MASKS = {'w': _front_masks('w', 1), 'b': _front_masks('b', 1)}
+
+
+def _shield_masks(color, distance):
+    masks = []
+    step = -distance if color == 'w' else distance
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        bb = 0
+        if 0 <= row + step <= 7:
+            for c in range(max(col - 1, 0), min(col + 1, 7) + 1):
+                bb |= 1 << ((row + step) * 8 + c)
+        masks.append(bb)
+    return masks
+
+
+SHIELD_NEAR_MASKS = {'w': _shield_masks('w', 1), 'b': _shield_masks('b', 1)}
+SHIELD_FAR_MASKS = {'w': _shield_masks('w', 2), 'b': _shield_masks('b', 2)}
+
+"""
+Fixed size hash table of pawn structure scores keyed by the pawn-only zobrist key
+pawns move rarely so most probes during a search hit an entry computed earlier
+"""
+
+
+class PawnTable:
+    def __init__(self, sizeKb=256):
+        # each entry is a key and two 32 bit scores (16 bytes), rounded down to a power of two
+        entries = 1
+        while entries * 2 * 16 <= sizeKb * 1024:
+            entries *= 2
+        self.mask = entries - 1
+        # an empty slot has key 0 and a score of 0, which is also the right score for a position without pawns
+        self.keys = array('Q', [0]) * entries
+        self.mg = array('i', [0]) * entries
+        self.eg = array('i', [0]) * entries
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        for i in range(len(self.keys)):
+            self.keys[i] = 0
+            self.mg[i] = 0
+            self.eg[i] = 0
+        self.hits = self.misses = 0
+
+    """
+    Returns the (middlegame, endgame) pawn structure score from white's point of view
+    """
+
+    def probe(self, pawnKey, pieces):
+        index = pawnKey & self.mask
+        if self.keys[index] == pawnKey:
+            self.hits += 1
+            return self.mg[index], self.eg[index]
+        self.misses += 1
+        mg, eg = pawn_structure(pieces['wP'], pieces['bP'])
+        self.keys[index] = pawnKey
+        self.mg[index] = mg
+        self.eg[index] = eg
+        return mg, eg
+
+
+"""
+Scores doubled, isolated and passed pawns, returns (middlegame, endgame) from white's point of view
+"""
+
+
+def pawn_structure(whitePawns, blackPawns):
+    mg = eg = 0
+    for color, pawns, enemyPawns, sign in (('w', whitePawns, blackPawns, 1), ('b', blackPawns, whitePawns, -1)):
+        passedMasks = PASSED_MASKS[color]
+        for col in range(8):
+            onFile = popcount(pawns & FILE_MASKS[col])
+            if onFile == 0:
+                continue
+            if onFile > 1:
+                mg += sign * DOUBLED_PAWN[0] * (onFile - 1)
+                eg += sign * DOUBLED_PAWN[1] * (onFile - 1)
+            if not pawns & ADJACENT_FILES[col]:
+                mg += sign * ISOLATED_PAWN[0] * onFile
+                eg += sign * ISOLATED_PAWN[1] * onFile
+        for sq in squares(pawns):
+            if not enemyPawns & passedMasks[sq]:
+                advanced = 6 - (sq >> 3) if color == 'w' else (sq >> 3) - 1
+                mg += sign * PASSED_PAWN_MG[advanced]
+                eg += sign * PASSED_PAWN_EG[advanced]
+    return mg, eg
+
+
+"""
+Scores the pawn shield in front of each king and the enemy pieces attacking the squares around it
+returns a middlegame score from white's point of view
+"""
+
+
+def king_safety(bitboards):
+    pieces = bitboards.pieces
+    occupied = bitboards.occupied
+    score = 0
+    for color, enemy, sign in (('w', 'b', 1), ('b', 'w', -1)):
+        king = pieces[color + 'K']
+        if not king:
+            continue
+        kingSq = lsb(king)
+        pawns = pieces[color + 'P']
+        safety = SHIELD_NEAR * popcount(pawns & SHIELD_NEAR_MASKS[color][kingSq]) + \
+            SHIELD_FAR * popcount(pawns & SHIELD_FAR_MASKS[color][kingSq])
+        # attacks on the king zone only matter while the enemy still has a queen to follow them up
+        if pieces[enemy + 'Q']:
+            zone = KING_ATTACKS[kingSq] | king
+            units = 0
+            for sq in squares(pieces[enemy + 'N']):
+                units += ATTACK_WEIGHTS['N'] * popcount(KNIGHT_ATTACKS[sq] & zone)
+            for sq in squares(pieces[enemy + 'B']):
+                units += ATTACK_WEIGHTS['B'] * popcount(bishop_attacks(sq, occupied) & zone)
+            for sq in squares(pieces[enemy + 'R']):
+                units += ATTACK_WEIGHTS['R'] * popcount(rook_attacks(sq, occupied) & zone)
+            for sq in squares(pieces[enemy + 'Q']):
+                units += ATTACK_WEIGHTS['Q'] * popcount(queen_attacks(sq, occupied) & zone)
+            safety -= min(units * units // 2, 500)  # a few attackers are harmless, many are deadly
+        score += sign * safety
+    return score
+
+
+"""
+Sums the material and piece-square scores and the game phase from scratch
+returns (middlegame, endgame, phase), GameState keeps these up to date incrementally after that
+"""
+
+
+def compute_scores(bitboards):
+    mg = eg = phase = 0
+    for piece in PIECES:
+        for sq in squares(bitboards.pieces[piece]):
+            mg += PST_MG[piece][sq]
+            eg += PST_EG[piece][sq]
+            phase += PIECE_PHASE[piece]
+    return mg, eg, phase
+
+
+"""
+Blends a middlegame and an endgame score by the phase of the game
+"""
+
+
+def taper(mg, eg, phase):
+    phase = min(phase, MAX_PHASE)
+    return int((mg * phase + eg * (MAX_PHASE - phase)) / MAX_PHASE)
+
+
+_defaultPawnTable = PawnTable()
+
+"""
+Scores the position of a game state from the view of the player to move
+a pawn table can be passed in so each searcher keeps its own
+"""
+
+
+def evaluate(gs, pawnTable=None):
+    if pawnTable is None:
+        pawnTable = _defaultPawnTable
+    pawnMg, pawnEg = pawnTable.probe(gs.pawnKey, gs.bitboards.pieces)
+    score = taper(gs.mgScore + pawnMg + king_safety(gs.bitboards), gs.egScore + pawnEg, gs.phase)
+    return score if gs.whiteToMove else -score
+
+
+# piece codes used for the board arrays of evaluate_many, 0 is an empty square
+PIECE_CODES = {'--': 0}
+for _code, _piece in enumerate(PIECES):
+    PIECE_CODES[_piece] = _code + 1
+
+# (numpy, mg table, eg table, phase table, masks) once loaded, False if NumPy is not installed
+_numpyTables = None
+# the board steps of the sliding pieces and the knight as (row, column)
+ROOK_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_JUMPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+
+
+def _numpy_tables():
+    global _numpyTables
+    if _numpyTables is None:
+        try:
+            import numpy as np
+        except ImportError:  # evaluate_many falls back to pure python
+            _numpyTables = False
+        else:
+            # row 0 of each table is the empty square so a board array indexes them directly
+            _numpyTables = (np, np.array([[0] * 64] + [PST_MG[piece] for piece in PIECES], dtype=np.int32),
+                            np.array([[0] * 64] + [PST_EG[piece] for piece in PIECES], dtype=np.int32),
+                            np.array([0] + [PIECE_PHASE[piece] for piece in PIECES], dtype=np.int32),
+                            _numpy_masks(np))
+    return _numpyTables
+
+
+def _numpy_masks(np):
+    # the bitboard masks of the pawn structure and king safety terms as uint64 arrays, with the tables that turn
+    # the characters of a board into piece codes and count the bits of a byte
+    def bbs(masks):
+        return np.array(masks, dtype=np.uint64)
+
+    codes = np.zeros((256, 256), dtype=np.intp)
+    for piece, code in PIECE_CODES.items():
+        codes[ord(piece[0]), ord(piece[1])] = code
+    masks = {'codes': codes, 'bits': np.array([bin(byte).count('1') for byte in range(256)], dtype=np.int64),
+             'file': bbs(FILE_MASKS), 'adjacent': bbs(ADJACENT_FILES), 'zone': bbs(KING_ATTACKS)}
+    for color in 'wb':
+        masks['passed' + color] = bbs(PASSED_MASKS[color])
+        masks['near' + color] = bbs(SHIELD_NEAR_MASKS[color])
+        masks['far' + color] = bbs(SHIELD_FAR_MASKS[color])
+    return masks
+
+
+def _popcount(np, masks, bbs):
+    if hasattr(np, 'bitwise_count'):  # NumPy 2
+        return np.bitwise_count(bbs).astype(np.int64)
+    return masks['bits'][bbs.view(np.uint8)].reshape(len(bbs), 8).sum(axis=1)
+
+
+def _shift(np, masks, bbs, step):
+    # moves every bitboard of an array one step, what goes over the edge of the board is dropped
+    dr, dc = step
+    amount = dr * 8 + dc
+    shifted = bbs << np.uint64(amount) if amount > 0 else bbs >> np.uint64(-amount)
+    # squares that came round from the other side of the board
+    for col in (range(dc) if dc > 0 else range(8 + dc, 8)):
+        shifted &= ~masks['file'][col]
+    return shifted
+
+
+def _pawn_structure_many(np, masks, pieces):
+    # pawn_structure of every position of a batch of bitboards, as (middlegame, endgame) arrays
+    mg = np.zeros(len(pieces['wP']), dtype=np.int64)
+    eg = np.zeros(len(pieces['wP']), dtype=np.int64)
+    zero = np.uint64(0)
+    for color, enemy, sign in (('w', 'b', 1), ('b', 'w', -1)):
+        pawns, enemyPawns = pieces[color + 'P'], pieces[enemy + 'P']
+        for col in range(8):
+            onFile = _popcount(np, masks, pawns & masks['file'][col])
+            doubled = np.maximum(onFile - 1, 0)
+            isolated = np.where(pawns & masks['adjacent'][col] == zero, onFile, 0)
+            mg += sign * (DOUBLED_PAWN[0] * doubled + ISOLATED_PAWN[0] * isolated)
+            eg += sign * (DOUBLED_PAWN[1] * doubled + ISOLATED_PAWN[1] * isolated)
+        passedMasks = masks['passed' + color]
+        for sq in range(64):
+            passed = (pawns >> np.uint64(sq) & np.uint64(1) != zero) & (enemyPawns & passedMasks[sq] == zero)
+            advanced = 6 - (sq >> 3) if color == 'w' else (sq >> 3) - 1
+            mg += sign * PASSED_PAWN_MG[advanced] * passed
+            eg += sign * PASSED_PAWN_EG[advanced] * passed
+    return mg, eg
+
+
+def _king_safety_many(np, masks, pieces, kingSquares):
+    # king_safety of every position of a batch of bitboards
+    # the moves of one direction never share a target: two knights jumping the same way land on different squares
+    # and a ray stops on the first piece it meets, so counting the targets of all the pieces at once counts
+    # each piece's attacks
+    occupied = np.bitwise_or.reduce([pieces[piece] for piece in PIECES])
+    empty = ~occupied
+    zero = np.uint64(0)
+    score = np.zeros(len(occupied), dtype=np.int64)
+    for color, enemy, sign in (('w', 'b', 1), ('b', 'w', -1)):
+        king = pieces[color + 'K']
+        kingSq = kingSquares[color]
+        pawns = pieces[color + 'P']
+        safety = SHIELD_NEAR * _popcount(np, masks, pawns & masks['near' + color][kingSq]) + \
+            SHIELD_FAR * _popcount(np, masks, pawns & masks['far' + color][kingSq])
+        zone = masks['zone'][kingSq] | king
+        units = np.zeros(len(occupied), dtype=np.int64)
+        for step in KNIGHT_JUMPS:
+            units += ATTACK_WEIGHTS['N'] * _popcount(np, masks, _shift(np, masks, pieces[enemy + 'N'], step) & zone)
+        for piece, directions in (('B', BISHOP_DIRECTIONS), ('R', ROOK_DIRECTIONS),
+                                  ('Q', ROOK_DIRECTIONS + BISHOP_DIRECTIONS)):
+            for step in directions:
+                ray = _shift(np, masks, pieces[enemy + piece], step)
+                attacks = ray
+                for _ in range(6):
+                    ray = _shift(np, masks, ray & empty, step)
+                    attacks = attacks | ray
+                units += ATTACK_WEIGHTS[piece] * _popcount(np, masks, attacks & zone)
+        # attacks on the king zone only matter while the enemy still has a queen to follow them up
+        safety -= np.where(pieces[enemy + 'Q'] != zero, np.minimum(units * units // 2, 500), 0)
+        score += sign * np.where(king != zero, safety, 0)
+    return score
+
+
+"""
+Scores many positions from white's point of view, positions are game states or 8x8 boards like GameState.board
+with NumPy every term is worked out for the whole batch at once over an (N, 64) array of piece codes, the masks
+of the pawn structure and king safety terms become matrix products; without it each position is scored on its
+own and the pawn table caches its pawn structure
+returns a list of scores in the same order
+"""
+
+
+def evaluate_many(positions, pawnTable=None):
+    boards = [getattr(position, 'board', position) for position in positions]
+    if len(boards) == 0:
+        return []
+    tables = _numpy_tables()
+    if tables:
+        np, mgTable, egTable, phaseTable, masks = tables
+        # every piece is two characters, so the boards joined together read straight into an (N, 64, 2) array
+        text = ''.join([''.join(row) for board in boards for row in board]).encode('ascii')
+        chars = np.frombuffer(text, dtype=np.uint8).reshape(len(boards), 64, 2)
+        codes = masks['codes'][chars[:, :, 0], chars[:, :, 1]]
+        pieces = {}
+        for piece in PIECES:
+            # bit sq of the bitboard is square sq, like Bitboards
+            pieces[piece] = np.packbits(codes == PIECE_CODES[piece], axis=1, bitorder='little').view('<u8')[:, 0]
+        # the first king of each color like lsb, boards without one are left out by king safety
+        kingSquares = {color: (codes == PIECE_CODES[color + 'K']).argmax(axis=1) for color in 'wb'}
+        index = np.arange(64)
+        pawnMg, pawnEg = _pawn_structure_many(np, masks, pieces)
+        mg = mgTable[codes, index].sum(axis=1) + pawnMg + _king_safety_many(np, masks, pieces, kingSquares)
+        eg = egTable[codes, index].sum(axis=1) + pawnEg
+        phase = np.minimum(phaseTable[codes].sum(axis=1), MAX_PHASE)
+        # same rounding towards zero as taper so both paths agree
+        scores = np.trunc((mg * phase + eg * (MAX_PHASE - phase)) / MAX_PHASE)
+        return [int(score) for score in scores]
+    if pawnTable is None:
+        pawnTable = _defaultPawnTable
+    scores = []
+    for board in boards:
+        bitboards = Bitboards(board)
+        pieces = bitboards.pieces
+        pawnMg, pawnEg = pawnTable.probe(pawn_key(pieces['wP'], pieces['bP']), pieces)
+        mg, eg, phase = compute_scores(bitboards)
+        scores.append(taper(mg + pawnMg + king_safety(bitboards), eg + pawnEg, phase))
+    return scores
@@ -0,0 +1,219 @@
+"""
+Headless game runner for batch self-play, load testing and generating training data
+plays many games between random movers and/or the engine across a pool of processes and streams every finished
+game out as a JSON line or a PGN record, then reports games/sec and moves/sec
+pygame is never imported here so worker processes start fast and stay small
+
+usage: python chess_headless.py --games 100 --white random --black engine --movetime 0.05 --workers 4
+                                [--format json|pgn] [--output FILE] [--openings FILE] [--max-plies 400]
+                                [--tablebases DIR]
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+import chess_ai
+import chess_book
+import chess_engine
+import chess_pgn
+import chess_tablebase
+
+PLAYERS = ('random', 'engine')
+
+# one searcher per worker process, created by init_worker so its transposition table is reused between games
+_searcher = None
+_options = None
+_book = None  # every worker maps the same book file so its pages are shared
+_tablebases = None  # the same goes for the tablebase files, they also decide games once few pieces are left
+
+
+def init_worker(options):
+    global _searcher, _options, _book, _tablebases
+    _options = options
+    if options['tablebases'] is not None:
+        _tablebases = chess_tablebase.Tablebases(options['tablebases'])
+    if 'engine' in (options['white'], options['black']):
+        _searcher = chess_ai.Searcher(options['ttSizeMb'], _tablebases)
+        if options['book'] is not None:
+            _book = chess_book.OpeningBook(options['book'])
+
+
+"""
+Picks the move for the player to move, validMoves are the legal moves of the position
+"""
+
+
+def choose_move(gs, validMoves, player, rng):
+    if player == 'random':
+        return rng.choice(validMoves)
+    if _book is not None:
+        move = _book.choose_move(gs, rng)
+        if move is not None:
+            return move
+    limit = chess_ai.SearchLimit(depth=_options['depth'], nodes=_options['nodes'], movetime=_options['movetime'])
+    return _searcher.search(gs, limit).bestMove
+
+
+"""
+Finds the legal move with the given coordinate notation (e.g. e2e4, or e7e8n for a promotion, a queen if left out)
+"""
+
+
+def find_move(validMoves, notation):
+    for move in validMoves:
+        moveNotation = move.get_chess_notation()
+        if move.isPawnPromotion:
+            if notation == moveNotation + move.promotionPiece.lower() or \
+                    (notation == moveNotation and move.promotionPiece == 'Q'):
+                return move
+        elif notation == moveNotation:
+            return move
+    return None
+
+
+"""
+Plays one game, job is (game number, seed, opening moves)
+returns the game record as a dict
+"""
+
+
+def play_game(job):
+    gameNumber, seed, opening = job
+    rng = random.Random(seed)
+    gs = chess_engine.GameState()
+    players = (_options['white'], _options['black'])
+    moves = []
+    sanMoves = []  # only filled in for PGN output, working out check marks costs a move generation per move
+    start = time.time()
+    result, termination = '*', 'max plies'
+    while len(moves) < _options['maxPlies']:
+        validMoves = gs.get_valid_moves()
+        if gs.checkMate:
+            result, termination = ('0-1' if gs.whiteToMove else '1-0'), 'checkmate'
+            break
+        if gs.staleMate:
+            result, termination = '1/2-1/2', 'stalemate'
+            break
+        if gs.threefoldRepetition:
+            result, termination = '1/2-1/2', 'threefold repetition'
+            break
+        if gs.fiftyMoveRule:
+            result, termination = '1/2-1/2', 'fifty-move rule'
+            break
+        if gs.insufficientMaterial:
+            result, termination = '1/2-1/2', 'insufficient material'
+            break
+        probed = _tablebases.probe(gs) if _tablebases is not None else None
+        if probed is not None:  # the result with best play is known, adjudicate the game
+            if probed[0] == chess_tablebase.DRAW:
+                result = '1/2-1/2'
+            else:
+                result = '1-0' if (probed[0] == chess_tablebase.WIN) == gs.whiteToMove else '0-1'
+            termination = 'tablebase'
+            break
+        move = None
+        if len(moves) < len(opening):  # scripted opening moves are played first
+            move = find_move(validMoves, opening[len(moves)])
+            if move is None:
+                raise ValueError('illegal opening move ' + opening[len(moves)] + ' in game ' + str(gameNumber))
+        else:
+            move = choose_move(gs, validMoves, players[0 if gs.whiteToMove else 1], rng)
+        if _options['san']:
+            sanMoves.append(chess_pgn.move_to_san(gs, move, validMoves))
+        gs.make_move(move)
+        moves.append(move.get_chess_notation() + (move.promotionPiece.lower() if move.isPawnPromotion else ''))
+    record = {'game': gameNumber, 'seed': seed, 'white': players[0], 'black': players[1], 'result': result,
+              'termination': termination, 'plies': len(moves), 'moves': moves, 'seconds': round(time.time() - start, 4)}
+    if _options['san']:
+        record['san'] = sanMoves
+    return record
+
+
+"""
+Formats a game record played with SAN recording on as PGN
+"""
+
+
+def game_to_pgn(record):
+    headers = [('Event', 'Headless self-play'), ('Round', str(record['game'])), ('White', record['white']),
+               ('Black', record['black']), ('Termination', record['termination'])]
+    return chess_pgn.format_game(headers, record['san'], record['result'])
+
+
+"""
+Plays the games across a pool of worker processes and yields each game record as soon as it finishes
+"""
+
+
+def run_games(games, options, workers=None, seed=0, openings=None):
+    jobs = [(i + 1, seed + i, openings[i % len(openings)] if openings else []) for i in range(games)]
+    if workers == 1:  # no pool, useful for profiling
+        init_worker(options)
+        for job in jobs:
+            yield play_game(job)
+        return
+    pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(options,))
+    try:
+        for record in pool.imap_unordered(play_game, jobs):
+            yield record
+    finally:
+        pool.terminate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play many games without a display')
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--white', choices=PLAYERS, default='random')
+    parser.add_argument('--black', choices=PLAYERS, default='random')
+    parser.add_argument('--depth', type=int, help='engine depth limit')
+    parser.add_argument('--nodes', type=int, help='engine node limit per move')
+    parser.add_argument('--movetime', type=float, help='engine seconds per move')
+    parser.add_argument('--book', metavar='FILE', help='opening book the engine plays from (see chess_book.py)')
+    parser.add_argument('--tablebases', metavar='DIR', help='endgame tables to search with and adjudicate games by '
+                        '(see chess_tablebase.py)')
+    parser.add_argument('--tt-mb', type=int, default=16, help='engine transposition table size per worker')
+    parser.add_argument('--max-plies', type=int, default=400, help='games longer than this are stopped unfinished')
+    parser.add_argument('--openings', metavar='FILE', help='file with one line of coordinate moves per opening, '
+                                                           'games cycle through them before the players take over')
+    parser.add_argument('--workers', type=int, help='worker processes (defaults to the number of cores)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', choices=['json', 'pgn'], default='json')
+    parser.add_argument('--output', metavar='FILE', help='write games to FILE instead of stdout')
+    args = parser.parse_args(argv)
+
+    if 'engine' in (args.white, args.black) and args.depth is None and args.nodes is None and args.movetime is None:
+        args.depth = 2  # keep engine games quick unless asked otherwise
+    options = {'white': args.white, 'black': args.black, 'depth': args.depth, 'nodes': args.nodes,
+               'movetime': args.movetime, 'ttSizeMb': args.tt_mb, 'maxPlies': args.max_plies,
+               'san': args.format == 'pgn', 'book': args.book,
+               'tablebases': args.tablebases}
+    openings = None
+    if args.openings is not None:
+        with open(args.openings) as f:
+            openings = [line.split() for line in f if line.strip()]
+
+    out = open(args.output, 'w') if args.output is not None else sys.stdout
+    start = time.time()
+    games = plies = 0
+    results = {}
+    try:
+        for record in run_games(args.games, options, args.workers, args.seed, openings):
+            out.write(json.dumps(record) + '\n' if args.format == 'json' else game_to_pgn(record) + '\n')
+            out.flush()
+            games += 1
+            plies += record['plies']
+            results[record['result']] = results.get(record['result'], 0) + 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    seconds = time.time() - start
+    sys.stderr.write('%d games, %d moves in %.2fs: %.2f games/sec, %.0f moves/sec, results %s\n' %
+                     (games, plies, seconds, games / seconds, plies / seconds, json.dumps(results)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,24 @@
+import argparse
+import time
 import pygame as p
 import chess_engine
+import chess_pgn
+import chess_ai
+import chess_book
+import chess_cache
+import chess_profile
+import chess_smp
+import chess_tablebase
+import chess_worker
 
 WIDTH = HEIGHT = 512  # total board width and height
 DIMENSION = 8  # number of squares on the board
 SQ_SIZE = HEIGHT // DIMENSION  # how big each square is
 MAX_FPS = 15
 IMAGES = {}
+# events the background worker posts its results with
+MOVES_READY = p.USEREVENT + 1
+ENGINE_MOVE = p.USEREVENT + 2
 
 """
 Loads the images into a global dictionary
@@ -20,150 +33,364 @@ def load_images():
 
 
 """
-Highlight selected square and piece's available moves
+Draws the base chess board
+parameters: the pygame screen (or any surface)
 """
 
 
-def highlight_square(screen, gs, validMoves, currSq):
-    s = p.Surface((SQ_SIZE, SQ_SIZE))
-    s.set_alpha(100)
-    # highlight the previous opponent move if there has been one
-    if len(gs.moveLog) >= 1:
-        lmove = gs.moveLog[-1]  # last move
-        s.fill(p.Color(255, 255, 102))  # light yellow for highlighing previous move
-        screen.blit(s, (lmove.endCol * SQ_SIZE, lmove.endRow * SQ_SIZE))
-        screen.blit(s, (lmove.startCol * SQ_SIZE, lmove.startRow * SQ_SIZE))
-    if currSq != ():
-        row, col = currSq
-        if gs.board[row][col][0] == ('w' if gs.whiteToMove else 'b'):  # checks if sqSelected is a moveable piece
-            # highlight selected square
-            s.fill(p.Color(0, 0, 128))  # darker blue for highlighting current piece
-            screen.blit(s, (col * SQ_SIZE, row * SQ_SIZE))
-            # highlight valid moves
-            s.fill(p.Color(75, 169, 200))  # light blue for highlighting valid moves
-            for move in validMoves:
-                if move.startRow == row and move.startCol == col:
-                    screen.blit(s, (SQ_SIZE * move.endCol, SQ_SIZE * move.endRow))
-
+def draw_board(screen):
+    # first color is beige for light squares, second is dark brown for dark squares
+    colors = [p.Color(225, 198, 153), p.Color(133, 94, 66)]
+    for row in range(DIMENSION):
+        for col in range(DIMENSION):
+            color = colors[(row + col) % 2]
+            rectangle = p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+            p.draw.rect(screen, color, rectangle)
 
 
 """
-Responsible for all the graphics in current gamestate
-parameters: the pygame screen and the current board gamestate
+The legal moves of one position indexed for the GUI, by start square and by (start square, end square)
+built once when the moves arrive so selecting a piece or clicking a square does not scan the whole move list
 """
 
 
-def draw_game_state(screen, gs, validMoves, currSq):
-    # need to draw board before the pieces so the pieces are visible
-    draw_board(screen)  # draw the squares
-    highlight_square(screen, gs, validMoves, currSq)
-    draw_pieces(screen, gs.board)  # draw the pieces
+class MoveTable:
+    def __init__(self, moves=()):
+        self.moves = list(moves)
+        self.fromSquare = {}  # (row, col) -> moves starting there
+        self.byPair = {}  # ((row, col), (row, col)) -> moves between the squares, four for a promotion
+        self.targets = {}  # (row, col) -> end squares of the moves starting there
+        for move in self.moves:
+            start, end = (move.startRow, move.startCol), (move.endRow, move.endCol)
+            self.fromSquare.setdefault(start, []).append(move)
+            self.byPair.setdefault((start, end), []).append(move)
+            self.targets.setdefault(start, set()).add(end)
 
+    def __len__(self):
+        return len(self.moves)
 
-"""
-Draws the base chess board
-parameters: the pygame screen
-"""
+    def moves_from(self, sq):
+        return self.fromSquare.get(sq, [])
 
+    def find(self, start, end):
+        return self.byPair.get((start, end), [])
 
-def draw_board(screen):
-    # first color is beige for light squares, second is dark brown for dark squares
-    global colors
-    colors = [p.Color(225, 198, 153), p.Color(133, 94, 66)]
-    for row in range(DIMENSION):
-        for col in range(DIMENSION):
-            color = colors[(row + col) % 2]
-            rectangle = p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-            p.draw.rect(screen, color, rectangle)
+    """
+    Gets the move of this position equal to the given one (e.g. a move from the engine) or None
+    """
+
+    def match(self, move):
+        for candidate in self.find((move.startRow, move.startCol), (move.endRow, move.endCol)):
+            if candidate == move:
+                return candidate
+        return None
 
 
-""""
-Animates a piece's move
+"""
+Gets the squares the promotion choices are shown on: a column from the promotion square towards the middle
+returns (row, col, move) for each choice
 """
 
 
-def animate_move(move, screen, board, clock):
-    global colors
-    dR = move.endRow - move.startRow
-    dC = move.endCol - move.startCol
-    framesPerSquare = 5  # frames it takes to move each square
-    frameCount = (abs(dR) + abs(dC)) * framesPerSquare
-    for frame in range(frameCount + 1):
-        row, col = (move.startRow + dR * (frame / frameCount), move.startCol + dC * (frame / frameCount))
-        draw_board(screen)
-        draw_pieces(screen, board)
-        # erase piece from its ending square
-        color = colors[(move.endRow + move.endCol) % 2]
-        endSq = p.Rect(move.endCol * SQ_SIZE, move.endRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        p.draw.rect(screen, color, endSq)
-        # draw captured piece
-        if move.pieceCapt != '--':
-            screen.blit(IMAGES[move.pieceCapt], endSq)
-        # draw moving piece
-        screen.blit(IMAGES[move.pieceMoved], p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        p.display.flip()
-        clock.tick(60)
+def promotion_squares(choices):
+    step = 1 if choices[0].endRow == 0 else -1
+    return [(choice.endRow + i * step, choice.endCol, choice) for i, choice in enumerate(choices)]
 
 
 """
-Draws the pieces on the board using current gamestate
+Keeps track of what was last drawn on each square so a frame only redraws the squares that changed
+the empty board and the highlight overlays are rendered once and reused
 """
 
 
-def draw_pieces(screen, board):
-    for row in range(DIMENSION):
-        for col in range(DIMENSION):
-            piece = board[row][col]
-            if piece != '--':
-                screen.blit(IMAGES[piece], p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
+class BoardRenderer:
+    def __init__(self, screen):
+        self.screen = screen
+        self.boardSurface = p.Surface((WIDTH, HEIGHT))
+        draw_board(self.boardSurface)
+        self.overlays = {}
+        # light yellow for the previous move, darker blue for the current piece, light blue for its valid moves,
+        # white under the pieces a pawn can promote to
+        for name, color, alpha in (('last', p.Color(255, 255, 102), 100), ('selected', p.Color(0, 0, 128), 100),
+                                   ('move', p.Color(75, 169, 200), 100), ('choice', p.Color(255, 255, 255), 220)):
+            overlay = p.Surface((SQ_SIZE, SQ_SIZE))
+            overlay.set_alpha(alpha)
+            overlay.fill(color)
+            self.overlays[name] = overlay
+        self.font = p.font.SysFont('Helvitca', 32, True, False)
+        self.drawn = [[None] * DIMENSION for _ in range(DIMENSION)]  # (piece, highlights) drawn on each square
+        self.text = None
+        self.textRect = None
+        self.statsFont = p.font.SysFont('Helvitca', 20, False, False)
+        self.stats = None  # a line of engine statistics drawn along the top of the board
+        self.statsRect = None
+
+    """
+    Forgets what is on the screen so the next frame redraws everything (e.g. after the window was covered)
+    """
+
+    def invalidate(self):
+        for row in range(DIMENSION):
+            for col in range(DIMENSION):
+                self.drawn[row][col] = None
+
+    """
+    Gets the highlight overlays of every square: the previous move, the selected piece and its available moves
+    """
+
+    def highlight_squares(self, gs, moveTable, currSq):
+        highlights = [[() for _ in range(DIMENSION)] for _ in range(DIMENSION)]
+        # highlight the previous opponent move if there has been one
+        if len(gs.moveLog) >= 1:
+            lmove = gs.moveLog[-1]  # last move
+            highlights[lmove.endRow][lmove.endCol] += ('last',)
+            highlights[lmove.startRow][lmove.startCol] += ('last',)
+        if currSq != ():
+            row, col = currSq
+            if gs.board[row][col][0] == ('w' if gs.whiteToMove else 'b'):  # checks if sqSelected is a moveable piece
+                highlights[row][col] += ('selected',)
+                for endRow, endCol in moveTable.targets.get(currSq, ()):
+                    highlights[endRow][endCol] += ('move',)
+        return highlights
+
+    def draw_square(self, row, col, piece, highlights):
+        rect = p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+        self.screen.blit(self.boardSurface, rect, rect)
+        for highlight in highlights:
+            self.screen.blit(self.overlays[highlight], rect)
+        if piece != '--':
+            self.screen.blit(IMAGES[piece], rect)
+        self.drawn[row][col] = (piece, highlights)
+        return rect
+
+    """
+    Redraws the squares whose piece or highlights differ from the given states
+    returns the rectangles that changed
+    """
+
+    def draw_squares(self, states):
+        dirty = []
+        for row in range(DIMENSION):
+            for col in range(DIMENSION):
+                if self.drawn[row][col] != states[row][col]:
+                    dirty.append(self.draw_square(row, col, *states[row][col]))
+        if self.text is not None and any(rect.colliderect(self.textRect) for rect in dirty):
+            # the text is blended onto the squares, so all squares under it are redrawn before drawing it again
+            for row in range(DIMENSION):
+                for col in range(DIMENSION):
+                    rect = p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+                    if rect.colliderect(self.textRect) and rect not in dirty:
+                        dirty.append(self.draw_square(row, col, *states[row][col]))
+            draw_text(self.screen, self.text, self.font)
+            dirty.append(self.textRect)
+        if self.stats is not None and any(rect.colliderect(self.statsRect) for rect in dirty):
+            for row in range(DIMENSION):
+                for col in range(DIMENSION):
+                    rect = p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+                    if rect.colliderect(self.statsRect) and rect not in dirty:
+                        dirty.append(self.draw_square(row, col, *states[row][col]))
+            self.screen.blit(self.statsFont.render(self.stats, True, p.Color('Black'), p.Color('White')),
+                             self.statsRect)
+            dirty.append(self.statsRect)
+        return dirty
+
+    """
+    Changes the text drawn over the board (None for no text), the squares under the old text are redrawn
+    """
+
+    def set_text(self, text):
+        if text == self.text:
+            return
+        if self.textRect is not None:
+            for row in range(DIMENSION):
+                for col in range(DIMENSION):
+                    if p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE).colliderect(self.textRect):
+                        self.drawn[row][col] = None
+        self.text = text
+        self.textRect = draw_text(self.screen, text, self.font, render=False) if text is not None else None
+        if self.textRect is not None:  # forces the squares under the new text to be redrawn along with it
+            self.drawn[self.textRect.centery // SQ_SIZE][self.textRect.centerx // SQ_SIZE] = None
+
+    """
+    Changes the statistics line (None for none), the squares under the old and new line are redrawn
+    """
+
+    def set_stats(self, stats):
+        if stats == self.stats:
+            return
+        rects = [self.statsRect]
+        self.stats = stats
+        self.statsRect = p.Rect((4, 4), self.statsFont.size(stats)) if stats is not None else None
+        rects.append(self.statsRect)
+        for rect in rects:
+            if rect is None:
+                continue
+            for row in range(DIMENSION):
+                for col in range(DIMENSION):
+                    if p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE).colliderect(rect):
+                        self.drawn[row][col] = None
+
+    """
+    Draws the current gamestate, only touching the squares that changed since the last frame
+    promotionChoices are the moves of a pawn promotion waiting for the player to pick a piece
+    returns the rectangles to pass to p.display.update
+    """
+
+    def render(self, gs, moveTable, currSq, text=None, promotionChoices=None):
+        self.set_text(text)
+        highlights = self.highlight_squares(gs, moveTable, currSq)
+        states = [[(gs.board[row][col], highlights[row][col]) for col in range(DIMENSION)] for row in range(DIMENSION)]
+        if promotionChoices:
+            for row, col, move in promotion_squares(promotionChoices):
+                states[row][col] = (move.pieceMoved[0] + move.promotionPiece, ('choice',))
+        return self.draw_squares(states)
+
+    """
+    Animates a piece's move, each frame only redraws the squares under the moving piece
+    """
+
+    def animate_move(self, move, board, clock):
+        self.set_text(None)
+        # the board without highlights, with the captured piece still on the end square until the piece arrives
+        states = [[(board[row][col], ()) for col in range(DIMENSION)] for row in range(DIMENSION)]
+        states[move.endRow][move.endCol] = (move.pieceCapt, ())
+        p.display.update(self.draw_squares(states))
+        dR = move.endRow - move.startRow
+        dC = move.endCol - move.startCol
+        framesPerSquare = 5  # frames it takes to move each square
+        frameCount = (abs(dR) + abs(dC)) * framesPerSquare
+        prevRect = None
+        for frame in range(frameCount + 1):
+            row, col = (move.startRow + dR * (frame / frameCount), move.startCol + dC * (frame / frameCount))
+            pieceRect = p.Rect(int(col * SQ_SIZE), int(row * SQ_SIZE), SQ_SIZE, SQ_SIZE)
+            dirty = [pieceRect]
+            # clear the piece from where it was drawn last frame, and redraw what it will be drawn over
+            for rect in (prevRect, pieceRect):
+                if rect is None:
+                    continue
+                dirty.append(rect)
+                for r in range(rect.top // SQ_SIZE, min((rect.bottom - 1) // SQ_SIZE, DIMENSION - 1) + 1):
+                    for c in range(rect.left // SQ_SIZE, min((rect.right - 1) // SQ_SIZE, DIMENSION - 1) + 1):
+                        self.draw_square(r, c, *states[r][c])
+            # draw moving piece
+            self.screen.blit(IMAGES[move.pieceMoved], pieceRect)
+            # the squares under the piece no longer match what the renderer thinks is drawn on them
+            for r in range(pieceRect.top // SQ_SIZE, min((pieceRect.bottom - 1) // SQ_SIZE, DIMENSION - 1) + 1):
+                for c in range(pieceRect.left // SQ_SIZE, min((pieceRect.right - 1) // SQ_SIZE, DIMENSION - 1) + 1):
+                    self.drawn[r][c] = None
+            p.display.update(dirty)
+            prevRect = pieceRect
+            clock.tick(60)
 
 
 """
 Draws the endgame text
+returns the rectangle the text covers, with render=False only the rectangle is worked out
 """
 
 
-def draw_text(screen, text):
-    font = p.font.SysFont('Helvitca', 32, True, False)
+def draw_text(screen, text, font=None, render=True):
+    if font is None:
+        font = p.font.SysFont('Helvitca', 32, True, False)
     textObject = font.render(text, True, p.Color('Gray'))
     textLocation = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH / 2 - textObject.get_width() / 2,
                                                     HEIGHT / 2 - textObject.get_height() / 2)
-    screen.blit(textObject, textLocation)
-    textObject = font.render(text, True, p.Color('Black'))
-    screen.blit(textObject, textLocation.move(2, 2))
+    if render:
+        screen.blit(textObject, textLocation)
+        textObject = font.render(text, True, p.Color('Black'))
+        screen.blit(textObject, textLocation.move(2, 2))
+    # the black copy is drawn 2 pixels down and to the right of the gray one
+    return p.Rect(textLocation.left, textLocation.top, textObject.get_width() + 2, textObject.get_height() + 2)
+
+
+"""
+Posts a result from the background worker onto the pygame event queue, called from the worker thread
+"""
+
+
+def post_worker_result(kind, epoch, result):
+    p.event.post(p.event.Event(MOVES_READY if kind == 'moves' else ENGINE_MOVE, epoch=epoch, **result))
 
 
 """
 Main driver, handles user input and graphics
+playerOne and playerTwo are True if a human plays white and black, False if the computer does
+the game is written to savePath as PGN when the window is closed, the computer plays from the opening book at
+bookPath while the position is in it and looks endgames up in the tables in tablebaseDir, with searchWorkers
+above 1 it searches in that many processes
+with showStats the move generator is instrumented and its moves/sec and latest latency are shown over the board
+with ponder the computer searches the reply it expects while the player thinks
+legal moves and computer moves of positions seen before come from a cache of up to cacheMb megabytes, loaded from
+and saved to cachePath if given
+the computer keeps what it learned in its transposition table and history from move to move and across undos,
+only a reset clears it
 """
 
 
-def main():
+def main(playerOne=True, playerTwo=True, thinkTime=1.0, savePath=None, bookPath=None, tablebaseDir=None,
+         searchWorkers=1, showStats=False, ponder=False, cachePath=None, cacheMb=chess_cache.DEFAULT_SIZE_MB):
     p.init()
     screen = p.display.set_mode((WIDTH, HEIGHT))
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
+    load_images()
+    renderer = BoardRenderer(screen)
     gs = chess_engine.GameState()
-    validMoves = gs.get_valid_moves()
+    profiler = None
+    if showStats:  # the parallel search runs in other processes so only this process' move generation is shown
+        profiler = chess_profile.Profiler()
+        profiler.enable()
+        statsTime, statsMoves = time.time(), 0
+    # legal moves and computer moves are worked out in the background so the window keeps responding
+    book = chess_book.OpeningBook(bookPath) if bookPath is not None else None
+    tablebases = chess_tablebase.Tablebases(tablebaseDir) if tablebaseDir is not None else None
+    if searchWorkers > 1:  # the search processes are started before the worker thread
+        searcher = chess_smp.ParallelSearcher(searchWorkers, tablebaseDir=tablebaseDir)
+    else:
+        searcher = chess_ai.Searcher(tablebases=tablebases)
+    cache = chess_cache.PositionCache(cacheMb, cachePath)
+    worker = chess_worker.MoveWorker(post_worker_result, searcher, book, cache)
+    worker.request_moves(gs)
+    moveTable = MoveTable()  # empty until the worker sends the moves for the current position
+    promotionChoices = None  # the moves to pick from while a promotion piece is being chosen
+    movesPending = True
+    aiThinking = False
+    engineResult = None  # an engine move that came in before the legal moves of its position
+    ponderMove = None  # the player's move the computer is pondering on
+    nextPonderMove = None  # the reply to ponder on once the computer's move has been made
+    enginePaused = False  # after an undo the computer waits for a click before it moves again
     moveMade = False  # flag variable for when the user makes a valid move
-    load_images()
     running = True
     currSq = ()  # current square the user selects (row, col)
     playerClicks = []  # keeps track of player clicks [(first), (last)]
     animate = False  # variable for when to animate the move
     gameOver = False
     while running:
+        humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
         for e in p.event.get():
             if e.type == p.QUIT:
                 running = False
+            elif e.type == p.VIDEOEXPOSE:  # the window was uncovered so everything has to be drawn again
+                renderer.invalidate()
             # mouse handlers
             elif e.type == p.MOUSEBUTTONDOWN:
-                if not gameOver:
+                enginePaused = False  # the player carries on, by moving or by clicking to let the computer move
+                if not gameOver and humanTurn:
                     location = p.mouse.get_pos()  # (x,y) location of mouse
                     col = location[0] // SQ_SIZE
                     row = location[1] // SQ_SIZE
+                    if promotionChoices:  # the click picks a promotion piece, a click anywhere else cancels
+                        for choiceRow, choiceCol, move in promotion_squares(promotionChoices):
+                            if (choiceRow, choiceCol) == (row, col):
+                                print(chess_pgn.move_to_san(gs, move, moveTable.moves))
+                                gs.make_move(move)
+                                moveMade = True
+                                animate = True
+                        promotionChoices = None
+                        currSq = ()
+                        playerClicks = []
                     # make game not count clicking the same square twice as a move
-                    if currSq == (row, col):
+                    elif currSq == (row, col):
                         currSq = ()
                         playerClicks = []
                     else:
@@ -171,54 +398,177 @@ def main():
                         playerClicks.append(currSq)
                     if len(playerClicks) == 2:
                         # this is where the user is trying to make their move
-                        move = chess_engine.Move(playerClicks[0], playerClicks[1], gs.board)
-                        print(move.get_chess_notation())
-                        for i in range(len(validMoves)):
-                            if move == validMoves[i]:
-                                gs.make_move(validMoves[i])
-                                moveMade = True
-                                animate = True
-                                # allow user to make another move
-                                currSq = ()
-                                playerClicks = []
-                        if not moveMade:
+                        moves = moveTable.find(playerClicks[0], playerClicks[1])
+                        if len(moves) == 1:
+                            print(chess_pgn.move_to_san(gs, moves[0], moveTable.moves))
+                            gs.make_move(moves[0])
+                            moveMade = True
+                            animate = True
+                        elif len(moves) > 1:  # a promotion, the player picks the piece with the next click
+                            promotionChoices = moves
+                        if len(moves) > 0:
+                            # allow user to make another move
+                            currSq = ()
+                            playerClicks = []
+                        else:
                             playerClicks = [currSq]
             # key handlers
             elif e.type == p.KEYDOWN:
-                if e.key == p.K_u:  # undo the move when u is pressed
-                    gs.undo_move()
+                if e.key == p.K_u:  # undo back to the player's last move when u is pressed
+                    worker.cancel()  # results still on their way are for the position being undone
+                    while len(gs.moveLog) > 0:
+                        gs.undo_move()
+                        # against the computer its reply is taken back along with the player's move
+                        if (playerOne if gs.whiteToMove else playerTwo) or not (playerOne or playerTwo):
+                            break
+                    # otherwise the computer would play straight back into the position that was just undone
+                    enginePaused = True
                     moveMade = True
                     animate = False
+                    aiThinking = False
+                    engineResult = None
+                    ponderMove = nextPonderMove = None
+                    gameOver = False
+                    promotionChoices = None
+                    gs.checkMate = gs.staleMate = False
                 if e.key == p.K_r:  # reset board when pressed
+                    worker.cancel()
+                    worker.clear_search()  # a new game starts without what the computer learned in this one
                     gs = chess_engine.GameState()
-                    validMoves = gs.get_valid_moves()
+                    moveTable = MoveTable()
+                    promotionChoices = None
+                    worker.request_moves(gs)
+                    movesPending = True
+                    aiThinking = False
+                    engineResult = None
+                    ponderMove = nextPonderMove = None
+                    enginePaused = False
+                    gameOver = False
                     currSq = ()
                     playerClicks = []
                     moveMade = False
                     animate = False
-        # checks if a valid move was made then generate the valid moves for the player
-        if moveMade:
-            if animate:
-                animate_move(gs.moveLog[-1], screen, gs.board, clock)
-            validMoves = gs.get_valid_moves()
-            moveMade = False
-            animate = False
-        draw_game_state(screen, gs, validMoves, currSq)
+            # background worker results, anything from before an undo or reset is stale and ignored
+            elif e.type == MOVES_READY:
+                if worker.is_current(e.epoch):
+                    moveTable = MoveTable(e.moves)
+                    gs.checkMate = e.checkMate
+                    gs.staleMate = e.staleMate
+                    movesPending = False
+            elif e.type == ENGINE_MOVE:
+                if worker.is_current(e.epoch) and aiThinking:
+                    engineResult = e.result
 
         # check if the game is over
+        text = None
         if gs.checkMate:
             gameOver = True
             if gs.whiteToMove:
-                draw_text(screen, 'Black wins by checkmate')
+                text = 'Black wins by checkmate'
             else:
-                draw_text(screen, 'White wins by checkmate')
+                text = 'White wins by checkmate'
         elif gs.staleMate:
             gameOver = True
-            draw_text(screen, 'Stalemate')
-
+            text = 'Stalemate'
+        elif not movesPending and not moveMade and gs.draw:  # checkMate is only known once the moves have come back
+            gameOver = True
+            if gs.threefoldRepetition:
+                text = 'Draw by threefold repetition'
+            elif gs.fiftyMoveRule:
+                text = 'Draw by the fifty-move rule'
+            else:
+                text = 'Draw by insufficient material'
+        # the game is decided before the computer's move is played or asked for, a search still running or a move
+        # on its way would carry on playing after it
+        if gameOver and (aiThinking or engineResult is not None or ponderMove is not None):
+            worker.cancel()
+            aiThinking = False
+            engineResult = None
+            ponderMove = None
+
+        # play the computer's move once the legal moves of its position are known, after a ponderhit the move
+        # can come in before them
+        if engineResult is not None and not movesPending:
+            aiThinking = False
+            move = moveTable.match(engineResult.bestMove) if engineResult.bestMove is not None else None
+            if move is not None:
+                gs.make_move(move)
+                moveMade = True
+                animate = True
+                if ponder and len(engineResult.pv) > 1:
+                    nextPonderMove = engineResult.pv[1]
+            engineResult = None
+        # ask the worker for a computer move once the legal moves of its position are known
+        if not gameOver and not humanTurn and not movesPending and not aiThinking and not moveMade and \
+                not enginePaused:
+            worker.request_engine_move(gs, chess_ai.SearchLimit(movetime=thinkTime))
+            aiThinking = True
+        # checks if a valid move was made then generate the valid moves for the player
+        if moveMade:
+            if animate:
+                renderer.animate_move(gs.moveLog[-1], gs.board, clock)
+            if ponderMove is not None:  # the player moved while the computer pondered
+                if gs.moveLog[-1] == ponderMove:
+                    worker.ponderhit()  # the ponder search goes on as the search for the computer's move
+                    aiThinking = True
+                else:
+                    worker.cancel()
+                ponderMove = None
+            moveTable = MoveTable()
+            worker.request_moves(gs)
+            movesPending = True
+            moveMade = False
+            animate = False
+            humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
+            if nextPonderMove is not None and humanTurn and not gs.draw:
+                worker.request_ponder(gs, nextPonderMove, chess_ai.SearchLimit(movetime=thinkTime))
+                ponderMove = nextPonderMove
+            nextPonderMove = None
+
+        if profiler is not None and time.time() - statsTime >= 0.5:
+            now, moves = time.time(), profiler.counters['legalMoves']
+            renderer.set_stats('%d moves/s  last generation %.2f ms  cache hits %d%%' % (
+                (moves - statsMoves) / (now - statsTime), profiler.lastSeconds['get_valid_moves'] * 1000,
+                cache.stats()['hitRate'] * 100))
+            statsTime, statsMoves = now, moves
+
+        # only the squares that changed since the last frame are drawn and sent to the display
+        dirtyRects = renderer.render(gs, moveTable, currSq, text, promotionChoices)
         clock.tick(MAX_FPS)
-        p.display.flip()
+        if len(dirtyRects) > 0:
+            p.display.update(dirtyRects)
+    worker.shutdown()
+    if cachePath is not None:
+        cache.save()
+    if profiler is not None:
+        profiler.disable()
+    if searchWorkers > 1:
+        searcher.close()
+    if book is not None:
+        book.close()
+    if tablebases is not None:
+        tablebases.close()
+    if savePath is not None:
+        with open(savePath, 'w') as f:
+            f.write(chess_pgn.game_to_pgn(gs, {'Event': 'Casual game', 'White': 'Human' if playerOne else 'Computer',
+                                               'Black': 'Human' if playerTwo else 'Computer'}))
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Play chess against another person or the computer')
+    parser.add_argument('--computer', choices=['white', 'black', 'both'], help='side(s) played by the computer')
+    parser.add_argument('--think-time', type=float, default=1.0, help='seconds the computer thinks per move')
+    parser.add_argument('--save', metavar='FILE', help='write the game to FILE as PGN when the window is closed')
+    parser.add_argument('--book', metavar='FILE', help='opening book for the computer (see chess_book.py)')
+    parser.add_argument('--tablebases', metavar='DIR', help='endgame tables for the computer (see chess_tablebase.py)')
+    parser.add_argument('--search-workers', type=int, default=1, help='processes the computer searches with')
+    parser.add_argument('--stats', action='store_true', help='show move generation speed over the board')
+    parser.add_argument('--ponder', action='store_true', help='let the computer think on the player\'s time')
+    parser.add_argument('--cache', metavar='FILE', help='keep the analysis of positions in FILE between runs')
+    parser.add_argument('--cache-mb', type=float, default=chess_cache.DEFAULT_SIZE_MB,
+                        help='memory the position cache may use')
+    args = parser.parse_args()
+    main(playerOne=args.computer not in ('white', 'both'), playerTwo=args.computer not in ('black', 'both'),
+         thinkTime=args.think_time, savePath=args.save, bookPath=args.book, tablebaseDir=args.tablebases,
+         searchWorkers=args.search_workers, showStats=args.stats, ponder=args.ponder, cachePath=args.cache,
+         cacheMb=args.cache_mb)
@@ -0,0 +1,153 @@
+"""
+Perft: counts the leaf nodes of the move tree to a fixed depth using get_valid_moves, make_move and undo_move
+the counts of the standard test positions are known, so any difference points at a move generator bug,
+and the timings double as a benchmark of the move generator
+
+usage: python chess_perft.py [--depth N] [--position NAME | --fen FEN] [--divide]
+                             [--save-baseline FILE] [--baseline FILE] [--tolerance 0.15]
+"""
+import argparse
+import json
+import sys
+import time
+
+import chess_engine
+
+# name, fen and the expected node counts for depth 1, 2, 3...
+POSITIONS = [
+    ('startpos', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+     [20, 400, 8902, 197281, 4865609]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603]),
+    ('en passant', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     [14, 191, 2812, 43238, 674624]),
+    ('castling', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     [6, 264, 9467, 422333]),
+    ('promotion', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     [44, 1486, 62379, 2103487]),
+]
+# depth each position is searched to by default, chosen so the whole suite takes seconds rather than minutes
+DEFAULT_DEPTHS = {'startpos': 4, 'kiwipete': 3, 'en passant': 4, 'castling': 3, 'promotion': 3}
+
+"""
+Counts the leaf nodes of the move tree below the position to the given depth
+"""
+
+
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+    moves = gs.get_valid_moves()
+    if depth == 1:  # the leaves do not need to be played, only counted
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.make_move(move)
+        nodes += perft(gs, depth - 1)
+        gs.undo_move()
+    return nodes
+
+
+"""
+Gets the perft count below each legal move, useful to find the move a generator bug is hiding under
+"""
+
+
+def divide(gs, depth):
+    counts = []
+    for move in gs.get_valid_moves():
+        gs.make_move(move)
+        counts.append((move.get_chess_notation() + (move.promotionPiece.lower() if move.isPawnPromotion else ''),
+                       perft(gs, depth - 1)))
+        gs.undo_move()
+    return counts
+
+
+"""
+Runs perft on a position and times it, returns the node count and the time in seconds
+"""
+
+
+def timed_perft(fen, depth):
+    gs = chess_engine.GameState.from_fen(fen)
+    start = time.perf_counter()
+    nodes = perft(gs, depth)
+    return nodes, time.perf_counter() - start
+
+
+"""
+Runs the standard positions, checking the node counts and comparing the speed against a baseline if one is given
+returns a report with one entry per position
+"""
+
+
+def run_suite(depth=None, names=None, baseline=None, tolerance=0.15):
+    report = {}
+    for name, fen, expected in POSITIONS:
+        if names is not None and name not in names:
+            continue
+        positionDepth = depth if depth is not None else DEFAULT_DEPTHS[name]
+        nodes, seconds = timed_perft(fen, positionDepth)
+        entry = {'depth': positionDepth, 'nodes': nodes, 'seconds': round(seconds, 4),
+                 'nps': int(nodes / seconds) if seconds > 0 else 0, 'correct': None, 'slowdown': None}
+        if positionDepth <= len(expected):
+            entry['correct'] = nodes == expected[positionDepth - 1]
+        if baseline is not None and name in baseline and baseline[name]['depth'] == positionDepth:
+            # a drop in nodes per second beyond the tolerance is flagged as a slowdown
+            entry['slowdown'] = entry['nps'] < baseline[name]['nps'] * (1 - tolerance)
+        report[name] = entry
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Perft correctness and speed tests for the move generator')
+    parser.add_argument('--depth', type=int, help='depth to search (defaults to a quick depth per position)')
+    parser.add_argument('--position', action='append', help='name of a standard position to run (repeatable)')
+    parser.add_argument('--fen', help='run a single custom position instead of the standard ones')
+    parser.add_argument('--divide', action='store_true', help='print the node count below each root move')
+    parser.add_argument('--save-baseline', metavar='FILE', help='write the timings to FILE as the new baseline')
+    parser.add_argument('--baseline', metavar='FILE', help='flag positions that got slower than in FILE')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed drop in nodes/second (0.15 = 15%%)')
+    args = parser.parse_args(argv)
+
+    if args.fen is not None or args.divide:
+        fen = args.fen
+        if fen is None:
+            names = args.position or ['startpos']
+            fen = [p[1] for p in POSITIONS if p[0] == names[0]][0]
+        depth = args.depth or 3
+        if args.divide:
+            total = 0
+            for notation, nodes in divide(chess_engine.GameState.from_fen(fen), depth):
+                print(notation + ': ' + str(nodes))
+                total += nodes
+            print('total: ' + str(total))
+        else:
+            nodes, seconds = timed_perft(fen, depth)
+            print('depth %d: %d nodes in %.3fs (%d nodes/s)' % (depth, nodes, seconds, nodes / max(seconds, 1e-9)))
+        return 0
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report = run_suite(args.depth, args.position, baseline, args.tolerance)
+    failed = False
+    for name, entry in report.items():
+        status = ''
+        if entry['correct'] is False:
+            status += '  WRONG COUNT'
+            failed = True
+        if entry['slowdown']:
+            status += '  SLOWER than baseline (%d nodes/s)' % baseline[name]['nps']
+            failed = True
+        print('%-12s depth %d: %9d nodes %8.3fs %8d nodes/s%s' % (name, entry['depth'], entry['nodes'],
+                                                                  entry['seconds'], entry['nps'], status))
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,379 @@
+"""
+PGN reading and writing with standard algebraic notation (SAN)
+games are read one at a time from any file-like object so files of any size are streamed in constant memory,
+and replay_games spreads the replaying of a whole collection over a pool of worker processes
+
+usage: python chess_pgn.py GAMES.pgn [--workers N] [--fens]
+"""
+import argparse
+import collections
+import json
+import multiprocessing
+import re
+import sys
+import time
+
+import chess_engine
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+# the seven tag roster, written first and in this order
+ROSTER = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+
+HEADER_RE = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+SAN_RE = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+MOVE_NUMBER_RE = re.compile(r'^\d+\.+')
+# comments, either {...} (may span lines) or ; to the end of the line, and numeric annotation glyphs
+COMMENT_RE = re.compile(r'\{[^}]*\}|;[^\n]*|\$\d+')
+
+
+class PgnGame:
+    def __init__(self, headers=None, moves=None, result='*'):
+        self.headers = headers if headers is not None else collections.OrderedDict()
+        self.moves = moves if moves is not None else []  # SAN strings
+        self.result = result
+
+    """
+    Gets the position the game starts from, the FEN tag is used if there is one
+    """
+
+    def start_state(self):
+        if 'FEN' in self.headers:
+            return chess_engine.GameState.from_fen(self.headers['FEN'])
+        return chess_engine.GameState()
+
+
+"""
+Gets the SAN of a legal move in the position, e.g. Nbd7, exd5, O-O, e8=Q+
+validMoves are the legal moves of the position and are generated if not passed in
+"""
+
+
+def move_to_san(gs, move, validMoves=None):
+    if move.isCastle:
+        san = 'O-O' if move.endCol > move.startCol else 'O-O-O'
+    else:
+        pieceType = move.pieceMoved[1]
+        target = move.get_rank_file(move.endRow, move.endCol)
+        if pieceType == 'P':
+            san = (move.colsToFiles[move.startCol] + 'x' + target) if move.startCol != move.endCol else target
+            if move.isPawnPromotion:
+                san += '=' + move.promotionPiece
+        else:
+            if validMoves is None:
+                validMoves = gs.get_valid_moves()
+            # other pieces of the same type that can go to the same square decide how much of the start is needed
+            sameFile = sameRank = ambiguous = False
+            for other in validMoves:
+                if other.pieceMoved == move.pieceMoved and other.endRow == move.endRow and \
+                        other.endCol == move.endCol and not (other.startRow == move.startRow and
+                                                             other.startCol == move.startCol):
+                    ambiguous = True
+                    sameFile = sameFile or other.startCol == move.startCol
+                    sameRank = sameRank or other.startRow == move.startRow
+            san = pieceType
+            if ambiguous:
+                if not sameFile:
+                    san += move.colsToFiles[move.startCol]
+                elif not sameRank:
+                    san += move.rowsToRanks[move.startRow]
+                else:
+                    san += move.get_rank_file(move.startRow, move.startCol)
+            if move.pieceCapt != '--':
+                san += 'x'
+            san += target
+    return san + check_suffix(gs, move)
+
+
+"""
+Gets '+' if the move gives check, '#' if it mates and '' otherwise
+the game state's flags are left as they were
+"""
+
+
+def check_suffix(gs, move):
+    flags = gs.checkMate, gs.staleMate, gs.inCheck, gs.pins, gs.checks
+    gs.make_move(move)
+    suffix = ''
+    if gs.in_check():
+        suffix = '#' if len(gs.get_valid_moves()) == 0 else '+'
+    gs.undo_move()
+    gs.checkMate, gs.staleMate, gs.inCheck, gs.pins, gs.checks = flags
+    return suffix
+
+
+"""
+Finds the legal move a SAN string stands for, annotations like +, #, ! and ? are ignored
+without validMoves only the legal moves to the target square are generated
+raises ValueError if the SAN does not match exactly one legal move
+"""
+
+
+def san_to_move(gs, san, validMoves=None):
+    text = san.rstrip('+#!?')
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        if validMoves is None:
+            validMoves = gs.get_valid_moves()
+        kingSide = len(text) == 3
+        for move in validMoves:
+            if move.isCastle and (move.endCol > move.startCol) == kingSide:
+                return move
+        raise ValueError('illegal move ' + san)
+    match = SAN_RE.match(text)
+    if match is None:
+        raise ValueError('can not read move ' + san)
+    pieceType, fromFile, fromRank, target, promotion = match.groups()
+    pieceType = pieceType or 'P'
+    endRow = chess_engine.Move.ranksToRow[target[1]]
+    endCol = chess_engine.Move.filesToCols[target[0]]
+    if validMoves is None:  # only the moves to the target square are needed
+        validMoves = gs.get_valid_moves(targets=1 << (endRow * 8 + endCol))
+    found = None
+    for move in validMoves:
+        if move.endRow != endRow or move.endCol != endCol or move.pieceMoved[1] != pieceType or move.isCastle:
+            continue
+        if fromFile is not None and move.colsToFiles[move.startCol] != fromFile:
+            continue
+        if fromRank is not None and move.rowsToRanks[move.startRow] != fromRank:
+            continue
+        if move.isPawnPromotion and move.promotionPiece != (promotion or 'Q'):
+            continue
+        if found is not None:
+            raise ValueError('ambiguous move ' + san)
+        found = move
+    if found is None:
+        raise ValueError('illegal move ' + san)
+    return found
+
+
+"""
+Splits a PGN stream into the text of each game, reading one line at a time
+"""
+
+
+def iter_game_texts(f):
+    lines = []
+    inMoves = inComment = False
+    for line in f:
+        stripped = line.strip()
+        if not inComment and stripped.startswith('[') and HEADER_RE.match(stripped):
+            if inMoves:  # a header after movetext starts the next game
+                yield ''.join(lines)
+                lines = []
+                inMoves = False
+        elif stripped and not stripped.startswith('%'):
+            inMoves = True
+            if '{' in line or '}' in line:  # a {comment} can span lines and hold text that looks like a header
+                inComment = line.rfind('{') > line.rfind('}')
+        lines.append(line)
+    if inMoves or any(line.strip() for line in lines):
+        yield ''.join(lines)
+
+
+"""
+Parses the text of one game into a PgnGame, comments, NAGs and variations are dropped
+"""
+
+
+def parse_game(text):
+    game = PgnGame()
+    moveLines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        header = HEADER_RE.match(stripped) if not moveLines and stripped.startswith('[') else None
+        if header is not None:
+            game.headers[header.group(1)] = header.group(2).replace('\\"', '"').replace('\\\\', '\\')
+        elif stripped and not stripped.startswith('%'):
+            moveLines.append(line)
+    moveText = COMMENT_RE.sub(' ', '\n'.join(moveLines))
+    depth = 0
+    for token in moveText.replace('(', ' ( ').replace(')', ' ) ').split():
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth == 0:
+            token = MOVE_NUMBER_RE.sub('', token)
+            if token in RESULTS:
+                game.result = token
+            elif token:
+                game.moves.append(token)
+    if game.result == '*' and game.headers.get('Result') in RESULTS:
+        game.result = game.headers['Result']
+    return game
+
+
+"""
+Reads every game of a PGN file object, one at a time
+"""
+
+
+def read_games(f):
+    for text in iter_game_texts(f):
+        yield parse_game(text)
+
+
+"""
+Plays the moves of a game from its start position, returns the game state after the last move
+raises ValueError at the first illegal or unreadable move
+"""
+
+
+def replay(game):
+    gs = game.start_state()
+    for i, san in enumerate(game.moves):
+        try:
+            move = san_to_move(gs, san)
+        except ValueError as e:
+            raise ValueError('move %d: %s' % (i // 2 + 1, e))
+        gs.make_move(move)
+    return gs
+
+
+"""
+Formats headers, SAN moves and a result as PGN text
+moves are numbered from firstMove, and black moves first when whiteFirst is False (games set up from a FEN)
+"""
+
+
+def format_game(headers, sanMoves, result='*', firstMove=1, whiteFirst=True):
+    headers = dict(headers)
+    headers['Result'] = result
+    tags = [(tag, headers.pop(tag, '?')) for tag in ROSTER] + list(headers.items())
+    lines = ['[%s "%s"]' % (tag, str(value).replace('\\', '\\\\').replace('"', '\\"')) for tag, value in tags]
+    tokens = []
+    moveNumber = firstMove
+    white = whiteFirst
+    for i, san in enumerate(sanMoves):
+        if white:
+            tokens.append(str(moveNumber) + '.')
+        elif i == 0:
+            tokens.append(str(moveNumber) + '...')
+        tokens.append(san)
+        if not white:
+            moveNumber += 1
+        white = not white
+    tokens.append(result)
+    # movetext lines are kept under 80 characters
+    moveLines = []
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 79:
+            moveLines.append(line)
+            line = token
+        else:
+            line = line + ' ' + token if line else token
+    moveLines.append(line)
+    return '\n'.join(lines) + '\n\n' + '\n'.join(moveLines) + '\n'
+
+
+"""
+Writes the moves played on a game state as PGN, a FEN tag is added if the game did not start from the start position
+"""
+
+
+def game_to_pgn(gs, headers=None, result=None):
+    headers = collections.OrderedDict(headers or {})
+    start = gs.copy()
+    while len(start.moveLog) > 0:
+        start.undo_move()
+    startFen = start.to_fen()
+    if startFen != chess_engine.GameState().to_fen():
+        headers['SetUp'] = '1'
+        headers['FEN'] = startFen
+    firstMove, whiteFirst = start.fullmoveNumber, start.whiteToMove
+    sanMoves = []
+    for move in gs.moveLog:
+        sanMoves.append(move_to_san(start, move))
+        start.make_move(move)
+    if result is None:
+        result = '*'
+        if len(start.get_valid_moves()) == 0:
+            result = ('0-1' if start.whiteToMove else '1-0') if start.checkMate else '1/2-1/2'
+        elif start.draw:
+            result = '1/2-1/2'
+    return format_game(headers, sanMoves, result, firstMove, whiteFirst)
+
+
+def _replay_summary(text):
+    game = parse_game(text)
+    summary = {'headers': dict(game.headers), 'result': game.result, 'plies': len(game.moves), 'fen': None,
+               'error': None}
+    try:
+        summary['fen'] = replay(game).to_fen()
+    except ValueError as e:
+        summary['error'] = str(e)
+    return summary
+
+
+def _replay_chunk(job):
+    function, texts = job
+    return [function(text) for text in texts]
+
+
+"""
+Replays every game of a PGN file object across a pool of worker processes and yields a result per game, in order
+function(text) is called in the workers with the PGN text of each game, it has to be a module level function so
+it can be sent to them, by default it replays the game and gives its headers, result, ply count, final FEN and
+any error
+only a bounded number of chunks are in flight at a time, so memory stays constant however big the file is
+"""
+
+
+def replay_games(f, workers=None, function=_replay_summary, chunkSize=64):
+    texts = iter_game_texts(f)
+    if workers == 1:  # no pool, useful for profiling
+        for text in texts:
+            yield function(text)
+        return
+    pool = multiprocessing.Pool(workers)
+    pending = collections.deque()
+    maxPending = 2 * (workers or multiprocessing.cpu_count())
+    try:
+        chunk = []
+        for text in texts:
+            chunk.append(text)
+            if len(chunk) == chunkSize:
+                pending.append(pool.apply_async(_replay_chunk, ((function, chunk),)))
+                chunk = []
+                if len(pending) >= maxPending:
+                    for result in pending.popleft().get():
+                        yield result
+        if chunk:
+            pending.append(pool.apply_async(_replay_chunk, ((function, chunk),)))
+        while pending:
+            for result in pending.popleft().get():
+                yield result
+    finally:
+        pool.terminate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay the games of a PGN file and check every move')
+    parser.add_argument('pgn', help='PGN file, - for stdin')
+    parser.add_argument('--workers', type=int, help='worker processes (defaults to the number of cores)')
+    parser.add_argument('--fens', action='store_true', help='print a JSON line per game with its final FEN')
+    args = parser.parse_args(argv)
+
+    f = sys.stdin if args.pgn == '-' else open(args.pgn)
+    start = time.time()
+    games = plies = errors = 0
+    try:
+        for summary in replay_games(f, args.workers):
+            games += 1
+            plies += summary['plies']
+            if summary['error'] is not None:
+                errors += 1
+                sys.stderr.write('game %d: %s\n' % (games, summary['error']))
+            if args.fens:
+                print(json.dumps(summary))
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    seconds = time.time() - start
+    sys.stderr.write('%d games, %d moves, %d errors in %.2fs: %.1f games/sec\n' %
+                     (games, plies, errors, seconds, games / max(seconds, 1e-9)))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
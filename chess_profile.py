@@ -0,0 +1,272 @@
+"""
+Opt-in instrumentation of the move generator: counters for pseudo-legal and legal moves, attack queries and
+make/undo calls, plus a timing histogram for each instrumented function
+the generator only ever builds legal moves, the piece generators apply the pin and check masks as they go, so the
+pseudo-legal count is what they would give without the masks; it is worked out by running them again unmasked,
+outside the timings, for every call, so the search's staged generation counts a piece once per stage it runs
+instrumenting swaps timing wrappers onto GameState and Bitboards while a Profiler is enabled and puts the original
+functions back when it is disabled, so the engine runs its normal code at full speed when nobody is profiling
+the timings include the wrappers' own overhead, so they are best compared with each other; for where the time
+goes without that overhead use the cProfile export
+
+usage: python chess_profile.py [--fen FEN] [--depth 4] [--json report.json] [--pstats search.prof]
+"""
+import argparse
+import cProfile
+import json
+import pstats
+import sys
+import time
+
+import chess_ai
+import chess_bitboard
+import chess_engine
+from chess_bitboard import FULL
+
+COUNTERS = ('pseudoLegalMoves', 'legalMoves', 'attackQueries', 'makeMoves', 'undoMoves')
+# GameState methods that are timed, with the counter each one adds to
+GAME_STATE_FUNCTIONS = {
+    'get_valid_moves': 'legalMoves',
+    'get_all_moves': None,  # counted by the piece generators it calls
+    'get_capture_moves': None,  # both go through get_valid_moves, which counts their moves
+    'get_quiet_moves': None,
+    'make_move': 'makeMoves',
+    'undo_move': 'undoMoves',
+    'check_for_pins_and_checks': None,
+    'get_legal_piece_moves': None,
+    'get_king_targets': None,
+    'square_in_attack': None,
+    'is_square_attacked': None,
+    'get_attackers': None,
+    'get_attack_map': None,
+    # the piece generators count their moves before masking, except the queen's which adds through the rook and
+    # bishop
+    'get_pawn_moves': 'pseudoLegalMoves',
+    'get_rook_moves': 'pseudoLegalMoves',
+    'get_knight_moves': 'pseudoLegalMoves',
+    'get_bishop_moves': 'pseudoLegalMoves',
+    'get_queen_moves': None,
+    'get_king_moves': 'pseudoLegalMoves',
+    'get_castle_moves': 'pseudoLegalMoves',
+}
+# every attack query of the move generator and evaluation ends up in one of these
+BITBOARD_FUNCTIONS = {'is_attacked': 'attackQueries', 'attackers_to': 'attackQueries'}
+HISTOGRAM_BUCKETS = 24  # powers of two of microseconds, the last bucket holds everything from about 8 seconds up
+
+_enabled = None  # the profiler whose wrappers are installed, only one can be at a time
+
+
+class Profiler:
+    def __init__(self):
+        self.reset()
+        self.originals = None
+
+    def reset(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        names = list(GAME_STATE_FUNCTIONS) + ['Bitboards.' + name for name in BITBOARD_FUNCTIONS]
+        # calls of each function by duration: bucket i counts calls that took less than 2**i microseconds
+        self.histograms = {name: [0] * HISTOGRAM_BUCKETS for name in names}
+        self.calls = dict.fromkeys(names, 0)
+        self.seconds = dict.fromkeys(names, 0.0)
+        self.lastSeconds = dict.fromkeys(names, 0.0)  # how long the latest call took
+        self.started = time.time()
+
+    """
+    Installs the wrappers, raises RuntimeError if another profiler is already enabled
+    """
+
+    def enable(self):
+        global _enabled
+        if _enabled is self:
+            return
+        if _enabled is not None:
+            raise RuntimeError('another profiler is already enabled')
+        _enabled = self
+        state = chess_engine.GameState
+        bitboards = chess_bitboard.Bitboards
+        self.originals = ({name: state.__dict__[name] for name in GAME_STATE_FUNCTIONS},
+                          {name: bitboards.__dict__[name] for name in BITBOARD_FUNCTIONS},
+                          state.moveFunctions)
+        for name, counter in GAME_STATE_FUNCTIONS.items():
+            setattr(state, name, self.wrap(name, state.__dict__[name], counter))
+        for name, counter in BITBOARD_FUNCTIONS.items():
+            setattr(bitboards, name, self.wrap('Bitboards.' + name, bitboards.__dict__[name], counter))
+        # the move generator calls the piece generators through this table, not as methods
+        state.moveFunctions = {piece: state.__dict__[function.__name__]
+                               for piece, function in self.originals[2].items()}
+
+    def disable(self):
+        global _enabled
+        if _enabled is not self:
+            return
+        state = chess_engine.GameState
+        stateFunctions, bitboardFunctions, moveFunctions = self.originals
+        for name, function in stateFunctions.items():
+            setattr(state, name, function)
+        for name, function in bitboardFunctions.items():
+            setattr(chess_bitboard.Bitboards, name, function)
+        state.moveFunctions = moveFunctions
+        self.originals = None
+        _enabled = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.disable()
+
+    """
+    Makes the timing wrapper of one function, counter says what the wrapper counts:
+    moves returned by get_valid_moves, moves a piece generator adds to the list passed to it without a targets
+    mask, or calls
+    """
+
+    def wrap(self, name, function, counter):
+        histogram = self.histograms[name]
+        counters = self.counters
+        calls = self.calls
+        seconds = self.seconds
+        lastSeconds = self.lastSeconds
+        clock = time.perf_counter
+        lastBucket = HISTOGRAM_BUCKETS - 1
+
+        def timed(*args, **kwargs):
+            start = clock()
+            result = function(*args, **kwargs)
+            elapsed = clock() - start
+            calls[name] += 1
+            seconds[name] += elapsed
+            lastSeconds[name] = elapsed
+            histogram[min(int(elapsed * 1000000).bit_length(), lastBucket)] += 1
+            counters[counter] += 1
+            return result
+
+        def counted_result(*args, **kwargs):
+            start = clock()
+            result = function(*args, **kwargs)
+            elapsed = clock() - start
+            calls[name] += 1
+            seconds[name] += elapsed
+            lastSeconds[name] = elapsed
+            histogram[min(int(elapsed * 1000000).bit_length(), lastBucket)] += 1
+            counters[counter] += len(result)
+            return result
+
+        scratch = []
+
+        def counted_pseudo_legal(self, row, col, moves, *args):
+            first = len(moves)
+            start = clock()
+            result = function(self, row, col, moves, *args)
+            elapsed = clock() - start
+            calls[name] += 1
+            seconds[name] += elapsed
+            lastSeconds[name] = elapsed
+            histogram[min(int(elapsed * 1000000).bit_length(), lastBucket)] += 1
+            if len(args) == 0 or args[0] == FULL:
+                counters['pseudoLegalMoves'] += len(moves) - first
+            else:  # the moves were masked, so the piece's moves are generated again without the mask to count them
+                function(self, row, col, scratch, FULL)
+                counters['pseudoLegalMoves'] += len(scratch)
+                del scratch[:]
+            return result
+
+        def timed_only(*args, **kwargs):
+            start = clock()
+            result = function(*args, **kwargs)
+            elapsed = clock() - start
+            calls[name] += 1
+            seconds[name] += elapsed
+            lastSeconds[name] = elapsed
+            histogram[min(int(elapsed * 1000000).bit_length(), lastBucket)] += 1
+            return result
+
+        if counter is None:
+            wrapper = timed_only
+        elif counter == 'pseudoLegalMoves':
+            wrapper = counted_pseudo_legal
+        elif counter == 'legalMoves':
+            wrapper = counted_result
+        else:
+            wrapper = timed
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+
+    """
+    Gets the counters and timings as a dict that can be written as JSON
+    """
+
+    def report(self):
+        elapsed = time.time() - self.started
+        functions = {}
+        for name, calls in self.calls.items():
+            if calls == 0:
+                continue
+            histogram = self.histograms[name]
+            functions[name] = {
+                'calls': calls,
+                'seconds': round(self.seconds[name], 6),
+                'meanMicroseconds': round(self.seconds[name] / calls * 1000000, 3),
+                'lastMicroseconds': round(self.lastSeconds[name] * 1000000, 3),
+                # upper bound of each bucket in microseconds, empty buckets are left out
+                'histogram': {'<%d' % (1 << i): count for i, count in enumerate(histogram) if count > 0},
+            }
+        rates = {name + 'PerSecond': int(count / elapsed) if elapsed > 0 else 0
+                 for name, count in self.counters.items()}
+        return {'seconds': round(elapsed, 3), 'counters': dict(self.counters), 'rates': rates, 'functions': functions}
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+
+"""
+Runs function(*args) under cProfile and writes the stats to path for pstats or a viewer like snakeviz
+returns what the function returned
+"""
+
+
+def run_cprofile(path, function, *args):
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(function, *args)
+    finally:
+        profile.dump_stats(path)
+
+
+def format_report(report):
+    lines = ['%.2fs' % report['seconds']]
+    for name, count in report['counters'].items():
+        lines.append('%-18s %12d %10d/s' % (name, count, report['rates'][name + 'PerSecond']))
+    lines.append('%-28s %10s %10s %12s' % ('function', 'calls', 'seconds', 'mean us'))
+    for name, stats in sorted(report['functions'].items(), key=lambda item: -item[1]['seconds']):
+        lines.append('%-28s %10d %10.3f %12.2f' % (name, stats['calls'], stats['seconds'], stats['meanMicroseconds']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Profile a search of a position')
+    parser.add_argument('--fen', help='position to search (defaults to the start position)')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--json', metavar='FILE', help='write the instrumentation report as JSON')
+    parser.add_argument('--pstats', metavar='FILE', help='also run the search under cProfile and write the stats')
+    args = parser.parse_args(argv)
+
+    gs = chess_engine.GameState.from_fen(args.fen) if args.fen else chess_engine.GameState()
+    limit = chess_ai.SearchLimit(depth=args.depth)
+    with Profiler() as profiler:
+        chess_ai.Searcher().search(gs, limit)
+    report = profiler.report()
+    print(format_report(report))
+    if args.json is not None:
+        profiler.write_json(args.json)
+    if args.pstats is not None:
+        run_cprofile(args.pstats, chess_ai.Searcher().search, gs, limit)
+        pstats.Stats(args.pstats).sort_stats('cumulative').print_stats(15)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
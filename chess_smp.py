@@ -0,0 +1,354 @@
+"""
+Parallel search (Lazy SMP): several worker processes search the same position at once and share one
+transposition table in shared memory, so what one worker finds cuts the search of the others short
+each worker owns its own GameState built from the FEN of the position, the first worker keeps to the search limit
+and the others (helpers) search until it is done, every second helper starting a ply deeper so they spread out
+over different parts of the tree; the deepest finished search gives the move
+processes are used instead of threads because a search in Python holds the GIL, needs Python 3.8+ for shared memory
+
+usage: python chess_smp.py bench [--workers 1 2 4] [--depth 5] [--fen FEN ...]
+       python chess_smp.py search --fen FEN [--workers 4] [--movetime 5]
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+from multiprocessing import shared_memory
+
+import chess_ai
+import chess_engine
+import chess_tablebase
+
+# positions the benchmark searches, from the opening, a busy middlegame and an endgame
+BENCH_FENS = [
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP3PPP/R2QKB1R w KQ - 0 8',
+    'r2q1rk1/1b2bppp/p2ppn2/1p6/3QP3/1BN1B3/PPP2PPP/R4RK1 w - - 0 12',
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+]
+
+
+"""
+A transposition table whose entries live in shared memory, one process creates it and the others attach by name
+processes write entries without locking, so the key is stored xored with the data: an entry torn by two processes
+writing at once no longer matches its key and reads as empty instead of giving another position's result
+"""
+
+
+class SharedTranspositionTable(chess_ai.TranspositionTable):
+    def __init__(self, sizeMb=16, name=None):
+        # sized the same way as TranspositionTable so workers given the same size agree on the layout
+        entries = 1
+        while entries * 2 * 16 <= sizeMb * 1024 * 1024:
+            entries *= 2
+        self.mask = entries - 1
+        self.age = 0
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=entries * 16)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.keys = self.memory.buf[:entries * 8].cast('Q')
+        self.data = self.memory.buf[entries * 8:entries * 16].cast('Q')
+
+    def close(self):
+        # the views have to be let go before the memory can be
+        self.keys.release()
+        self.data.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def probe(self, key):
+        index = key & self.mask
+        data = self.data[index]
+        if self.keys[index] ^ data != key:
+            return None
+        return data & 0xFFFF, (data >> 16 & 0xFFFFF) - 0x80000, data >> 36 & 0x7F, data >> 43 & 3
+
+    def store(self, key, move, score, depth, flag):
+        index = key & self.mask
+        oldData = self.data[index]
+        oldKey = self.keys[index] ^ oldData
+        if oldKey and oldKey != key:
+            if oldData >> 45 == self.age and oldData >> 36 & 0x7F > depth:
+                return
+        elif oldKey == key and move == 0:
+            move = oldData & 0xFFFF
+        data = move | (score + 0x80000) << 16 | min(depth, 0x7F) << 36 | flag << 43 | self.age << 45
+        self.data[index] = data
+        self.keys[index] = key ^ data
+
+
+class _WorkerSearcher(chess_ai.Searcher):
+    # a searcher that also stops when the shared stop flag is raised by the parent process, and turns a ponder
+    # search into a normal one when the parent raises the ponderhit flag
+    def __init__(self, table, stopFlag, ponderFlag, tablebases=None):
+        chess_ai.Searcher.__init__(self, 0, tablebases)
+        self.tt = table
+        self.stopFlag = stopFlag
+        self.ponderFlag = ponderFlag
+
+    def check_limits(self):
+        if self.stopFlag.value:
+            self.stopped = True
+        if self.pondering and self.ponderFlag.value:
+            self.ponderhit()
+        chess_ai.Searcher.check_limits(self)
+
+    def clear(self):
+        # the shared table is cleared by the parent process, only this worker's own move ordering is forgotten
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        self.history = [0] * 4096
+
+
+def _worker_main(index, conn, ttName, ttSizeMb, stopFlag, ponderFlag, tablebaseDir):
+    # runs in each worker process: searches every job sent down the pipe until told to quit with None
+    table = SharedTranspositionTable(ttSizeMb, ttName)
+    tablebases = chess_tablebase.Tablebases(tablebaseDir) if tablebaseDir is not None else None
+    searcher = _WorkerSearcher(table, stopFlag, ponderFlag, tablebases)
+    try:
+        while True:
+            job = conn.recv()
+            if job is None:
+                break
+            if job == 'clear':
+                searcher.clear()
+                continue
+            fen, moves, depth, nodes, movetime, ponder = job
+            gs = chess_engine.GameState.from_fen(fen)
+            for move in ParallelSearcher.decode_pv(gs, moves):
+                gs.make_move(move)
+            # only the first worker keeps to the node and time limits, helpers run until it is done
+            if index == 0:
+                limit = chess_ai.SearchLimit(depth, nodes, movetime, ponder)
+            else:
+                limit = chess_ai.SearchLimit(depth)
+            result = searcher.search(gs, limit, 1 + index % 2)
+            conn.send({'bestMove': result.bestMove.encode() if result.bestMove is not None else 0,
+                       'pv': [move.encode() for move in result.pv], 'score': result.score, 'depth': result.depth,
+                       'nodes': result.nodes, 'time': result.time, 'nps': result.nps})
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        if tablebases is not None:
+            tablebases.close()
+        table.close()
+
+
+class ParallelSearchResult(chess_ai.SearchResult):
+    def __init__(self):
+        chess_ai.SearchResult.__init__(self)
+        # one entry per worker, the first worker is the one that keeps to the search limit
+        self.workerNodes = []
+        self.workerNps = []
+        self.workerDepths = []
+
+
+"""
+Drop-in replacement for chess_ai.Searcher that searches with a number of worker processes
+the processes are started once and kept for every search, close() shuts them down
+a node limit only counts the nodes of the first worker
+"""
+
+
+class ParallelSearcher:
+    def __init__(self, workers=None, ttSizeMb=16, tablebaseDir=None):
+        self.workers = workers if workers is not None else multiprocessing.cpu_count()
+        self.tt = SharedTranspositionTable(ttSizeMb)
+        self.stopFlag = multiprocessing.RawValue('b', 0)
+        self.ponderFlag = multiprocessing.RawValue('b', 0)
+        self.stopCount = 0  # see chess_ai.Searcher.stop
+        self.conns = []
+        self.processes = []
+        for index in range(self.workers):
+            parentConn, childConn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker_main, daemon=True,
+                                              args=(index, childConn, self.tt.name, ttSizeMb, self.stopFlag,
+                                                    self.ponderFlag, tablebaseDir))
+            process.start()
+            childConn.close()
+            self.conns.append(parentConn)
+            self.processes.append(process)
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except (OSError, BrokenPipeError):
+                pass
+        for process in self.processes:
+            process.join(5)
+        for conn in self.conns:
+            conn.close()
+        self.conns = []
+        self.processes = []
+        self.tt.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    """
+    Asks a running search to stop, safe to call from another thread
+    """
+
+    def stop(self):
+        self.stopCount += 1
+        self.stopFlag.value = 1
+
+    """
+    Turns a running ponder search into a normal one, see chess_ai.Searcher.ponderhit
+    """
+
+    def ponderhit(self):
+        self.ponderFlag.value = 1
+
+    """
+    Forgets what earlier searches learned, must not be called while searching
+    """
+
+    def clear(self):
+        self.tt.clear()
+        for conn in self.conns:
+            conn.send('clear')
+
+    """
+    Searches the position on every worker until the limit is reached, the game state is not changed
+    stopCount works as for chess_ai.Searcher.search
+    """
+
+    def search(self, gs, limit, stopCount=None):
+        startTime = time.time()
+        # a stop that came after the search was asked for raises the flag again, the workers then stop at once
+        self.stopFlag.value = 0
+        if stopCount is not None and stopCount != self.stopCount:
+            self.stopFlag.value = 1
+        # lowered before the limit is read so a ponderhit for this search can not be lost in between
+        self.ponderFlag.value = 0
+        ponder = limit.ponder
+        if not ponder:
+            self.ponderFlag.value = 1
+        # the moves since the last capture or pawn move go along so the workers see repetitions of the game
+        history = gs.copy()
+        moves = []
+        while len(history.moveLog) > 0 and len(moves) < gs.halfmoveClock:
+            moves.append(history.moveLog[-1].encode())
+            history.undo_move()
+        moves.reverse()
+        job = (history.to_fen(), moves, limit.depth, limit.nodes, limit.movetime, ponder)
+        for conn in self.conns:
+            conn.send(job)
+        replies = [self.conns[0].recv()]
+        self.stopFlag.value = 1  # the first worker is done so the helpers stop too
+        replies.extend(conn.recv() for conn in self.conns[1:])
+        # the deepest finished search is the best informed, the first worker wins ties
+        best = max(range(len(replies)), key=lambda i: (replies[i]['depth'], i == 0))
+        result = ParallelSearchResult()
+        result.score = replies[best]['score']
+        result.depth = replies[best]['depth']
+        result.pv = self.decode_pv(gs, replies[best]['pv'] or [replies[best]['bestMove']])
+        result.bestMove = result.pv[0] if len(result.pv) > 0 else None
+        result.workerNodes = [reply['nodes'] for reply in replies]
+        result.workerNps = [reply['nps'] for reply in replies]
+        result.workerDepths = [reply['depth'] for reply in replies]
+        result.nodes = sum(result.workerNodes)
+        result.time = time.time() - startTime
+        result.nps = int(result.nodes / result.time) if result.time > 0 else 0
+        return result
+
+    """
+    Turns packed moves into the Move objects of each position along the line, stopping at the first illegal one
+    """
+
+    @staticmethod
+    def decode_pv(gs, packedMoves):
+        checkMate, staleMate = gs.checkMate, gs.staleMate
+        pv = []
+        for packed in packedMoves:
+            move = None
+            for validMove in gs.get_valid_moves():
+                if validMove.encode() == packed:
+                    move = validMove
+                    break
+            if move is None:
+                break
+            pv.append(move)
+            gs.make_move(move)
+        for _ in pv:
+            gs.undo_move()
+        gs.checkMate, gs.staleMate = checkMate, staleMate
+        return pv
+
+
+"""
+Searches every position to a fixed depth with each worker count, returns {workers: (seconds, nodes, nps list)}
+"""
+
+
+def bench(workerCounts, depth, fens=BENCH_FENS, ttSizeMb=16, log=None):
+    results = {}
+    for workers in workerCounts:
+        with ParallelSearcher(workers, ttSizeMb) as searcher:
+            seconds = nodes = 0
+            workerNps = [0] * workers
+            for fen in fens:
+                searcher.tt.clear()
+                result = searcher.search(chess_engine.GameState.from_fen(fen), chess_ai.SearchLimit(depth=depth))
+                seconds += result.time
+                nodes += result.nodes
+                workerNps = [total + nps for total, nps in zip(workerNps, result.workerNps)]
+            results[workers] = (seconds, nodes, [nps // len(fens) for nps in workerNps])
+        if log is not None:
+            log(workers, *results[workers])
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parallel search across processes')
+    commands = parser.add_subparsers(dest='command')
+    benchParser = commands.add_parser('bench', help='time to depth of the benchmark positions by worker count')
+    benchParser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    benchParser.add_argument('--depth', type=int, default=4)
+    benchParser.add_argument('--fen', nargs='+', help='positions to search instead of the built in set')
+    benchParser.add_argument('--tt-mb', type=int, default=16)
+    searchParser = commands.add_parser('search', help='search one position')
+    searchParser.add_argument('--fen', default=chess_engine.GameState().to_fen())
+    searchParser.add_argument('--workers', type=int, help='worker processes (defaults to the number of cores)')
+    searchParser.add_argument('--depth', type=int)
+    searchParser.add_argument('--movetime', type=float, default=5.0)
+    searchParser.add_argument('--tt-mb', type=int, default=16)
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        baseline = []
+
+        def log(workers, seconds, nodes, workerNps):
+            if len(baseline) == 0:
+                baseline.append(seconds)
+            print('%2d workers: %8.2fs %10d nodes %8d nodes/s  speedup %.2fx  per worker %s' %
+                  (workers, seconds, nodes, nodes / seconds, baseline[0] / seconds, workerNps))
+
+        bench(args.workers, args.depth, args.fen or BENCH_FENS, args.tt_mb, log)
+    elif args.command == 'search':
+        gs = chess_engine.GameState.from_fen(args.fen)
+        with ParallelSearcher(args.workers, args.tt_mb) as searcher:
+            result = searcher.search(gs, chess_ai.SearchLimit(depth=args.depth, movetime=args.movetime))
+        print('best move %s score %d depth %d' % (result.bestMove.get_chess_notation() if result.bestMove else '-',
+                                                  result.score, result.depth))
+        print('%d nodes in %.2fs, %d nodes/s' % (result.nodes, result.time, result.nps))
+        for index, (nodes, nps, depth) in enumerate(zip(result.workerNodes, result.workerNps, result.workerDepths)):
+            print('  worker %d: %d nodes, %d nodes/s, depth %d' % (index, nodes, nps, depth))
+    else:
+        parser.print_help()
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,664 @@
+"""
+Endgame tablebases for positions with up to 4 pieces (KQvK, KRvK, KPvK, KBNvK, KRvKN...)
+each table holds, for every placement of its pieces and side to move, whether the side to move wins, draws or
+loses and how many plies it takes to mate, packed into 16 bits per position and memory-mapped for probing
+
+tables are built by retrograde analysis: checkmates are found first, then positions one ply further from mate
+are found by unmaking moves from the positions already solved, until nothing changes; captures and promotions
+lead into smaller tables which are built first
+castling and en passant are not part of the tables, positions with castle rights or a legal en passant capture
+are not probed (and en passant after a double pawn push is not considered while building tables with pawns on both
+sides)
+
+usage: python chess_tablebase.py generate KQvK KRvK KPvK [--dir tablebases] [--workers N]
+       python chess_tablebase.py probe --fen FEN [--dir tablebases]
+"""
+import argparse
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+from array import array
+
+from chess_bitboard import KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, rook_attacks, bishop_attacks, \
+    queen_attacks, squares, popcount
+
+MAX_PIECES = 4
+PIECE_ORDER = 'KQRBNP'
+PROMOTIONS = 'QRBN'
+
+# results from the view of the side to move, packed as result << 14 | plies to mate
+DRAW, WIN, LOSS, ILLEGAL = 0, 1, 2, 3
+MAX_PLIES = (1 << 14) - 1
+ENTRY = struct.Struct('<H')
+
+# the white king is moved into the a1-d4 quarter of the board by mirroring files and ranks, or only into the
+# a-d files when there are pawns (they can not be mirrored top to bottom), mirrors have no fixed squares so no
+# position is its own mirror image, which keeps the move counts of the retrograde analysis exact
+_PAWNLESS_KING = [sq for sq in range(64) if sq >> 3 >= 4 and sq & 7 < 4]
+_PAWN_KING = [sq for sq in range(64) if sq & 7 < 4]
+PAWNLESS_KING_INDEX = {sq: i for i, sq in enumerate(_PAWNLESS_KING)}
+PAWN_KING_INDEX = {sq: i for i, sq in enumerate(_PAWN_KING)}
+# xor applied to every square to bring the white king into its part of the board
+PAWNLESS_MIRROR = [(0 if sq & 7 < 4 else 7) | (0 if sq >> 3 >= 4 else 56) for sq in range(64)]
+PAWN_MIRROR = [0 if sq & 7 < 4 else 7 for sq in range(64)]
+
+
+"""
+Splits a signature like KRvKN into the pieces of each side, raises ValueError if it is not a valid one
+"""
+
+
+def parse_signature(signature):
+    sides = signature.upper().split('V')
+    if len(sides) != 2 or any(len(side) == 0 or side[0] != 'K' or 'K' in side[1:] or
+                              any(piece not in PIECE_ORDER for piece in side) for side in sides):
+        raise ValueError('bad tablebase signature ' + signature)
+    if len(sides[0]) + len(sides[1]) > MAX_PIECES:
+        raise ValueError('tablebases go up to %d pieces: %s' % (MAX_PIECES, signature))
+    return sides[0], sides[1]
+
+
+def _strength(side):
+    return len(side), [-PIECE_ORDER.index(piece) for piece in side]
+
+
+"""
+Gets the signature a table is stored under and if the colors have to be swapped to use it
+the stronger side is always white, pieces are listed king first then from queen down to pawn
+"""
+
+
+def canonical_signature(white, black):
+    white = ''.join(sorted(white, key=PIECE_ORDER.index))
+    black = ''.join(sorted(black, key=PIECE_ORDER.index))
+    if _strength(black) > _strength(white):
+        return black + 'v' + white, True
+    return white + 'v' + black, False
+
+
+class Table:
+    def __init__(self, signature):
+        self.signature = signature
+        white, black = parse_signature(signature)
+        # the pieces in index order: white king first, then the rest of white, then black
+        self.pieces = [('w', piece) for piece in white] + [('b', piece) for piece in black]
+        self.hasPawns = 'P' in white + black
+        self.kingIndex = PAWN_KING_INDEX if self.hasPawns else PAWNLESS_KING_INDEX
+        self.kingSquares = _PAWN_KING if self.hasPawns else _PAWNLESS_KING
+        self.mirror = PAWN_MIRROR if self.hasPawns else PAWNLESS_MIRROR
+        self.size = len(self.kingSquares) * 64 ** (len(self.pieces) - 1) * 2
+        self.data = None
+        self.file = None
+
+    """
+    Gets the index of a placement (squares in the order of self.pieces) and side to move
+    the placement is mirrored first if the white king is outside its part of the board
+    """
+
+    def index(self, placement, whiteToMove):
+        flip = self.mirror[placement[0]]
+        index = self.kingIndex[placement[0] ^ flip]
+        for sq in placement[1:]:
+            index = index * 64 + (sq ^ flip)
+        return index * 2 + (0 if whiteToMove else 1)
+
+    """
+    Gets the (placement, white to move) of an index
+    """
+
+    def placement(self, index):
+        whiteToMove = index & 1 == 0
+        index >>= 1
+        placement = []
+        for _ in range(len(self.pieces) - 1):
+            placement.append(index & 63)
+            index >>= 6
+        placement.append(self.kingSquares[index])
+        placement.reverse()
+        return placement, whiteToMove
+
+    def open(self, path):
+        self.file = open(path, 'rb')
+        if self.file.seek(0, 2) != self.size * ENTRY.size:
+            self.file.close()
+            raise ValueError(path + ' does not hold a ' + self.signature + ' table')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.file.close()
+            self.data = None
+
+    """
+    Returns (result, plies to mate) for a placement and side to move
+    """
+
+    def probe(self, placement, whiteToMove):
+        entry = ENTRY.unpack_from(self.data, self.index(placement, whiteToMove) * ENTRY.size)[0]
+        return entry >> 14, entry & MAX_PLIES
+
+
+"""
+The tables of a directory, opened the first time they are needed
+"""
+
+
+class Tablebases:
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+        self.maxPieces = MAX_PIECES
+        self.hits = 0
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables = {}
+
+    def path(self, signature):
+        return os.path.join(self.directory, signature + '.tb')
+
+    def table(self, signature):
+        if signature not in self.tables:
+            table = None
+            if os.path.exists(self.path(signature)):
+                table = Table(signature)
+                table.open(self.path(signature))
+            self.tables[signature] = table
+        return self.tables[signature]
+
+    """
+    Looks up a position given as a list of (color, piece type, square)
+    returns (result, plies to mate) from the view of the side to move or None if there is no table for it
+    """
+
+    def probe_pieces(self, pieces, whiteToMove):
+        if len(pieces) == 2:  # two bare kings
+            return DRAW, 0
+        white = ''.join(piece for color, piece, sq in pieces if color == 'w')
+        black = ''.join(piece for color, piece, sq in pieces if color == 'b')
+        if len(white) + len(black) > MAX_PIECES:
+            return None
+        signature, swap = canonical_signature(white, black)
+        table = self.table(signature)
+        if table is None:
+            return None
+        if swap:  # play the position with colors swapped and the board turned over
+            pieces = [('b' if color == 'w' else 'w', piece, sq ^ 56) for color, piece, sq in pieces]
+            whiteToMove = not whiteToMove
+        placement = []
+        for color, piece in table.pieces:
+            for i in range(len(pieces)):
+                if pieces[i][0] == color and pieces[i][1] == piece:
+                    placement.append(pieces[i][2])
+                    pieces = pieces[:i] + pieces[i + 1:]
+                    break
+        return table.probe(placement, whiteToMove)
+
+    """
+    Looks up a game state, returns (result, plies to mate) from the view of the player to move
+    or None if there are too many pieces, no table, castle rights, a legal en passant capture or the position is
+    illegal; an en passant square nothing can capture on is the same position as without it
+    """
+
+    def probe(self, gs):
+        if gs.castleRights or _can_capture_en_passant(gs):
+            return None
+        bitboards = gs.bitboards
+        if popcount(bitboards.occupied) > MAX_PIECES:
+            return None
+        pieces = []
+        for piece, bb in bitboards.pieces.items():
+            for sq in squares(bb):
+                pieces.append((piece[0], piece[1], sq))
+        result = self.probe_pieces(pieces, gs.whiteToMove)
+        if result is None or result[0] == ILLEGAL:  # the side that is not to move is in check
+            return None
+        self.hits += 1
+        return result
+
+    """
+    Gets the legal move that keeps the best result: the fastest mate when winning, the slowest when losing
+    returns (move, result, plies to mate) or None if the position or one of its moves can not be probed
+    """
+
+    def best_move(self, gs):
+        checkMate, staleMate = gs.checkMate, gs.staleMate
+        moves = gs.get_valid_moves()
+        gs.checkMate, gs.staleMate = checkMate, staleMate
+        best = None
+        bestRank = None
+        for move in moves:
+            gs.make_move(move)
+            probed = self.probe(gs)
+            gs.undo_move()
+            if probed is None:
+                return None
+            result, plies = probed
+            # rank moves by the result for the side that plays them: a win sooner, then a draw, then a loss later
+            if result == LOSS:
+                rank = (2, -plies)
+            elif result == DRAW:
+                rank = (1, 0)
+            else:
+                rank = (0, plies)
+            if bestRank is None or rank > bestRank:
+                best = (move, {LOSS: WIN, DRAW: DRAW, WIN: LOSS}[result], plies + 1 if result != DRAW else 0)
+                bestRank = rank
+        return best
+
+
+def _can_capture_en_passant(gs):
+    if gs.possibleEnPassant == ():
+        return False
+    row, col = gs.possibleEnPassant
+    # the capturing pawns stand next to the pawn that was pushed two squares
+    pawnRow, pawn = (row + 1, 'wP') if gs.whiteToMove else (row - 1, 'bP')
+    if not any(0 <= c < 8 and gs.board[pawnRow][c] == pawn for c in (col - 1, col + 1)):
+        return False
+    checkMate, staleMate = gs.checkMate, gs.staleMate
+    moves = gs.get_valid_moves(targets=1 << (row * 8 + col))
+    gs.checkMate, gs.staleMate = checkMate, staleMate
+    return any(move.isEnPassant for move in moves)
+
+
+def _attacked(sq, color, pieces, occupied):
+    # if any piece of color attacks sq, pieces are (color, piece type, square)
+    for pieceColor, piece, pieceSq in pieces:
+        if pieceColor != color:
+            continue
+        if piece == 'K':
+            attacks = KING_ATTACKS[pieceSq]
+        elif piece == 'N':
+            attacks = KNIGHT_ATTACKS[pieceSq]
+        elif piece == 'P':
+            attacks = PAWN_ATTACKS[color][pieceSq]
+        elif piece == 'R':
+            attacks = rook_attacks(pieceSq, occupied)
+        elif piece == 'B':
+            attacks = bishop_attacks(pieceSq, occupied)
+        else:
+            attacks = queen_attacks(pieceSq, occupied)
+        if attacks >> sq & 1:
+            return True
+    return False
+
+
+def _in_check(color, pieces, occupied):
+    for pieceColor, piece, sq in pieces:
+        if pieceColor == color and piece == 'K':
+            return _attacked(sq, 'b' if color == 'w' else 'w', pieces, occupied)
+    return False
+
+
+def _targets(color, piece, sq, occupied, own, enemy):
+    # end squares of the moves of one piece, pawns included, each with the promotion pieces it can become
+    if piece == 'P':
+        step = -8 if color == 'w' else 8
+        ends = PAWN_ATTACKS[color][sq] & enemy
+        if not occupied >> (sq + step) & 1:
+            ends |= 1 << (sq + step)
+            if sq >> 3 == (6 if color == 'w' else 1) and not occupied >> (sq + 2 * step) & 1:
+                ends |= 1 << (sq + 2 * step)
+        return ends
+    if piece == 'K':
+        return KING_ATTACKS[sq] & ~own
+    if piece == 'N':
+        return KNIGHT_ATTACKS[sq] & ~own
+    if piece == 'R':
+        return rook_attacks(sq, occupied) & ~own
+    if piece == 'B':
+        return bishop_attacks(sq, occupied) & ~own
+    return queen_attacks(sq, occupied) & ~own
+
+
+"""
+Yields the legal moves of a position as (new pieces, is exit) where pieces are (color, piece type, square)
+a move is an exit if it captures or promotes, it then leads into another table
+"""
+
+
+def _moves(pieces, whiteToMove):
+    color = 'w' if whiteToMove else 'b'
+    occupied = own = 0
+    for pieceColor, piece, sq in pieces:
+        occupied |= 1 << sq
+        if pieceColor == color:
+            own |= 1 << sq
+    enemy = occupied & ~own
+    for i, (pieceColor, piece, sq) in enumerate(pieces):
+        if pieceColor != color:
+            continue
+        for end in squares(_targets(color, piece, sq, occupied, own, enemy)):
+            captured = enemy >> end & 1
+            newPieces = [p for p in pieces if p[2] != end] if captured else list(pieces)
+            j = newPieces.index((pieceColor, piece, sq))
+            if piece == 'P' and end >> 3 in (0, 7):
+                for promotion in PROMOTIONS:
+                    newPieces[j] = (color, promotion, end)
+                    if not _in_check(color, newPieces, occupied & ~(1 << sq) | (1 << end)):
+                        yield list(newPieces), True
+                continue
+            newPieces[j] = (color, piece, end)
+            if not _in_check(color, newPieces, occupied & ~(1 << sq) | (1 << end)):
+                yield newPieces, bool(captured)
+
+
+"""
+Yields the placements the side that just moved could have come from without capturing or promoting
+"""
+
+
+def _unmoves(table, placement, whiteToMove):
+    color = 'b' if whiteToMove else 'w'  # the side that made the last move
+    occupied = 0
+    for sq in placement:
+        occupied |= 1 << sq
+    empty = ~occupied
+    for i, (pieceColor, piece) in enumerate(table.pieces):
+        if pieceColor != color:
+            continue
+        sq = placement[i]
+        if piece == 'P':
+            back = 8 if color == 'w' else -8
+            starts = 0
+            row = sq >> 3
+            if (color == 'w' and row < 6) or (color == 'b' and row > 1):
+                if empty >> (sq + back) & 1:
+                    starts |= 1 << (sq + back)
+                    if row == (4 if color == 'w' else 3) and empty >> (sq + 2 * back) & 1:
+                        starts |= 1 << (sq + 2 * back)
+        elif piece == 'K':
+            starts = KING_ATTACKS[sq] & empty
+        elif piece == 'N':
+            starts = KNIGHT_ATTACKS[sq] & empty
+        elif piece == 'R':
+            starts = rook_attacks(sq, occupied) & empty
+        elif piece == 'B':
+            starts = bishop_attacks(sq, occupied) & empty
+        else:
+            starts = queen_attacks(sq, occupied) & empty
+        for start in squares(starts):
+            previous = list(placement)
+            previous[i] = start
+            yield previous
+
+
+def _init_chunk(job):
+    # first pass over part of a table: finds illegal positions, checkmates, counts the moves that stay in the
+    # table and scores the moves that leave it from the smaller tables
+    signature, directory, start, end = job
+    table = Table(signature)
+    tablebases = Tablebases(directory)
+    results = array('B', [DRAW]) * (end - start)
+    counts = array('B', [0]) * (end - start)
+    floors = array('H', [0]) * (end - start)  # loss plies forced by moves into other tables
+    pending = []  # (index, result, plies) found through moves into other tables
+    for index in range(start, end):
+        placement, whiteToMove = table.placement(index)
+        pieces = [(color, piece, placement[i]) for i, (color, piece) in enumerate(table.pieces)]
+        occupied = 0
+        for sq in placement:
+            occupied |= 1 << sq
+        legal = popcount(occupied) == len(placement) and \
+            not any(piece == 'P' and sq >> 3 in (0, 7) for color, piece, sq in pieces) and \
+            not _in_check('b' if whiteToMove else 'w', pieces, occupied)
+        if not legal:
+            results[index - start] = ILLEGAL
+            continue
+        count = 0
+        bestWin = None
+        hasMoves = False
+        for newPieces, exit in _moves(pieces, whiteToMove):
+            hasMoves = True
+            if not exit:
+                count += 1
+                continue
+            result, plies = tablebases.probe_pieces(newPieces, not whiteToMove)
+            if result == LOSS:
+                bestWin = plies + 1 if bestWin is None else min(bestWin, plies + 1)
+            elif result == WIN:
+                floors[index - start] = max(floors[index - start], plies + 1)
+            else:
+                count += 1  # a drawing way out, this position can never be lost
+        if not hasMoves:
+            if _in_check('w' if whiteToMove else 'b', pieces, occupied):
+                pending.append((index, LOSS, 0))
+            continue  # stalemate stays a draw
+        if bestWin is not None:
+            pending.append((index, WIN, bestWin))
+            count += 1  # a winning position is never lost however its other moves turn out
+        elif count == 0:  # every move leaves the table and loses
+            pending.append((index, LOSS, floors[index - start]))
+        counts[index - start] = count
+    tablebases.close()
+    return start, results.tobytes(), counts.tobytes(), floors.tobytes(), pending
+
+
+# arrays of the table being built that the pool works on: (table, results, solved, counts, floors)
+_shared = None
+
+
+def _init_worker(signature, results, solved, counts, floors):
+    global _shared
+    _shared = (Table(signature), _view(results, 'B'), _view(solved, 'B'), _view(counts, 'B'), _view(floors, 'H'))
+
+
+def _view(raw, typecode):
+    return memoryview(raw).cast('B').cast(typecode)
+
+
+def _unmove_chunk(job):
+    # a step back from part of the positions solved at one distance, all lost or all won: the open positions a move
+    # before a loss are won, those a move before a win have one way less out of losing and are returned by the part
+    # of the table they are in, each part's move counts are only changed by one worker
+    indexes, lost, parts = job
+    table, results, solved, counts, floors = _shared
+    wins = array('I')
+    decrements = [array('I') for _ in range(parts)]
+    for index in array('I', indexes):
+        placement, whiteToMove = table.placement(index)
+        for previous in _unmoves(table, placement, whiteToMove):
+            previousIndex = table.index(previous, not whiteToMove)
+            if solved[previousIndex] or results[previousIndex] == ILLEGAL:
+                continue
+            if lost:  # moving into a lost position wins
+                wins.append(previousIndex)
+            else:
+                decrements[previousIndex * parts // table.size].append(previousIndex)
+    return wins.tobytes(), [part.tobytes() for part in decrements]
+
+
+def _count_chunk(job):
+    # takes the moves into won positions away from one part of the table, returns the positions where every move
+    # now loses with the distance they are lost at
+    indexes, distance = job
+    table, results, solved, counts, floors = _shared
+    losses = []
+    for index in array('I', indexes):
+        counts[index] -= 1
+        if counts[index] == 0:
+            losses.append((index, max(distance + 1, floors[index])))
+    return losses
+
+
+"""
+Builds one table and writes it to the directory, the smaller tables it leads into have to be there already
+both passes are split across the workers: the first over ranges of indexes, the retrograde one distance by distance
+over the positions solved at that distance, each distance finishing before the next one starts
+"""
+
+
+def build_table(signature, directory, workers=None):
+    global _shared
+    table = Table(signature)
+    size = table.size
+    # shared with the workers, the process building the table is the only one that writes results and solved
+    rawResults = multiprocessing.RawArray('B', size)  # zeroed, DRAW
+    rawSolved = multiprocessing.RawArray('B', size)
+    rawCounts = multiprocessing.RawArray('B', size)
+    rawFloors = multiprocessing.RawArray('H', size)
+    results, solved, counts, floors = _view(rawResults, 'B'), _view(rawSolved, 'B'), _view(rawCounts, 'B'), \
+        _view(rawFloors, 'H')
+    plies = array('H', [0]) * size
+    buckets = {}
+    chunk = max(size // 64, 4096)
+    jobs = [(signature, directory, start, min(start + chunk, size)) for start in range(0, size, chunk)]
+    shared = (signature, rawResults, rawSolved, rawCounts, rawFloors)
+    if workers == 1:
+        _init_worker(*shared)
+        pool = None
+        run = map
+        parts = 1
+    else:
+        pool = multiprocessing.Pool(workers, _init_worker, shared)
+        run = pool.imap_unordered
+        parts = (workers or multiprocessing.cpu_count()) * 4  # a few parts per worker to even out their sizes
+    try:
+        for start, chunkResults, chunkCounts, chunkFloors, pending in run(_init_chunk, jobs):
+            end = start + len(chunkResults)
+            results[start:end] = chunkResults
+            counts[start:end] = chunkCounts
+            floors[start:end] = memoryview(chunkFloors).cast('H')
+            for index, result, distance in pending:
+                buckets.setdefault(distance, []).append((index, result))
+        # positions are settled in order of plies to mate so every win is found at its shortest distance and every
+        # loss once its last move is known to lose
+        distance = 0
+        while buckets:
+            wins, losses = array('I'), array('I')
+            for index, result in buckets.pop(distance, []):
+                if solved[index]:
+                    continue
+                solved[index] = 1
+                results[index] = result
+                plies[index] = distance
+                (wins if result == WIN else losses).append(index)
+            step = max(min(len(wins) + len(losses), 65536) // parts, 256)
+            unmoveJobs = [(losses[i:i + step].tobytes(), True, parts) for i in range(0, len(losses), step)] + \
+                [(wins[i:i + step].tobytes(), False, parts) for i in range(0, len(wins), step)]
+            decrements = [[] for _ in range(parts)]
+            for newWins, chunkDecrements in run(_unmove_chunk, unmoveJobs):
+                if len(newWins) > 0:
+                    buckets.setdefault(distance + 1, []).extend((index, WIN) for index in array('I', newWins))
+                for part, indexes in enumerate(chunkDecrements):
+                    decrements[part].append(indexes)
+            countJobs = [(b''.join(indexes), distance) for indexes in decrements]
+            for newLosses in run(_count_chunk, [job for job in countJobs if len(job[0]) > 0]):
+                for index, lossDistance in newLosses:
+                    buckets.setdefault(lossDistance, []).append((index, LOSS))
+            distance += 1
+    finally:
+        if pool is not None:
+            pool.terminate()
+        _shared = None
+    packed = array('H', [0]) * size
+    for index in range(size):
+        result = results[index]
+        if result == ILLEGAL:
+            packed[index] = ILLEGAL << 14
+        elif solved[index]:
+            packed[index] = result << 14 | min(plies[index], MAX_PLIES)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    path = os.path.join(directory, signature + '.tb')
+    with open(path + '.tmp', 'wb') as f:
+        packed.tofile(f)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+"""
+Gets the tables a table leads into through captures and promotions
+"""
+
+
+def dependencies(signature):
+    white, black = parse_signature(signature)
+    found = set()
+    for side, other, isWhite in ((white, black, True), (black, white, False)):
+        for i, piece in enumerate(side):
+            if piece != 'K':  # captured
+                rest = side[:i] + side[i + 1:]
+                found.add(canonical_signature(*((rest, other) if isWhite else (other, rest)))[0])
+            if piece == 'P':  # promoted
+                for promotion in PROMOTIONS:
+                    promoted = side[:i] + promotion + side[i + 1:]
+                    found.add(canonical_signature(*((promoted, other) if isWhite else (other, promoted)))[0])
+    found.discard('KvK')  # bare kings are always a draw and need no table
+    return sorted(found)
+
+
+"""
+Builds the tables for the signatures and every smaller table they need, skipping tables already in the directory
+returns the signatures that were built
+"""
+
+
+def generate(signatures, directory, workers=None, log=None):
+    os.makedirs(directory, exist_ok=True)
+    built = []
+    done = set()
+
+    def build(signature):
+        white, black = parse_signature(signature)
+        signature = canonical_signature(white, black)[0]
+        if signature in done:
+            return
+        done.add(signature)
+        for dependency in dependencies(signature):
+            build(dependency)
+        if not os.path.exists(os.path.join(directory, signature + '.tb')):
+            start = time.time()
+            build_table(signature, directory, workers)
+            built.append(signature)
+            if log is not None:
+                log('%s built in %.1fs' % (signature, time.time() - start))
+
+    for signature in signatures:
+        build(signature)
+    return built
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build and probe endgame tablebases')
+    commands = parser.add_subparsers(dest='command')
+    generateParser = commands.add_parser('generate', help='build tables and the smaller tables they need')
+    generateParser.add_argument('signatures', nargs='+', help='e.g. KQvK KRvK KPvK')
+    generateParser.add_argument('--dir', default='tablebases')
+    generateParser.add_argument('--workers', type=int, help='worker processes (defaults to the number of cores)')
+    probeParser = commands.add_parser('probe', help='look up a position')
+    probeParser.add_argument('--fen', required=True)
+    probeParser.add_argument('--dir', default='tablebases')
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        generate(args.signatures, args.dir, args.workers, log=lambda text: sys.stderr.write(text + '\n'))
+    elif args.command == 'probe':
+        import chess_engine
+        import chess_pgn
+        gs = chess_engine.GameState.from_fen(args.fen)
+        tablebases = Tablebases(args.dir)
+        probed = tablebases.probe(gs)
+        if probed is None:
+            print('not in the tablebases')
+            return 1
+        result, plies = probed
+        print({WIN: 'win', DRAW: 'draw', LOSS: 'loss'}[result] +
+              (' in %d plies' % plies if result in (WIN, LOSS) else ''))
+        best = tablebases.best_move(gs)
+        if best is not None and best[0] is not None:
+            print('best move ' + chess_pgn.move_to_san(gs, best[0]))
+    else:
+        parser.print_help()
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
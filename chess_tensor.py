@@ -0,0 +1,260 @@
+"""
+Batch encoding of positions into NumPy arrays for machine learning pipelines
+every position becomes 12 8x8 piece planes (PIECES order: white pawn to king, then black), the side to move, the
+4 castle rights, a one-hot en passant file and a mask of its legal moves over a fixed index of every move id a
+Move can have; the arrays of a batch are allocated once and each position is written into its row
+large batches are split over a process pool whose workers write straight into the batch in shared memory, so
+nothing but FEN strings goes between processes; needs NumPy, and Python 3.8+ for the process pool
+
+usage: python chess_tensor.py encode positions.fen -o batch.npz [--workers N]
+       python chess_tensor.py bench [--positions 20000] [--workers N]
+"""
+import argparse
+import multiprocessing
+import random
+import sys
+import time
+from array import array
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import chess_engine
+from chess_bitboard import PIECES
+
+PROMOTION_PIECES = chess_engine.Move.promotionPieces
+
+
+def _move_ids():
+    # every start and end square a piece can move between: queen lines and knight jumps, plus the under
+    # promotions, which get their own move ids
+    ids = []
+    for start in range(64):
+        startRow, startCol = divmod(start, 8)
+        for end in range(64):
+            endRow, endCol = divmod(end, 8)
+            dRow, dCol = abs(endRow - startRow), abs(endCol - startCol)
+            if start != end and (dRow == 0 or dCol == 0 or dRow == dCol or {dRow, dCol} == {1, 2}):
+                ids.append(startRow * 1000 + startCol * 100 + endRow * 10 + endCol)
+    for startRow, endRow in ((1, 0), (6, 7)):
+        for startCol in range(8):
+            for endCol in range(max(startCol - 1, 0), min(startCol + 2, 8)):
+                for piece in PROMOTION_PIECES[1:]:
+                    ids.append(10000 * PROMOTION_PIECES.index(piece) + startRow * 1000 + startCol * 100 +
+                               endRow * 10 + endCol)
+    return ids
+
+
+# the fixed move index of the legal move masks: MOVE_IDS[i] is the Move.moveId of mask column i
+MOVE_IDS = np.array(_move_ids(), dtype=np.int32)
+MOVE_INDEX = {int(moveId): i for i, moveId in enumerate(MOVE_IDS)}
+NUM_MOVES = len(MOVE_IDS)
+# arrays of a batch and the shape of one row of each, all are uint8
+FIELDS = (('planes', (12, 8, 8)), ('sideToMove', ()), ('castling', (4,)), ('enPassant', (8,)),
+          ('legalMask', (NUM_MOVES,)))
+CASTLE_BITS = np.array([chess_engine.WKS, chess_engine.WQS, chess_engine.BKS, chess_engine.BQS], dtype=np.uint8)
+POOL_MIN_POSITIONS = 4096  # smaller batches are encoded in this process, starting workers costs more
+CHUNK_SIZE = 1024  # positions per pool job
+
+
+"""
+Gets the mask column of a move
+"""
+
+
+def move_index(move):
+    return MOVE_INDEX[move.moveId]
+
+
+"""
+Preallocated arrays for up to capacity positions, in shared memory if shared is set (or a name is given to attach
+to another process' batch), count is the number of rows filled in
+"""
+
+
+class TensorBatch:
+    def __init__(self, capacity, shared=False, name=None):
+        self.capacity = capacity
+        self.count = 0
+        rowSizes = [int(np.prod(shape)) for field, shape in FIELDS]
+        size = max(capacity * sum(rowSizes), 1)
+        self.memory = None
+        self.owner = name is None
+        if shared or name is not None:
+            self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+            buffer = self.memory.buf
+        else:
+            buffer = np.zeros(size, dtype=np.uint8)
+        offset = 0
+        for (field, shape), rowSize in zip(FIELDS, rowSizes):
+            setattr(self, field, np.ndarray((capacity,) + shape, dtype=np.uint8, buffer=buffer, offset=offset))
+            offset += capacity * rowSize
+
+    @property
+    def name(self):
+        return self.memory.name if self.memory is not None else None
+
+    """
+    Gets the filled in rows of every array by field name, views into the batch so they are only valid until the
+    batch is closed or written again
+    """
+
+    def arrays(self):
+        return {field: getattr(self, field)[:self.count] for field, shape in FIELDS}
+
+    def close(self):
+        # the arrays are views of the shared memory and have to be dropped before it can be closed
+        for field, shape in FIELDS:
+            setattr(self, field, None)
+        if self.memory is not None:
+            self.memory.close()
+            if self.owner:
+                self.memory.unlink()
+            self.memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+"""
+Writes positions (game states or FEN strings) into rows start, start + 1, ... of the batch
+per position only its bitboards, flags and legal move columns are gathered into flat arrays, the planes, one-hot
+features and masks are then filled in for the whole slice by NumPy
+"""
+
+
+def encode_into(batch, start, positions):
+    count = len(positions)
+    if count == 0:
+        return
+    end = start + count
+    bitboards = array('Q')
+    sides = array('B')
+    rights = array('B')
+    epRows = array('q')
+    epFiles = array('q')
+    legal = array('q')
+    moves = []  # reused by every get_valid_moves call
+    for i, position in enumerate(positions):
+        gs = chess_engine.GameState.from_fen(position) if isinstance(position, str) else position
+        pieces = gs.bitboards.pieces
+        bitboards.extend([pieces[piece] for piece in PIECES])
+        sides.append(gs.whiteToMove)
+        rights.append(gs.castleRights)
+        if gs.possibleEnPassant != ():
+            epRows.append(i)
+            epFiles.append(gs.possibleEnPassant[1])
+        checkMate, staleMate = gs.checkMate, gs.staleMate
+        gs.get_valid_moves(moves)
+        gs.checkMate, gs.staleMate = checkMate, staleMate
+        rowStart = i * NUM_MOVES
+        legal.extend([rowStart + MOVE_INDEX[move.moveId] for move in moves])
+    # a bitboard's bit n is square n, read back as little endian bytes bit by bit that is square order
+    bits = np.frombuffer(bitboards, dtype=np.uint64).astype('<u8', copy=False).view(np.uint8)
+    batch.planes[start:end] = np.unpackbits(bits, bitorder='little').reshape(count, 12, 8, 8)
+    batch.sideToMove[start:end] = np.frombuffer(sides, dtype=np.uint8)
+    batch.castling[start:end] = (np.frombuffer(rights, dtype=np.uint8)[:, None] & CASTLE_BITS) != 0
+    batch.enPassant[start:end] = 0
+    batch.enPassant[start:end][np.frombuffer(epRows, dtype=np.int64), np.frombuffer(epFiles, dtype=np.int64)] = 1
+    mask = batch.legalMask[start:end]
+    mask[:] = 0
+    mask.reshape(-1)[np.frombuffer(legal, dtype=np.int64)] = 1
+    batch.count = max(batch.count, end)
+
+
+_batch = None  # the shared batch a pool worker writes into
+
+
+def _init_worker(name, capacity):
+    global _batch
+    _batch = TensorBatch(capacity, name=name)
+
+
+def _encode_chunk(job):
+    start, fens = job
+    encode_into(_batch, start, fens)
+    return len(fens)
+
+
+"""
+Encodes positions (game states or FEN strings) into a batch and returns it, the caller closes it when done
+a batch can be passed in to be reused, it needs room for every position; batches of at least POOL_MIN_POSITIONS
+are encoded by a pool of workers (the number of cores unless given) when the batch is in shared memory, which a
+new batch is whenever a pool will be used
+"""
+
+
+def encode_batch(positions, batch=None, workers=None):
+    count = len(positions)
+    workers = workers if workers is not None else multiprocessing.cpu_count()
+    usePool = workers > 1 and count >= POOL_MIN_POSITIONS
+    if batch is None:
+        batch = TensorBatch(count, shared=usePool)
+    elif count > batch.capacity:
+        raise ValueError('%d positions do not fit in a batch of %d' % (count, batch.capacity))
+    batch.count = 0
+    if not usePool or batch.memory is None:
+        encode_into(batch, 0, positions)
+        return batch
+    jobs = []
+    for start in range(0, count, CHUNK_SIZE):
+        chunk = positions[start:start + CHUNK_SIZE]
+        jobs.append((start, [position if isinstance(position, str) else position.to_fen() for position in chunk]))
+    with multiprocessing.Pool(workers, _init_worker, (batch.name, batch.capacity)) as pool:
+        for _ in pool.imap_unordered(_encode_chunk, jobs):
+            pass
+    batch.count = count
+    return batch
+
+
+def random_positions(count, seed=0, maxPlies=80):
+    # FENs of positions reached by random moves, for benchmarks
+    rng = random.Random(seed)
+    fens = []
+    gs = chess_engine.GameState()
+    while len(fens) < count:
+        moves = gs.get_valid_moves()
+        if len(moves) == 0 or len(gs.moveLog) >= maxPlies:
+            gs = chess_engine.GameState()
+            continue
+        gs.make_move(rng.choice(moves))
+        fens.append(gs.to_fen())
+    return fens
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Encode positions as NumPy arrays')
+    commands = parser.add_subparsers(dest='command')
+    encodeParser = commands.add_parser('encode', help='encode a file with one FEN per line into an .npz file')
+    encodeParser.add_argument('fens')
+    encodeParser.add_argument('-o', '--output', required=True)
+    encodeParser.add_argument('--workers', type=int, help='worker processes (defaults to the number of cores)')
+    benchParser = commands.add_parser('bench', help='positions per second of random positions')
+    benchParser.add_argument('--positions', type=int, default=20000)
+    benchParser.add_argument('--workers', type=int, help='worker processes (defaults to the number of cores)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'encode':
+        with open(args.fens) as f:
+            fens = [line.strip() for line in f if line.strip()]
+        start = time.time()
+        with encode_batch(fens, workers=args.workers) as batch:
+            np.savez_compressed(args.output, moveIds=MOVE_IDS, **batch.arrays())
+        sys.stderr.write('%d positions encoded in %.2fs\n' % (len(fens), time.time() - start))
+    elif args.command == 'bench':
+        fens = random_positions(args.positions)
+        start = time.time()
+        with encode_batch(fens, workers=args.workers):
+            seconds = time.time() - start
+        print('%d positions in %.2fs: %.0f positions/sec' % (len(fens), seconds, len(fens) / seconds))
+    else:
+        parser.print_help()
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
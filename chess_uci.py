@@ -0,0 +1,278 @@
+"""
+UCI (Universal Chess Interface) front end, so external GUIs and match runners can play the engine over stdin/stdout
+commands are read on the main thread and searches run on a second thread, so stop and quit are handled while the
+engine thinks
+a position command that extends the current game only plays the new moves instead of setting up the game again
+the searcher is kept for the whole game, so what it learned about earlier positions helps later searches, and go
+ponder thinks on the opponent's time until ponderhit or stop
+
+usage: python chess_uci.py
+"""
+import sys
+import threading
+
+import chess_ai
+import chess_engine
+
+ENGINE_NAME = 'Chess Game'
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 1024
+# fraction of the remaining clock a move gets when the GUI does not say how many moves are left
+MOVES_TO_GO = 30
+# seconds kept in hand for Python and pipe overhead when moving on a clock
+CLOCK_MARGIN = 0.05
+
+
+"""
+Writes the coordinate form of a move used by UCI, e.g. e2e4 or e7e8q
+"""
+
+
+def move_to_uci(move):
+    return move.get_chess_notation() + (move.promotionPiece.lower() if move.isPawnPromotion else '')
+
+
+"""
+Finds the legal move with the given UCI notation or None, only moves to the end square are generated
+"""
+
+
+def parse_move(gs, text):
+    if len(text) not in (4, 5) or text[0] not in chess_engine.Move.filesToCols or \
+            text[2] not in chess_engine.Move.filesToCols or text[1] not in chess_engine.Move.ranksToRow or \
+            text[3] not in chess_engine.Move.ranksToRow:
+        return None
+    start = (chess_engine.Move.ranksToRow[text[1]], chess_engine.Move.filesToCols[text[0]])
+    endRow, endCol = chess_engine.Move.ranksToRow[text[3]], chess_engine.Move.filesToCols[text[2]]
+    promotion = text[4].upper() if len(text) == 5 else 'Q'
+    for move in gs.get_valid_moves(targets=1 << (endRow * 8 + endCol)):
+        if (move.startRow, move.startCol) == start and (not move.isPawnPromotion or move.promotionPiece == promotion):
+            return move
+    return None
+
+
+"""
+Formats a search score for an info line: centipawns, or moves to mate when a mate was found
+"""
+
+
+def format_score(score):
+    if abs(score) > chess_ai.MATE_BOUND:
+        plies = chess_ai.CHECKMATE - abs(score)
+        return 'mate %d' % ((plies + 1) // 2 if score > 0 else -((plies + 1) // 2))
+    return 'cp %d' % score
+
+
+"""
+Works out the seconds to spend on a move from the go command's clock, None if there is no clock
+"""
+
+
+def move_time(params, whiteToMove):
+    remaining = params.get('wtime' if whiteToMove else 'btime')
+    if remaining is None:
+        return None
+    remaining /= 1000
+    increment = params.get('winc' if whiteToMove else 'binc', 0) / 1000
+    budget = remaining / params.get('movestogo', MOVES_TO_GO) + increment * 0.75
+    return max(min(budget, remaining * 0.8 - CLOCK_MARGIN), 0.01)
+
+
+class UciEngine:
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.outLock = threading.Lock()
+        self.searcher = chess_ai.Searcher(DEFAULT_HASH_MB)
+        self.gs = chess_engine.GameState()
+        self.baseFen = 'startpos'  # where the moves of the current game were played from
+        self.moves = []  # UCI moves played from baseFen
+        self.thread = None
+        self.infinite = False
+        self.limit = None  # limit of the running search, a ponder search waits for ponderhit or stop
+        self.stopEvent = threading.Event()
+
+    def send(self, line):
+        with self.outLock:
+            self.out.write(line + '\n')
+            self.out.flush()
+
+    """
+    Handles one command line, returns False when the engine should quit
+    """
+
+    def handle(self, line):
+        tokens = line.split()
+        if len(tokens) == 0:
+            return True
+        command = tokens[0]
+        if command == 'uci':
+            self.send('id name ' + ENGINE_NAME)
+            self.send('id author the ' + ENGINE_NAME + ' contributors')
+            self.send('option name Hash type spin default %d min 1 max %d' % (DEFAULT_HASH_MB, MAX_HASH_MB))
+            self.send('option name Clear Hash type button')
+            self.send('option name Ponder type check default false')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self.interrupt()
+            self.set_option(tokens)
+        elif command == 'ucinewgame':
+            self.interrupt()
+            self.searcher.clear()
+            self.set_position('startpos', [])
+        elif command == 'position':
+            self.interrupt()
+            self.position(tokens)
+        elif command == 'go':
+            self.interrupt()
+            self.go(tokens)
+        elif command == 'ponderhit':
+            self.ponderhit()
+        elif command == 'stop':
+            self.stop()
+        elif command == 'quit':
+            self.interrupt()
+            return False
+        else:
+            self.send('info string unknown command ' + command)
+        return True
+
+    def set_option(self, tokens):
+        # setoption name <name words> [value <value>]
+        if 'name' not in tokens:
+            return
+        nameEnd = tokens.index('value') if 'value' in tokens else len(tokens)
+        name = ' '.join(tokens[tokens.index('name') + 1:nameEnd]).lower()
+        value = ' '.join(tokens[nameEnd + 1:])
+        if name == 'hash':
+            try:
+                sizeMb = min(max(int(value), 1), MAX_HASH_MB)
+            except ValueError:
+                self.send('info string bad Hash value ' + value)
+                return
+            self.searcher = chess_ai.Searcher(sizeMb)
+        elif name == 'clear hash':
+            self.searcher.tt.clear()
+        elif name == 'ponder':
+            pass  # the GUI only says whether it will send go ponder, nothing to set up for it
+        else:
+            self.send('info string unknown option ' + name)
+
+    def position(self, tokens):
+        # position (startpos | fen <6 fields>) [moves <move> ...]
+        movesAt = tokens.index('moves') if 'moves' in tokens else len(tokens)
+        if len(tokens) > 1 and tokens[1] == 'startpos':
+            baseFen = 'startpos'
+        elif len(tokens) > 2 and tokens[1] == 'fen':
+            baseFen = ' '.join(tokens[2:movesAt])
+        else:
+            self.send('info string bad position command')
+            return
+        self.set_position(baseFen, tokens[movesAt + 1:])
+
+    """
+    Sets up the game from baseFen and the moves played from it, reusing the current game when it is part of the
+    same game: only the new moves are played, or the extra moves undone when the GUI took moves back
+    """
+
+    def set_position(self, baseFen, moves):
+        if baseFen == self.baseFen and moves[:len(self.moves)] == self.moves:
+            newMoves = moves[len(self.moves):]
+        elif baseFen == self.baseFen and self.moves[:len(moves)] == moves:
+            while len(self.moves) > len(moves):
+                self.gs.undo_move()
+                self.moves.pop()
+            newMoves = []
+        else:
+            try:
+                gs = chess_engine.GameState() if baseFen == 'startpos' else chess_engine.GameState.from_fen(baseFen)
+            except ValueError as e:
+                self.send('info string ' + str(e))
+                return
+            self.gs = gs
+            self.baseFen = baseFen
+            self.moves = []
+            newMoves = moves
+        for text in newMoves:
+            move = parse_move(self.gs, text)
+            if move is None:
+                self.send('info string illegal move ' + text)
+                break
+            self.gs.make_move(move)
+            self.moves.append(text)
+
+    def go(self, tokens):
+        params = {}
+        self.infinite = 'infinite' in tokens
+        for i, token in enumerate(tokens[:-1]):
+            if token in ('wtime', 'btime', 'winc', 'binc', 'movestogo', 'depth', 'nodes', 'movetime'):
+                try:
+                    params[token] = int(tokens[i + 1])
+                except ValueError:
+                    self.send('info string bad go value ' + tokens[i + 1])
+        movetime = params['movetime'] / 1000 if 'movetime' in params else move_time(params, self.gs.whiteToMove)
+        # a ponder search gets the time of the move it thinks on, counted from the go ponder
+        self.limit = chess_ai.SearchLimit(depth=params.get('depth'), nodes=params.get('nodes'),
+                                          movetime=None if self.infinite else movetime, ponder='ponder' in tokens)
+        self.stopEvent.clear()
+        # a stop sent before the thread gets to start the search still stops it
+        self.thread = threading.Thread(target=self.run_search, args=(self.limit, self.searcher.stopCount), daemon=True)
+        self.thread.start()
+
+    def run_search(self, limit, stopCount):
+        result = self.searcher.search(self.gs, limit, info=self.send_info, stopCount=stopCount)
+        # go infinite only answers once told to stop and go ponder once told to stop or ponderhit, even if the search
+        # ended by itself
+        if self.infinite:
+            self.stopEvent.wait()
+        while limit.ponder and not self.stopEvent.wait(0.01):  # ponderhit clears the flag
+            pass
+        line = 'bestmove ' + (move_to_uci(result.bestMove) if result.bestMove is not None else '0000')
+        if len(result.pv) > 1:
+            line += ' ponder ' + move_to_uci(result.pv[1])
+        self.send(line)
+
+    def send_info(self, result):
+        self.send('info depth %d score %s nodes %d nps %d time %d pv %s' % (
+            result.depth, format_score(result.score), result.nodes, result.nps, int(result.time * 1000),
+            ' '.join(move_to_uci(move) for move in result.pv)))
+
+    def stop(self):
+        self.searcher.stop()
+        self.stopEvent.set()
+
+    """
+    The opponent played the move the engine pondered on, the search goes on as a normal one
+    """
+
+    def ponderhit(self):
+        if self.limit is not None and self.limit.ponder:
+            self.limit.ponder = False  # also covers a search thread that has not started searching yet
+            self.searcher.ponderhit()
+
+    """
+    Stops a running search and waits for its bestmove, the GUI should not change the position while the engine
+    thinks but if it does the search must not keep running on a game state that is being changed
+    """
+
+    def interrupt(self):
+        if self.thread is not None:
+            self.stop()
+            self.thread.join()
+            self.thread = None
+
+
+def main():
+    engine = UciEngine()
+    readline = sys.stdin.readline
+    while True:
+        line = readline()
+        if not line or not engine.handle(line):
+            break
+    engine.interrupt()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
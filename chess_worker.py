@@ -0,0 +1,157 @@
+"""
+Background worker that generates legal moves and engine replies off the render loop
+jobs work on a snapshot of the game state and results are handed to a post callback from the worker thread,
+so the caller decides how they get back to its own thread (chess_main posts them as pygame events)
+pondering searches the position after the opponent's expected reply while the opponent thinks, ponderhit turns it
+into the engine's search for that position when the reply is played
+with a chess_cache.PositionCache, positions it already has are answered at once without queueing a job and what
+the worker works out is added to it
+"""
+import queue
+import threading
+
+import chess_ai
+
+
+class MoveWorker:
+    def __init__(self, post, searcher=None, book=None, cache=None):
+        # post(kind, epoch, result) is called from the worker thread, kind is 'moves' or 'engine', and from the
+        # calling thread for results found in the cache
+        self.post = post
+        self.searcher = searcher if searcher is not None else chess_ai.Searcher()
+        self.book = book  # chess_book.OpeningBook the engine plays from while the position is in it
+        self.cache = cache
+        self.jobs = queue.Queue()
+        # results from before the last cancel belong to a position that is gone and are dropped
+        self.epoch = 0
+        self.lock = threading.Lock()
+        self.ponderLimit = None  # limit of the latest ponder search, until its ponderhit or cancel
+        self.ponderDone = threading.Event()  # set by ponderhit and cancel, a finished ponder search waits for it
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    """
+    Queues legal move generation for the position, the result holds the moves and the game over flags
+    """
+
+    def request_moves(self, gs):
+        if self.cache is not None:
+            cached = self.cache.get_moves(gs)
+            if cached is not None:
+                moves, checkMate, staleMate = cached
+                return self.post_cached('moves', {'moves': moves, 'checkMate': checkMate, 'staleMate': staleMate})
+        return self.submit('moves', gs, None)
+
+    """
+    Queues an engine search for the position, the result holds the chess_ai.SearchResult
+    """
+
+    def request_engine_move(self, gs, limit):
+        if self.cache is not None:
+            cached = self.cache.get_engine(gs, limit)
+            if cached is not None:
+                return self.post_cached('engine', {'result': cached})
+        return self.submit('engine', gs, limit)
+
+    def post_cached(self, kind, result):
+        with self.lock:
+            epoch = self.epoch
+        self.post(kind, epoch, result)
+        return epoch
+
+    """
+    Queues a ponder search of the position after the expected move, the limit is what the engine gets to move in
+    that position; its result is posted like an engine move once ponderhit is called, and dropped on a cancel
+    """
+
+    def request_ponder(self, gs, move, limit):
+        gs = gs.copy()
+        gs.make_move(move)
+        with self.lock:
+            self.ponderLimit = chess_ai.SearchLimit(limit.depth, limit.nodes, limit.movetime, ponder=True)
+            self.ponderDone.clear()
+            limit = self.ponderLimit
+        return self.submit('engine', gs, limit)
+
+    """
+    The expected move was played: the ponder search goes on as the engine's search, with its time counted from now
+    """
+
+    def ponderhit(self):
+        with self.lock:
+            if self.ponderLimit is None:
+                return
+            # the flag of the limit covers a ponder search still waiting in the queue
+            self.ponderLimit.ponder = False
+            self.ponderLimit = None
+            self.searcher.ponderhit()
+            self.ponderDone.set()
+
+    """
+    Queues forgetting what the engine learned in earlier searches, e.g. when a new game is started
+    """
+
+    def clear_search(self):
+        self.submit('clear', None, None)
+
+    def submit(self, kind, gs, limit):
+        with self.lock:
+            epoch = self.epoch
+            # a cancel between the job being taken off the queue and its search starting still stops the search
+            stopCount = self.searcher.stopCount
+        self.jobs.put((kind, epoch, gs.copy() if gs is not None else None, limit, stopCount))
+        return epoch
+
+    """
+    Drops every queued and running job, e.g. when the position is undone or reset
+    """
+
+    def cancel(self):
+        with self.lock:
+            self.epoch += 1
+            self.ponderLimit = None
+            self.ponderDone.set()
+            # under the lock so a job submitted after the cancel never takes the stopCount from before it
+            self.searcher.stop()
+
+    """
+    Checks if a result was computed for the current position
+    """
+
+    def is_current(self, epoch):
+        return epoch == self.epoch
+
+    """
+    Stops the worker thread, waiting for a running search to stop so the searcher can be closed after it
+    """
+
+    def shutdown(self):
+        self.cancel()
+        self.jobs.put(None)
+        self.thread.join()
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            kind, epoch, gs, limit, stopCount = job
+            if kind == 'clear':  # runs even if cancelled, the cancel that came with it must not undo it
+                self.searcher.clear()
+                continue
+            if not self.is_current(epoch):  # cancelled while it was waiting in the queue
+                continue
+            if kind == 'moves':
+                moves = gs.get_valid_moves()
+                result = {'moves': moves, 'checkMate': gs.checkMate, 'staleMate': gs.staleMate}
+                if self.cache is not None:
+                    self.cache.put_moves(gs, moves, gs.checkMate, gs.staleMate)
+            else:
+                result = {'result': chess_ai.find_best_move(gs, limit, self.searcher, self.book, stopCount)}
+                if limit.ponder and self.is_current(epoch):  # it ended before the expected move came, e.g. on a mate
+                    self.ponderDone.wait()
+                # a cancelled search was cut short, only a search that ran to its limit is kept
+                if self.cache is not None and self.is_current(epoch):
+                    self.cache.put_engine(gs, result['result'], limit)
+            if self.is_current(epoch):
+                self.post(kind, epoch, result)
@@ -0,0 +1,62 @@
+"""
+Zobrist keys used to hash chess positions into 64 bit ints
+a position's key is the xor of the keys of every piece on its square, the castle rights, the en passant file
+and the side to move, so a move only has to xor in what it changes
+"""
+import random
+
+from chess_bitboard import squares
+
+# fixed seed so keys (and anything stored by key) are the same on every run
+_rng = random.Random(0x5EED)
+
+PIECE_KEYS = {}
+for _piece in ('wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK'):
+    PIECE_KEYS[_piece] = [_rng.getrandbits(64) for _ in range(64)]
+# one key for each of the 16 combinations of castle rights, indexed by the 4 castle right bits
+CASTLE_KEYS = [_rng.getrandbits(64) for _ in range(16)]
+EN_PASSANT_KEYS = [_rng.getrandbits(64) for _ in range(8)]  # indexed by the file of the en passant square
+SIDE_KEY = _rng.getrandbits(64)  # xored in when black is to move
+
+"""
+Packs castle rights into 4 bits (white king side, white queen side, black king side, black queen side)
+"""
+
+
+def castle_index(castleRights):
+    return castleRights.wks | castleRights.wqs << 1 | castleRights.bks << 2 | castleRights.bqs << 3
+
+
+"""
+Computes the key of a game state from scratch
+"""
+
+
+def compute_key(gs):
+    key = 0
+    for row in range(8):
+        for col in range(8):
+            piece = gs.board[row][col]
+            if piece != '--':
+                key ^= PIECE_KEYS[piece][row * 8 + col]
+    key ^= CASTLE_KEYS[gs.castleRights]
+    if gs.possibleEnPassant != ():
+        key ^= EN_PASSANT_KEYS[gs.possibleEnPassant[1]]
+    if not gs.whiteToMove:
+        key ^= SIDE_KEY
+    return key
+
+
+"""
+Computes the pawn-only key from the pawn bitboards, the xor of the keys of every pawn on its square
+used to look up cached pawn structure scores
+"""
+
+
+def pawn_key(whitePawns, blackPawns):
+    key = 0
+    for sq in squares(whitePawns):
+        key ^= PIECE_KEYS['wP'][sq]
+    for sq in squares(blackPawns):
+        key ^= PIECE_KEYS['bP'][sq]
+    return key
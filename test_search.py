@@ -0,0 +1,63 @@
+"""
+Checks of the computer player's search: it keeps to its movetime and scores repetitions and the fifty-move rule
+as draws below the root
+
+usage: python -m unittest test_search
+"""
+import time
+import unittest
+
+import chess_ai
+import chess_engine
+
+# a busy position where even the first depths take long, so the search is cut off by the clock
+KIWIPETE = 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'
+
+
+def play(gs, names):
+    # plays moves given by their notation, e.g. 'g1f3'
+    for name in names:
+        move = next(move for move in gs.get_valid_moves() if move.get_chess_notation() == name)
+        gs.make_move(move)
+
+
+class SearchTest(unittest.TestCase):
+    def test_movetime_is_kept(self):
+        searcher = chess_ai.Searcher()
+        for movetime in (0.1, 0.2, 0.3):
+            gs = chess_engine.GameState.from_fen(KIWIPETE)
+            start = time.time()
+            result = searcher.search(gs, chess_ai.SearchLimit(movetime=movetime))
+            elapsed = time.time() - start
+            self.assertIsNotNone(result.bestMove)
+            self.assertLess(elapsed, movetime + 0.05)
+
+    def test_repetition_is_a_draw(self):
+        # black is a queen down and can repeat the position it was in two moves ago
+        gs = chess_engine.GameState.from_fen('k7/8/8/8/8/8/8/KQ4n1 b - - 0 1')
+        play(gs, ['g1f3', 'a1a2', 'f3g1', 'a2a1'])
+        result = chess_ai.Searcher().search(gs, chess_ai.SearchLimit(depth=3))
+        self.assertEqual(result.bestMove.get_chess_notation(), 'g1f3')
+        self.assertEqual(result.score, chess_ai.DRAW)
+
+    def test_winning_side_avoids_repetition(self):
+        gs = chess_engine.GameState.from_fen('k7/8/8/8/8/8/8/KQ4n1 b - - 0 1')
+        play(gs, ['g1f3', 'a1a2', 'f3g1'])
+        result = chess_ai.Searcher().search(gs, chess_ai.SearchLimit(depth=3))
+        self.assertNotEqual(result.bestMove.get_chess_notation(), 'a2a1')
+        self.assertGreater(result.score, chess_ai.DRAW)
+
+    def test_fifty_move_rule_is_a_draw(self):
+        gs = chess_engine.GameState.from_fen('k7/8/8/8/8/8/8/KQ4n1 b - - 99 80')
+        result = chess_ai.Searcher().search(gs, chess_ai.SearchLimit(depth=3))
+        self.assertEqual(result.score, chess_ai.DRAW)
+
+    def test_mate_on_the_fiftieth_move_counts(self):
+        gs = chess_engine.GameState.from_fen('k7/8/1K6/8/8/8/8/2Q5 w - - 99 80')
+        result = chess_ai.Searcher().search(gs, chess_ai.SearchLimit(depth=2))
+        self.assertEqual(result.bestMove.get_chess_notation(), 'c1c8')
+        self.assertGreater(result.score, chess_ai.MATE_BOUND)
+
+
+if __name__ == '__main__':
+    unittest.main()